@@ -24,7 +24,7 @@ NETKEY = '\xB9\xA5\x21\xFB\xBD\x72\xC3\x45'
 class HRMListener(event.EventCallback):
     def process(self, msg):
         if isinstance(msg, message.ChannelBroadcastDataMessage):
-            print 'Heart Rate:', ord(msg.payload[-1])
+            print 'Heart Rate:', msg.payload[-1]
 
 # Initialize
 stick = driver.USB2Driver(SERIAL, log=LOG)
@@ -88,7 +88,7 @@ try:
         pack = struct.pack('B' * 9,0,0,0,0,0,0,0,hr_seq,hr)
         payload = pack
         msg.setPayload(payload)
-        #print 'Heart Rate:', ord(msg.payload[-1])
+        #print 'Heart Rate:', msg.payload[-1]
         channel.node.driver.write(msg.encode()) 
         time.sleep(0.1)
 except Exception, e:
@@ -13,6 +13,7 @@ from ant.core import node
 from ant.core import event
 from ant.core import message
 from ant.core.constants import *
+from ant.plus import decoders
 
 from config import *
 
@@ -22,22 +23,14 @@ NETKEY = '\xB9\xA5\x21\xFB\xBD\x72\xC3\x45'
 
 # A run-the-mill event listener
 class HRMListener(event.EventCallback):
+    def __init__(self):
+        self.decoder = decoders.HeartRateDecoder()
+
     def process(self, msg):
         if isinstance(msg, message.ChannelBroadcastDataMessage):
-            print 'Heart Rate:', ord(msg.payload[8])
-            #msg = message.ChannelRequestMessage(message_id=MESSAGE_CHANNEL_ID)
-
-            #channel.node.driver.write(msg.encode()) 
-            #try:
-            #    print len(msg.payload)
-            #    print type(msg.payload)
-            #    test = struct.unpack('BBBBBBBBB',msg.payload)
-           # except Exception, e:
-            #    print e
-            #print test
-            #print 'hi'
-            #for i in range(0,8):
-            #    print ord(msg.payload[i])
+            sample = self.decoder.decode(msg.getRawData())
+            print 'Heart Rate:', sample.heart_rate, \
+                  'R-R interval:', sample.rr_interval
 
 # Initialize
 stick = driver.USB2Driver(SERIAL, log=LOG, debug=DEBUG)
@@ -27,7 +27,8 @@ while (event != None):
     elif event[0] == log.EVENT_WRITE:
         title = 'EVENT_WRITE'
 
-    print '========== [{0}:{1}] =========='.format(title, event[1])
+    print '========== [{0}:{1:.6f}] =========='.format(title,
+                                                 lr.eventTime(event))
     if event[0] == log.EVENT_READ or event[0] == log.EVENT_WRITE:
         length = 8
         line = 0
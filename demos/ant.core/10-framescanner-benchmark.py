@@ -0,0 +1,111 @@
+"""
+Compare the throughput of the old ProcessBuffer loop against FrameScanner
+and the batch decoder.
+
+Pass an ANT-LOG capture to replay its reads, otherwise a 1 MB stream of
+broadcast, burst and extended frames (with some line noise) is generated.
+
+"""
+
+import os
+import sys
+import time
+
+from ant.core import log
+from ant.core import message
+from ant.core.event import FrameScanner, ProcessBuffer
+
+STREAM_SIZE = 1024 * 1024
+
+
+def capturedStream(filename):
+    chunks = []
+    lr = log.LogReader(filename)
+    event = lr.read()
+    while event is not None:
+        if event[0] == log.EVENT_READ:
+            chunks.append(event[2])
+        event = lr.read()
+    return ''.join(chunks)
+
+
+def generatedStream(size):
+    frames = [
+        message.ChannelBroadcastDataMessage(number=0,
+                                            data='\x01' * 8).encode(),
+        message.ChannelBurstDataMessage(number=1, data='\x02' * 8).encode(),
+        message.ChannelEventMessage(number=2).encode(),
+        message.Message(type_=message.MESSAGE_CHANNEL_BROADCAST_DATA,
+                        payload='\x03' * 9 + '\x80\x34\x12\x78\x01').encode(),
+        '\x00\xA4\xFF',  # noise
+    ]
+    chunks = []
+    length = 0
+    i = 0
+    while length < size:
+        frame = frames[i % len(frames)]
+        chunks.append(frame)
+        length += len(frame)
+        i += 1
+    return ''.join(chunks)
+
+
+def benchProcessBuffer(stream, read_size):
+    count = 0
+    buffer_ = ''
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # ProcessBuffer prints every error
+    try:
+        start = time.time()
+        for i in xrange(0, len(stream), read_size):
+            buffer_ += stream[i:i + read_size]
+            buffer_, messages = ProcessBuffer(buffer_)
+            count += len(messages)
+        elapsed = time.time() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return count, elapsed
+
+
+def benchFrameScanner(stream, read_size):
+    count = 0
+    scanner = FrameScanner()
+    decoder = message.Message()
+    start = time.time()
+    for i in xrange(0, len(stream), read_size):
+        scanner.feed(stream[i:i + read_size])
+        for frame in scanner:
+            try:
+                decoder.getHandler(frame)
+                count += 1
+            except message.MessageError:
+                pass
+    return count, time.time() - start
+
+
+def benchDecodeBatch(stream, read_size):
+    count = 0
+    buffer_ = bytearray()
+    start = time.time()
+    for i in xrange(0, len(stream), read_size):
+        buffer_ += stream[i:i + read_size]
+        records, consumed = message.decodeBatch(buffer_)
+        del buffer_[:consumed]
+        count += len(records)
+    return count, time.time() - start
+
+
+if len(sys.argv) > 1:
+    stream = capturedStream(sys.argv[1])
+else:
+    stream = generatedStream(STREAM_SIZE)
+
+print 'Stream size: %d bytes' % len(stream)
+for read_size in (20, 64, 4096, 65536):
+    for name, bench in (('ProcessBuffer', benchProcessBuffer),
+                        ('FrameScanner', benchFrameScanner),
+                        ('decodeBatch', benchDecodeBatch)):
+        count, elapsed = bench(stream, read_size)
+        print '%-14s read=%-6d %6d msgs %7.3f s %9.0f msgs/s' % \
+              (name, read_size, count, elapsed, count / elapsed)
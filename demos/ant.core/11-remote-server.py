@@ -0,0 +1,31 @@
+"""
+Share the stick with remote clients (see demo-12) over TCP, replacing the
+Pyro NodeProxy of ant-server.py.
+
+"""
+
+import time
+
+from ant.core import driver
+from ant.remote.server import Server
+
+from config import *
+
+ADDRESS = ('0.0.0.0', 8040)
+
+# Initialize
+stick = driver.USB2Driver(SERIAL, log=LOG, debug=DEBUG)
+server = Server(stick, ADDRESS)
+server.start()
+print 'Serving the stick on %s:%d' % server.address
+
+try:
+    while True:
+        time.sleep(10)
+        print 'Clients: %(clients)d, dropped packets: %(dropped)d' % \
+              server.getStats()
+except KeyboardInterrupt:
+    pass
+
+# Shutdown
+server.stop()
@@ -0,0 +1,44 @@
+"""
+Burst transmit through the stick shared by demo-11, using a plain Node on
+top of a RemoteDriver.
+
+"""
+
+import sys
+
+from ant.core import node
+from ant.core.constants import *
+from ant.remote.client import RemoteDriver
+
+from config import *
+
+NETKEY = '\xB9\xA5\x21\xFB\xBD\x72\xC3\x45'
+HOST = sys.argv[1] if len(sys.argv) > 1 else 'localhost'
+
+# Initialize; the server drops the reset, the stick is not ours alone
+remote = RemoteDriver((HOST, 8040), log=LOG, debug=DEBUG)
+antnode = node.Node(remote)
+antnode.start()
+
+# Setup channel
+key = node.NetworkKey('N:ANT+', NETKEY)
+antnode.setNetworkKey(0, key)
+channel = antnode.getFreeChannel()
+remote.subscribe([channel.number])
+channel.name = 'C:BURST'
+channel.assign('N:ANT+', CHANNEL_TYPE_TWOWAY_TRANSMIT)
+channel.setID(0x78, 0x1234, 1)
+channel.setPeriod(8070)
+channel.setFrequency(57)
+channel.open()
+
+data = ''.join(chr(i % 256) for i in range(4096))
+for i in range(10):
+    stats = channel.burstSend(data, timeout=10)
+    print 'Sent %d bytes in %.3f s, %.0f B/s (%d retries)' % \
+          (stats.size, stats.elapsed, stats.throughput, stats.retries)
+
+# Shutdown
+channel.close()
+channel.unassign()
+antnode.stop(reset=False)
@@ -35,7 +35,7 @@ class HRMListener(event.EventCallback):
         #print len(msg.getPayload())
         #print msg
         if isinstance(msg, message.ChannelBroadcastDataMessage):
-            print 'Heart Rate:', ord(msg.payload[8])
+            print 'Heart Rate:', msg.payload[8]
             #msg = message.ChannelRequestMessage(message_id=MESSAGE_CHANNEL_ID)
 
             #channel.node.driver.write(msg.encode()) 
@@ -34,7 +34,7 @@ class HRMListener(event.EventCallback):
     def process(self, msg):
         #print msg
         if isinstance(msg, message.ChannelBroadcastDataMessage):
-            print 'Heart Rate:', ord(msg.payload[8])
+            print 'Heart Rate:', msg.payload[8]
             #msg = message.ChannelRequestMessage(message_id=MESSAGE_CHANNEL_ID)
 
             #channel.node.driver.write(msg.encode()) 
@@ -35,7 +35,7 @@ def exit():
 class HRMListener(event.EventCallback):
     def process(self, msg):
         if isinstance(msg, message.ChannelBroadcastDataMessage):
-            print 'Heart Rate:', ord(msg.payload[-1])
+            print 'Heart Rate:', msg.payload[-1]
 
 # Initialize
 #stick = driver.USB2Driver(SERIAL, log=LOG)
@@ -74,44 +74,6 @@ hr = 50
 hr_change = 2
 hr_seq = 0
 
-class BurstSequence(object):
-
-    INIT_VAL = 0b00
-    MAX_VAL = 0b011
-    WRAP_VAL = 0b001
-    FINISH_VAL = 0b110
-    MAX_CHANNEL = 0b11111
-
-    
-    def __init__(self):
-        self.current_val = BurstSequence.INIT_VAL    
-    
-    def next(self):
-        rtn = self.current_val
-        if self.current_val == BurstSequence.MAX_VAL:
-            self.current_val = BurstSequence.INIT_VAL
-        elif self.current_val > BurstSequence.FINISH_VAL:
-            raise ValueError('Value out of bounds. Who has been messing with my internals?')
-        elif self.current_val == BurstSequence.FINISH_VAL:
-            pass
-        else:
-            self.current_val += 1
-        return rtn
-    
-    def finish(self):
-        self.current_val = BurstSequence.FINISH_VAL
-    
-    def reset(self):
-        self.current_val = INIT_VAL
-
-    def combine(self,channel_no):
-        if channel_no > BurstSequence.MAX_CHANNEL:
-            raise ValueError('Channel number limited to 5 bits (value too large)')
-        elif channel_no < 0:
-            raise ValueError('Channel number cannot be subzero (value too small)')    
-        return channel_no | (self.next() << 5)
-
-    
 try:
     while True:
         msg = message.ChannelBurstDataMessage()
@@ -119,7 +81,7 @@ try:
         channel_no = 0
         #seq = 0b110
         #first = channel_no | (seq << 5)
-        b = BurstSequence()
+        b = message.BurstSequence()
         for i in range(0,10):
 
             hr_seq = hr_seq + 1;
@@ -132,14 +94,14 @@ try:
             pack = struct.pack('B' * 9,b.combine(channel_no),1,0,3,4,5,6,hr_seq,hr)
             payload = pack
             msg.setPayload(payload)
-            #print 'Heart Rate:', ord(msg.payload[-1])
+            #print 'Heart Rate:', msg.payload[-1]
             driver = antnode.getDriver()
             driver.write(msg.encode())
         b.finish()
         pack = struct.pack('B' * 9,b.combine(channel_no),1,0,3,4,5,6,hr_seq,hr)
         payload = pack
         msg.setPayload(payload)
-        #print 'Heart Rate:', ord(msg.payload[-1])
+        #print 'Heart Rate:', msg.payload[-1]
         driver = antnode.getDriver()
         driver.write(msg.encode())  
         
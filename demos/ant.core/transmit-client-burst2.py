@@ -35,7 +35,7 @@ def exit():
 class HRMListener(event.EventCallback):
     def process(self, msg):
         if isinstance(msg, message.ChannelBroadcastDataMessage):
-            print 'Heart Rate:', ord(msg.payload[-1])
+            print 'Heart Rate:', msg.payload[-1]
 
 # Initialize
 #stick = driver.USB2Driver(SERIAL, log=LOG)
@@ -71,29 +71,14 @@ atexit.register(exit)
 #time.sleep(120)
 
 
-msg_list = []
-counter = 0
-
-for i in range(0,3):
-    msg = message.ChannelBurstDataMessage()
-    data = msg.getRawData()
-    unpacked_data = struct.unpack('B'*8,data)
-    new_data = list()
-    for i,item in enumerate(unpacked_data):
-        new_data.append(counter)
-        counter += 1
-    args = ['B'*8]
-    args.extend(new_data)
-    new_packed = struct.pack(*args)
-    msg.setRawData(new_packed)
-    msg_list.append(msg)
-
-    
+data = ''.join(chr(i) for i in range(24))
+
 try:
     while True:
-        msg = message.ChannelBurstDataMessage()
-        channel.sendBurst(msg_list)
-        
+        stats = channel.burstSend(data, timeout=5)
+        print 'Sent %d bytes in %.3f s (%d retries)' % \
+              (stats.size, stats.elapsed, stats.retries)
+
         #print first
         #print type(payload)
         #print ord(payload[0])
@@ -35,7 +35,7 @@ def exit():
 class HRMListener(event.EventCallback):
     def process(self, msg):
         if isinstance(msg, message.ChannelBroadcastDataMessage):
-            print 'Heart Rate:', ord(msg.payload[-1])
+            print 'Heart Rate:', msg.payload[-1]
 
 # Initialize
 #stick = driver.USB2Driver(SERIAL, log=LOG)
@@ -117,7 +117,7 @@ try:
         msg.setDeviceNumber(1234)
         print msg.getDeviceNumber()
         #print msg.getDeviceType()
-        #print 'Heart Rate:', ord(msg.payload[-1])
+        #print 'Heart Rate:', msg.payload[-1]
         channel.send(msg)
         #driver = antnode.getDriver()
         #driver.write(msg.encode()) 
@@ -35,7 +35,7 @@ def exit():
 class HRMListener(event.EventCallback):
     def process(self, msg):
         if isinstance(msg, message.ChannelBroadcastDataMessage):
-            print 'Heart Rate:', ord(msg.payload[-1])
+            print 'Heart Rate:', msg.payload[-1]
 
 # Initialize
 #stick = driver.USB2Driver(SERIAL, log=LOG)
@@ -165,7 +165,7 @@ try:
         payload = pack
         msg.setRawData(payload)
         print len(msg.getPayload())
-        #print 'Heart Rate:', ord(msg.payload[-1])
+        #print 'Heart Rate:', msg.payload[-1]
         driver = antnode.getDriver()
         driver.write(msg.encode()) 
         time.sleep(0.1)
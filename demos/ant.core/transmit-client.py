@@ -35,7 +35,7 @@ def exit():
 class HRMListener(event.EventCallback):
     def process(self, msg):
         if isinstance(msg, message.ChannelBroadcastDataMessage):
-            print 'Heart Rate:', ord(msg.payload[-1])
+            print 'Heart Rate:', msg.payload[-1]
 
 # Initialize
 #stick = driver.USB2Driver(SERIAL, log=LOG)
@@ -109,7 +109,7 @@ try:
         pack = struct.pack('B' * 9,channel.getNumber(),0,0,0,0,0,0,hr_seq,hr)
         payload = pack
         msg.setPayload(payload)
-        #print 'Heart Rate:', ord(msg.payload[-1])
+        #print 'Heart Rate:', msg.payload[-1]
         #driver = antnode.getDriver()
         #driver.write(msg.encode()) 
         channel.send(msg)
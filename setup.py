@@ -61,4 +61,10 @@ setup(
         'pyusb',
         'msgpack-python'
     ],
+    extras_require={
+        # ant.aio: trollius, the Python 2 port of asyncio
+        'aio': ['trollius'],
+        # ant.core.columnar
+        'columnar': ['numpy'],
+    },
 )
@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+"""
+asyncio flavour of ant.core.node.
+
+Runs on trollius, the Python 2 port of asyncio. Every request returns a
+Future to yield from in a coroutine (`yield From(channel.open())`), use
+asyncio.wait_for() for timeouts. Channel messages are read one at a time
+from channel.messages() with `msg = yield From(stream.get())`.
+"""
+
+import collections
+import uuid
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from ant.core.constants import *
+from ant.core.exceptions import *
+from ant.core import message
+from ant.core.event import FrameScanner, ackKey, MAX_MSG_QUEUE
+from ant.core.node import NetworkKey
+from ant.aio.transport import SerialTransport, DriverTransport
+
+class StopAsyncIteration(Exception):
+    """Raised by MessageStream.get() once the stream is closed."""
+    pass
+
+
+def chainFuture(future, callback, loop):
+    """
+    Return a Future for callback(future.result()). If callback returns a
+    Future itself, the returned one completes with it.
+    """
+    chained = asyncio.Future(loop=loop)
+
+    def copy(source):
+        if chained.done():
+            return
+        if source.cancelled():
+            chained.cancel()
+        elif source.exception() is not None:
+            chained.set_exception(source.exception())
+        else:
+            chained.set_result(source.result())
+
+    def done(future):
+        if future.cancelled() or future.exception() is not None:
+            copy(future)
+            return
+        try:
+            result = callback(future.result())
+        except Exception, e:
+            if not chained.done():
+                chained.set_exception(e)
+            return
+        if isinstance(result, asyncio.Future):
+            result.add_done_callback(copy)
+        elif not chained.done():
+            chained.set_result(result)
+
+    future.add_done_callback(done)
+    return chained
+
+
+def gatherFutures(futures, loop):
+    """Future for the list of results, failing with the first failure."""
+    if futures:
+        return asyncio.gather(*futures)
+    gathered = asyncio.Future(loop=loop)
+    gathered.set_result([])
+    return gathered
+
+
+class MessageStream(object):
+    """Bounded queue of messages, read with get()."""
+    def __init__(self, loop, maxlen=MAX_MSG_QUEUE):
+        self.loop = loop
+        self.queue = collections.deque(maxlen=maxlen)
+        self.dropped = 0
+        self.closed = False
+        self.waiter = None
+
+    def put(self, msg):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(msg)
+            self.waiter = None
+            return
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(msg)
+
+    def get(self):
+        future = asyncio.Future(loop=self.loop)
+        if self.queue:
+            future.set_result(self.queue.popleft())
+        elif self.closed:
+            future.set_exception(StopAsyncIteration())
+        else:
+            self.waiter = future
+        return future
+
+    def close(self):
+        self.closed = True
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_exception(StopAsyncIteration())
+        self.waiter = None
+
+
+class AsyncChannel(object):
+    def __init__(self, node, number=0x00):
+        self.node = node
+        self.is_free = True
+        self.name = str(uuid.uuid4())
+        self.number = number
+        self.cb = []
+        self.streams = []
+
+    def assign(self, net_key, ch_type):
+        msg = message.ChannelAssignMessage(number=self.number)
+        msg.setNetworkNumber(self.node.getNetworkKey(net_key).number)
+        msg.setChannelType(ch_type)
+        return self._request(msg, 'Could not assign channel.',
+                             lambda: setattr(self, 'is_free', False))
+
+    def setID(self, dev_type, dev_num, trans_type):
+        msg = message.ChannelIDMessage(number=self.number)
+        msg.setDeviceType(dev_type)
+        msg.setDeviceNumber(dev_num)
+        msg.setTransmissionType(trans_type)
+        return self._request(msg, 'Could not set channel ID.')
+
+    def setSearchTimeout(self, search_timeout):
+        msg = message.ChannelSearchTimeoutMessage(number=self.number)
+        msg.setTimeout(search_timeout)
+        return self._request(msg, 'Could not set channel search timeout.')
+
+    def setPeriod(self, counts):
+        msg = message.ChannelPeriodMessage(number=self.number)
+        msg.setChannelPeriod(counts)
+        return self._request(msg, 'Could not set channel period.')
+
+    def setFrequency(self, frequency):
+        msg = message.ChannelFrequencyMessage(number=self.number)
+        msg.setFrequency(frequency)
+        return self._request(msg, 'Could not set channel frequency.')
+
+    def configure(self, net_key, ch_type, dev_type, dev_num, trans_type,
+                  period, frequency, search_timeout=None):
+        """Pipelined assign and configuration, see Channel.configure()."""
+        futures = [self.assign(net_key, ch_type),
+                   self.setID(dev_type, dev_num, trans_type)]
+        if search_timeout is not None:
+            futures.append(self.setSearchTimeout(search_timeout))
+        futures.append(self.setPeriod(period))
+        futures.append(self.setFrequency(frequency))
+        return chainFuture(gatherFutures(futures, self.node.loop),
+                           lambda results: None, self.node.loop)
+
+    def getNumber(self):
+        return self.number
+
+    def open(self):
+        msg = message.ChannelOpenMessage(number=self.number)
+        return self._request(msg, 'Could not open channel.')
+
+    def close(self):
+        """Complete once the channel has reported EVENT_CHANNEL_CLOSED."""
+        closed = self.node.expectEvent(self.number, EVENT_CHANNEL_CLOSED)
+        msg = message.ChannelCloseMessage(number=self.number)
+        request = self._request(msg, 'Could not close channel.')
+
+        def requestDone(request):
+            if request.cancelled() or request.exception() is not None:
+                closed.cancel()
+        request.add_done_callback(requestDone)
+        return chainFuture(request, lambda result: closed, self.node.loop)
+
+    def unassign(self):
+        msg = message.ChannelUnassignMessage(number=self.number)
+        return self._request(msg, 'Could not unassign channel.',
+                             lambda: setattr(self, 'is_free', True))
+
+    def registerCallback(self, callback):
+        if callback not in self.cb:
+            self.cb.append(callback)
+
+    def messages(self, maxlen=MAX_MSG_QUEUE):
+        """Stream of this channel's messages, from now on."""
+        stream = MessageStream(self.node.loop, maxlen)
+        self.streams.append(stream)
+        return stream
+
+    def send(self, msg):
+        if not isinstance(msg, message.ChannelMessage):
+            raise ChannelError('Could not send message (non ChannelMessage)')
+        msg.setChannelNumber(self.getNumber())
+        self.node.send(msg)
+
+    def process(self, msg):
+        for callback in self.cb:
+            try:
+                callback.process(msg)
+            except:
+                pass  # Who cares?
+        for stream in self.streams:
+            stream.put(msg)
+
+    def _request(self, msg, error, success=None):
+        def check(code):
+            if code != RESPONSE_NO_ERROR:
+                raise ChannelError(error)
+            if success is not None:
+                success()
+        return chainFuture(self.node.request(msg), check, self.node.loop)
+
+
+class AsyncNode(asyncio.Protocol):
+    """
+    An ANT node driven by an asyncio event loop. Attach a stick with
+    openSerial() or openDriver(), then start() it.
+    """
+    def __init__(self, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.transport = None
+        self.scanner = FrameScanner()
+        self.decoder = message.Message()
+        self.callbacks = []
+        self.routes = [None] * 256  # channel number -> AsyncChannel
+        self.ack_futures = {}  # (channel, message ID) -> deque of Futures
+        self.event_futures = {}  # (channel, event code) -> deque of Futures
+        self.msg_futures = {}  # message class -> deque of Futures
+        self.networks = []
+        self.channels = []
+        self.options = [0x00, 0x00, 0x00]
+        self.running = False
+
+    # The transports report connection_made() on the next loop iteration;
+    # take them right away so start() can follow without waiting for it.
+    def openSerial(self, device, baud_rate=115200):
+        """Attach a USB1 (serial bridge) stick, watched by the loop."""
+        self.transport = SerialTransport(self.loop, self, device, baud_rate)
+        return self.transport
+
+    def openDriver(self, driver):
+        """Attach any ant.core.driver.Driver, read on its own thread."""
+        self.transport = DriverTransport(self.loop, self, driver)
+        return self.transport
+
+    def start(self, reset_delay=1):
+        if self.running:
+            raise NodeError('Could not start ANT node (already started).')
+        self.running = True
+        self.reset()
+        reset = asyncio.Future(loop=self.loop)
+        self.loop.call_later(reset_delay, reset.set_result, None)
+        return chainFuture(reset, lambda result: self.init(), self.loop)
+
+    def stop(self, reset=True):
+        if not self.running:
+            raise NodeError('Could not stop ANT node (not started).')
+        if reset:
+            self.reset()
+        self.running = False
+        self.transport.close()
+
+    def reset(self):
+        self.send(message.SystemResetMessage())
+
+    def init(self):
+        msg = message.ChannelRequestMessage()
+        msg.setMessageID(MESSAGE_CAPABILITIES)
+        caps = self.waitForMessage(message.CapabilitiesMessage)
+        self.send(msg)
+
+        def gotCapabilities(caps):
+            self.networks = [NetworkKey() for i in range(caps.getMaxNetworks())]
+            self.channels = [AsyncChannel(self, i)
+                             for i in range(caps.getMaxChannels())]
+            self.routes[:len(self.channels)] = self.channels
+            self.options = (caps.getStdOptions(),
+                            caps.getAdvOptions(),
+                            caps.getAdvOptions2(),)
+            return gatherFutures([self.setNetworkKey(i)
+                                  for i in range(len(self.networks))],
+                                 self.loop)
+        return chainFuture(caps, gotCapabilities, self.loop)
+
+    def getCapabilities(self):
+        return (len(self.channels),
+                len(self.networks),
+                self.options,)
+
+    def setNetworkKey(self, number, key=None):
+        if key:
+            self.networks[number] = key
+
+        msg = message.NetworkKeyMessage()
+        msg.setNumber(number)
+        msg.setKey(self.networks[number].key)
+
+        def check(code):
+            if code != RESPONSE_NO_ERROR:
+                raise NodeError('Could not set network key.')
+            self.networks[number].number = number
+        return chainFuture(self.request(msg), check, self.loop)
+
+    def getNetworkKey(self, name):
+        for netkey in self.networks:
+            if netkey.name == name:
+                return netkey
+        raise NodeError('Could not find network key with the supplied name.')
+
+    def getFreeChannel(self):
+        for channel in self.channels:
+            if channel.is_free:
+                return channel
+        raise NodeError('Could not find free channel.')
+
+    def registerEventListener(self, callback):
+        if callback not in self.callbacks:
+            self.callbacks.append(callback)
+
+    def send(self, msg):
+        if self.transport is None:
+            raise NodeError('Could not send message (no transport).')
+        self.transport.write(msg.encode())
+
+    def request(self, msg):
+        """Write msg and return a Future for its response code."""
+        future = self._expect(self.ack_futures, ackKey(msg))
+        self.send(msg)
+        return future
+
+    def expectEvent(self, number, code):
+        """Future for the next channel event with the given code."""
+        return self._expect(self.event_futures, (number, code))
+
+    def waitForMessage(self, class_):
+        """Future for the next message that is an instance of class_."""
+        return self._expect(self.msg_futures, class_)
+
+    def _expect(self, futures, key):
+        future = asyncio.Future(loop=self.loop)
+        pending = futures.get(key)
+        if pending is None:
+            pending = futures[key] = collections.deque()
+        pending.append(future)
+        return future
+
+    def _resolve(self, futures, key, result):
+        pending = futures.get(key)
+        while pending:
+            future = pending.popleft()
+            if not future.done():
+                future.set_result(result)
+                return True
+        return False
+
+    # asyncio.Protocol
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.scanner.feed(data)
+        for frame in self.scanner:
+            try:
+                msg = self.decoder.getHandler(frame)
+            except MessageError, e:
+                print e
+                continue
+            self.process(msg)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.running = False
+        if exc is None:
+            exc = NodeError('Connection to ANT node lost.')
+        for futures in (self.ack_futures, self.event_futures,
+                        self.msg_futures):
+            for pending in futures.itervalues():
+                for future in pending:
+                    if not future.done():
+                        future.set_exception(exc)
+            futures.clear()
+        for channel in self.channels:
+            for stream in channel.streams:
+                stream.close()
+
+    def process(self, msg):
+        if isinstance(msg, message.ChannelEventMessage):
+            if msg.getMessageID() == MESSAGE_RF_EVENT:
+                self._resolve(self.event_futures,
+                              (msg.getChannelNumber(), msg.getMessageCode()),
+                              msg)
+            else:
+                self._resolve(self.ack_futures, ackKey(msg),
+                              msg.getMessageCode())
+
+        for class_ in type(msg).__mro__:
+            if class_ in self.msg_futures:
+                self._resolve(self.msg_futures, class_, msg)
+
+        for callback in self.callbacks:
+            try:
+                callback.process(msg)
+            except Exception, e:
+                print e
+
+        if isinstance(msg, message.ChannelMessage):
+            channel = self.routes[msg.getChannelNumber()]
+            if channel is not None:
+                channel.process(msg)
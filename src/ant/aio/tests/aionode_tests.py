@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import unittest
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from ant.aio.node import *
+from ant.core.message import *
+
+
+class FakeTransport(asyncio.Transport):
+    """Answers every command like an ANT stick would, on the loop."""
+    def __init__(self, node):
+        asyncio.Transport.__init__(self)
+        self.node = node
+        self.written = []
+        node.connection_made(self)
+
+    def reply(self, msg):
+        self.node.loop.call_soon(self.node.data_received, msg.encode())
+
+    def write(self, data):
+        msg = Message().getHandler(data)
+        self.written.append(msg)
+        if isinstance(msg, ChannelRequestMessage):
+            self.reply(CapabilitiesMessage(max_channels=4, max_nets=2))
+        elif not isinstance(msg, SystemResetMessage):
+            number = msg.payload[0]
+            self.reply(ChannelEventMessage(number=number,
+                                           message_id=msg.getType()))
+            if isinstance(msg, ChannelCloseMessage):
+                self.reply(ChannelEventMessage(
+                    number=number, message_id=MESSAGE_RF_EVENT,
+                    message_code=EVENT_CHANNEL_CLOSED))
+
+    def close(self):
+        self.node.loop.call_soon(self.node.connection_lost, None)
+
+
+class AsyncNodeTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.node = AsyncNode(self.loop)
+        self.transport = FakeTransport(self.node)
+        self.complete(self.node.start(reset_delay=0))
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def complete(self, future):
+        return self.loop.run_until_complete(asyncio.wait_for(future, 1))
+
+    def test_start(self):
+        self.assertEquals(self.node.getCapabilities()[:2], (4, 2))
+        self.assertEquals([net.number for net in self.node.networks], [0, 1])
+
+    def test_configure(self):
+        self.node.networks[0].name = 'N:TEST'
+        channel = self.node.getFreeChannel()
+        self.complete(channel.configure('N:TEST',
+                                        CHANNEL_TYPE_TWOWAY_RECEIVE,
+                                        120, 0, 0, 8070, 57))
+        self.assertFalse(channel.is_free)
+        self.complete(channel.open())
+        self.complete(channel.close())
+
+    def test_messages(self):
+        channel = self.node.channels[1]
+        stream = channel.messages()
+        self.transport.reply(ChannelBroadcastDataMessage(number=2))
+        self.transport.reply(ChannelBroadcastDataMessage(number=1))
+        msg = self.complete(stream.get())
+        self.assertEquals(msg.getChannelNumber(), 1)
+        self.transport.close()
+        self.assertRaises(StopAsyncIteration, self.complete, stream.get())
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import os
+import pty
+import Queue
+import unittest
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from ant.aio.node import *
+from ant.core.event import FrameScanner
+from ant.core.exceptions import DriverError
+from ant.core.message import *
+
+
+class StickEmulator(object):
+    """Turns the frames written to a stick into the stick's answers."""
+    def __init__(self):
+        self.scanner = FrameScanner()
+        self.written = []
+
+    def answer(self, data):
+        replies = []
+        self.scanner.feed(data)
+        for frame in self.scanner:
+            msg = Message().getHandler(frame)
+            self.written.append(msg)
+            if isinstance(msg, ChannelRequestMessage):
+                replies.append(CapabilitiesMessage(max_channels=4,
+                                                   max_nets=1))
+            elif not isinstance(msg, SystemResetMessage):
+                replies.append(ChannelEventMessage(
+                    number=msg.payload[0], message_id=msg.getType()))
+        return ''.join(reply.encode() for reply in replies)
+
+
+class QueueDriver(object):
+    def __init__(self):
+        self.device = 'queue'
+        self.stick = StickEmulator()
+        self.data = Queue.Queue()
+        self.is_open = False
+
+    def isOpen(self):
+        return self.is_open
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def read(self, count=None):
+        try:
+            data = self.data.get(timeout=0.05)
+        except Queue.Empty:
+            return ''
+        if isinstance(data, Exception):
+            raise data
+        return data
+
+    def write(self, data):
+        self.data.put(self.stick.answer(data))
+        return len(data)
+
+
+class TransportTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.node = AsyncNode(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def complete(self, future):
+        return self.loop.run_until_complete(asyncio.wait_for(future, 2))
+
+
+class DriverTransportTest(TransportTest):
+    def setUp(self):
+        TransportTest.setUp(self)
+        self.driver = QueueDriver()
+        self.node.openDriver(self.driver)
+
+    def test_start(self):
+        self.complete(self.node.start(reset_delay=0))
+        self.assertEquals(self.node.getCapabilities()[:2], (4, 1))
+        self.node.stop(reset=False)
+        self.loop.run_until_complete(asyncio.sleep(0.2))
+        self.assertFalse(self.driver.isOpen())
+        self.assertTrue(self.node.transport is None)
+
+    def test_readError(self):
+        self.complete(self.node.start(reset_delay=0))
+        future = self.node.waitForMessage(CapabilitiesMessage)
+        self.driver.data.put(DriverError('unplugged'))
+        self.assertRaises(DriverError, self.complete, future)
+        self.assertFalse(self.node.running)
+
+
+class SerialTransportTest(TransportTest):
+    def setUp(self):
+        TransportTest.setUp(self)
+        self.master, slave = pty.openpty()
+        self.stick = StickEmulator()
+        self.loop.add_reader(self.master, self.answer)
+        self.node.openSerial(os.ttyname(slave))
+        os.close(slave)
+
+    def tearDown(self):
+        self.loop.remove_reader(self.master)
+        os.close(self.master)
+        TransportTest.tearDown(self)
+
+    def answer(self):
+        os.write(self.master, self.stick.answer(os.read(self.master, 1024)))
+
+    def test_start(self):
+        self.complete(self.node.start(reset_delay=0))
+        self.assertEquals(self.node.getCapabilities()[:2], (4, 1))
+        self.assertTrue(isinstance(self.stick.written[0],
+                                   SystemResetMessage))
+        self.node.stop(reset=False)
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertTrue(self.node.transport is None)
+
+    def test_openError(self):
+        self.assertRaises(DriverError, self.node.openSerial, '/nonexistent')
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+"""
+asyncio transports for ANT sticks.
+
+SerialTransport watches the serial port's file descriptor from the event
+loop, so any number of USB1 (serial bridge) sticks share a single thread.
+USB2 sticks have no file descriptor to watch, DriverTransport runs a
+blocking ant.core.driver.Driver on a reader thread instead and hands the
+data to the loop with call_soon_threadsafe().
+"""
+
+import thread
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+import serial
+
+from ant.core.exceptions import DriverError
+
+
+class SerialTransport(asyncio.Transport):
+    def __init__(self, loop, protocol, device, baud_rate=115200):
+        asyncio.Transport.__init__(self)
+        try:
+            self._serial = serial.Serial(device, baud_rate, timeout=0)
+        except serial.SerialException, e:
+            raise DriverError(str(e))
+        self._loop = loop
+        self._protocol = protocol
+        self._closing = False
+        self._extra['device'] = device
+        loop.add_reader(self._serial.fileno(), self._readReady)
+        loop.call_soon(protocol.connection_made, self)
+
+    def _readReady(self):
+        try:
+            data = self._serial.read(max(1, self._serial.inWaiting()))
+        except serial.SerialException, e:
+            self._close(DriverError(str(e)))
+            return
+        if data:
+            self._protocol.data_received(data)
+
+    def write(self, data):
+        if self._closing:
+            raise DriverError("Could not write to device (closed).")
+        try:
+            self._serial.write(data)
+        except serial.SerialException, e:
+            self._close(DriverError(str(e)))
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        self._close(None)
+
+    def _close(self, exc):
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.remove_reader(self._serial.fileno())
+        self._serial.close()
+        self._loop.call_soon(self._protocol.connection_lost, exc)
+
+
+class DriverTransport(asyncio.Transport):
+    def __init__(self, loop, protocol, driver):
+        asyncio.Transport.__init__(self)
+        if not driver.isOpen():
+            driver.open()
+        self._loop = loop
+        self._protocol = protocol
+        self._driver = driver
+        self._closing = False
+        self._extra['device'] = driver.device
+        loop.call_soon(protocol.connection_made, self)
+        thread.start_new_thread(self._reader, ())
+
+    def _reader(self):
+        exc = None
+        while not self._closing:
+            try:
+                data = self._driver.read()
+            except DriverError, e:
+                exc = e
+                break
+            if data:
+                self._loop.call_soon_threadsafe(self._protocol.data_received,
+                                                data)
+        self._driver.close()
+        self._loop.call_soon_threadsafe(self._lost, exc)
+
+    def _lost(self, exc):
+        self._closing = True
+        self._protocol.connection_lost(exc)
+
+    def write(self, data):
+        if self._closing:
+            raise DriverError("Could not write to device (closed).")
+        self._driver.write(data)
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        # The reader thread closes the driver and reports the loss
+        self._closing = True
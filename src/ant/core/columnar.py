@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+"""
+Decode a capture once into a NumPy structured array, one row per frame,
+and keep it in an .npy file that can be memory mapped for analysis:
+
+    frames = columnar.exportLog('ride.ant', 'ride.npy')
+    frames = columnar.load('ride.npy')  # memory mapped, read only
+    hrm = frames[(frames['msg_id'] == 0x4E) & (frames['channel'] == 0)]
+    heart_rate = hrm['data'][:, 7]
+
+Extended data columns are only meaningful where the matching
+ExtendedMessageFlags bit is set in 'flag'. 'channel' is -1 for messages
+that do not belong to a channel. Requires numpy.
+"""
+
+import msgpack
+import numpy
+
+from ant.core.constants import *
+from ant.core.event import FrameScanner
+from ant.core.exceptions import MessageError
+from ant.core.indexedlog import IndexedLogReader, HEADER
+from ant.core import log
+from ant.core.message import Message, ChannelMessage, ExtendedMessage, \
+                             LegacyExtendedMessage
+
+FRAME_DTYPE = numpy.dtype([
+    ('wall_us', '<i8'),           # wall clock, microseconds since the epoch
+    ('mono_us', '<i8'),           # monotonic clock, microseconds
+    ('direction', 'u1'),          # log.EVENT_READ or log.EVENT_WRITE
+    ('msg_id', 'u1'),
+    ('channel', '<i2'),
+    ('data', 'u1', (8,)),         # payload after the channel number
+    ('flag', 'u1'),               # ExtendedMessageFlags present
+    ('device_number', '<u2'),
+    ('device_type', 'u1'),
+    ('transmission_type', 'u1'),
+    ('rssi_value', 'u1'),
+    ('rx_timestamp', '<u2'),
+])
+
+# Rows converted to an array at a time while decoding
+CHUNK_ROWS = 64 * 1024
+
+
+class FrameTable(object):
+    """Collects decoded frames and turns them into a FRAME_DTYPE array."""
+    def __init__(self):
+        self.chunks = []
+        self.rows = []
+        self.decoder = Message()
+
+    def append(self, direction, wall_us, mono_us, frame):
+        channel = -1
+        extended = (0, 0, 0, 0, 0, 0)
+        try:
+            msg = self.decoder.getHandler(frame)
+        except MessageError:
+            payload = bytearray(frame[3:-1])
+        else:
+            payload = msg.payload
+            if isinstance(msg, ChannelMessage):
+                channel = msg.getChannelNumber()
+                payload = payload[1:]
+            if isinstance(msg, ExtendedMessage):
+                extended = self._extended(msg)
+            elif isinstance(msg, LegacyExtendedMessage):
+                # Channel ID sits between the channel number and the data
+                extended = (ExtendedMessageFlags.ENABLE_CHANNEL_ID,
+                            msg.getDeviceNumber(), msg.getDeviceType(),
+                            msg.getTransmissionType(), 0, 0)
+                payload = payload[4:]
+
+        data = bytearray(8)
+        data[:len(payload[:8])] = payload[:8]
+        self.rows.append((wall_us, mono_us, direction, ord(frame[2]),
+                          channel, tuple(data)) + extended)
+        if len(self.rows) == CHUNK_ROWS:
+            self._convert()
+
+    def _extended(self, msg):
+        flag = msg.getFlag()
+        device = (0, 0, 0)
+        rssi = 0
+        rx_timestamp = 0
+        if flag & ExtendedMessageFlags.ENABLE_CHANNEL_ID:
+            device = (msg.getDeviceNumber(), msg.getDeviceType(),
+                      msg.getTransmissionType())
+        if flag & ExtendedMessageFlags.ENABLE_RSSI_OUTPUT:
+            rssi = msg.getRssiValue()
+        if flag & ExtendedMessageFlags.ENABLE_RX_TIMESTAMP:
+            rx_timestamp = msg.getTimestamp()
+        return (flag,) + device + (rssi, rx_timestamp)
+
+    def _convert(self):
+        self.chunks.append(numpy.array(self.rows, dtype=FRAME_DTYPE))
+        self.rows = []
+
+    def frames(self):
+        if self.rows or not self.chunks:
+            self._convert()
+        if len(self.chunks) > 1:
+            self.chunks = [numpy.concatenate(self.chunks)]
+        return self.chunks[0]
+
+
+def decodeLog(filename):
+    """Decode every frame of a v1 or v2 capture into a FRAME_DTYPE array."""
+    table = FrameTable()
+    v2_header = msgpack.packb(HEADER)
+    fd = open(filename, 'rb')
+    try:
+        header = fd.read(len(v2_header))
+    finally:
+        fd.close()
+
+    if header == v2_header:
+        reader = IndexedLogReader(filename)
+        try:
+            for record in reader:
+                table.append(record.direction, record.wall_us,
+                             record.mono_us, record.frame)
+        finally:
+            reader.close()
+        return table.frames()
+
+    scanners = {log.EVENT_READ: FrameScanner(),
+                log.EVENT_WRITE: FrameScanner()}
+    reader = log.LogReader(filename)
+    try:
+        for event in reader:
+            if event[0] not in scanners:
+                continue
+            if reader.version == log.VERSION_SECONDS:
+                wall_us = mono_us = event[1] * 1000000
+            else:
+                wall_us, mono_us = event[1]
+            scanner = scanners[event[0]]
+            scanner.feed(event[2])
+            for frame in scanner:
+                table.append(event[0], wall_us, mono_us, frame.tobytes())
+    finally:
+        reader.close()
+    return table.frames()
+
+
+def save(filename, frames):
+    """Write frames to an .npy file, or to an .npz archive as 'frames'."""
+    if filename.endswith('.npz'):
+        numpy.savez(filename, frames=frames)
+    else:
+        numpy.save(filename, frames)
+
+
+def load(filename, mmap_mode='r'):
+    """
+    Load frames saved by save(). .npy files are memory mapped (mmap_mode
+    None reads them into memory instead); .npz archives are always read.
+    """
+    if filename.endswith('.npz'):
+        archive = numpy.load(filename)
+        try:
+            return archive['frames']
+        finally:
+            archive.close()
+    return numpy.load(filename, mmap_mode=mmap_mode)
+
+
+def exportLog(source, destination):
+    """Decode the capture source once and save it to destination."""
+    frames = decodeLog(source)
+    save(destination, frames)
+    return load(destination)
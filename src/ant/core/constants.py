@@ -64,6 +64,7 @@ MESSAGE_CHANNEL_EXTENDED_BURST_DATA = 0x5F
 
 # Channel event messages
 MESSAGE_CHANNEL_EVENT = 0x40
+MESSAGE_RF_EVENT = 0x01  # message ID of channel events that are not responses
 
 # Requested response messages
 MESSAGE_CHANNEL_STATUS = 0x52
@@ -134,13 +135,19 @@ CAPABILITIES_FS_ANTFS_ENABLED = 0x40
 TIMEOUT_NEVER = 0xFF
 
 # MAX Message Length bytes - sanity check for msg length in data packet
-#MAX_MESSAGE_LENGTH = 23
+MAX_MESSAGE_LENGTH = 23
 
 # EXTENDED MESSAGE FORMATS
 MessageFormat = enum('LEGACY','LEGACY_EXTENDED','EXTENDED')
 
 MESSAGE_LENGTH_LEGACY = 9
 
+# What the event machine does with a message when its dispatch queue is full
+DispatchPolicy = enum('BLOCK', 'DROP_OLDEST', 'DROP_NEWEST')
+
+# Order in which queued writes reach the stick, lowest first
+WritePriority = enum('CONFIG', 'ACKNOWLEDGED', 'DATA')
+
 ExtendedMessageFlags = enum (
     DISABLE = 0x00,
     ENABLE_RX_TIMESTAMP = 0x20,
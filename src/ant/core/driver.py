@@ -23,6 +23,7 @@
 #
 ##############################################################################
 
+import errno
 import thread
 
 # USB1 driver uses a USB<->Serial bridge
@@ -37,13 +38,17 @@ from array import *
 
 
 class Driver(object):
-    _lock = thread.allocate_lock()
-
     def __init__(self, device, log=None, debug=False):
         self.device = device
         self.debug = debug
         self.log = log
         self.is_open = False
+        # _lock guards open/close. Reads and writes each have their own
+        # lock so that one can proceed while the other waits on the device.
+        # Lock order: _lock, _read_lock, _write_lock.
+        self._lock = thread.allocate_lock()
+        self._read_lock = thread.allocate_lock()
+        self._write_lock = thread.allocate_lock()
 
     def isOpen(self):
         self._lock.acquire()
@@ -53,6 +58,8 @@ class Driver(object):
 
     def open(self):
         self._lock.acquire()
+        self._read_lock.acquire()
+        self._write_lock.acquire()
 
         try:
             if self.is_open:
@@ -63,10 +70,14 @@ class Driver(object):
             if self.log:
                 self.log.logOpen()
         finally:
+            self._write_lock.release()
+            self._read_lock.release()
             self._lock.release()
 
     def close(self):
         self._lock.acquire()
+        self._read_lock.acquire()
+        self._write_lock.acquire()
 
         try:
             if not self.is_open:
@@ -77,14 +88,22 @@ class Driver(object):
             if self.log:
                 self.log.logClose()
         finally:
+            self._write_lock.release()
+            self._read_lock.release()
             self._lock.release()
 
-    def read(self, count):
-        self._lock.acquire()
+    def read(self, count=None):
+        """
+        Read up to count bytes, or whatever the device prefers to hand over
+        in a single transfer if count is None.
+        """
+        self._read_lock.acquire()
 
         try:
             if not self.is_open:
                 raise DriverError("Could not read from device (not open).")
+            if count is None:
+                count = self.getReadSize()
             if count <= 0:
                 raise DriverError("Could not read from device (zero request).")
 
@@ -95,12 +114,12 @@ class Driver(object):
             if self.debug:
                 self._dump(data, 'READ')
         finally:
-            self._lock.release()
+            self._read_lock.release()
 
         return data
 
     def write(self, data):
-        self._lock.acquire()
+        self._write_lock.acquire()
 
         try:
             if not self.is_open:
@@ -115,7 +134,7 @@ class Driver(object):
             if self.log:
                 self.log.logWrite(data[0:ret])
         finally:
-            self._lock.release()
+            self._write_lock.release()
 
         return ret
 
@@ -135,6 +154,14 @@ class Driver(object):
 
         print ''
 
+    def getReadSize(self):
+        # One full speed USB bulk packet
+        return 64
+
+    def getWriteSize(self):
+        """Largest write worth batching several messages into."""
+        return 64
+
     def _open(self):
         raise DriverError("Not Implemented")
 
@@ -148,10 +175,19 @@ class Driver(object):
         raise DriverError("Not Implemented")
 
 
+def isTimeout(error):
+    """Whether a usb.core.USBError reports a transfer timeout."""
+    # LIBUSB_ERROR_TIMEOUT (libusb 1.0) and ETIMEDOUT (libusb 0.1, openusb)
+    return getattr(error, 'backend_error_code', None) == -7 or \
+           getattr(error, 'errno', None) == errno.ETIMEDOUT
+
+
 class USB1Driver(Driver):
-    def __init__(self, device, baud_rate=115200, log=None, debug=False):
+    def __init__(self, device, baud_rate=115200, log=None, debug=False,
+                 read_timeout=0.01):
         Driver.__init__(self, device, log, debug)
         self.baud = baud_rate
+        self.read_timeout = read_timeout  # seconds
 
     def _open(self):
         try:
@@ -163,11 +199,15 @@ class USB1Driver(Driver):
             raise DriverError('Could not open device')
 
         self._serial = dev
-        self._serial.timeout = 0.01
+        self._serial.timeout = self.read_timeout
 
     def _close(self):
         self._serial.close()
 
+    def getReadSize(self):
+        # Everything the bridge has buffered, or block for the next byte
+        return max(1, self._serial.inWaiting())
+
     def _read(self, count):
         return self._serial.read(count)
 
@@ -181,21 +221,35 @@ class USB1Driver(Driver):
         return count
 
 
+def _findUSB2Devices():
+    # PyUSB 1.x returns a generator
+    return list(usb.core.find(idVendor=0x0fcf, idProduct=0x1008,
+                              find_all=True) or [])
+
+
 class USB2Driver(Driver):
+    # Bulk packets requested per read
+    READ_PACKETS = 8
 
-    def __init__(self, device,log=None, debug=False, number=0):
+    def __init__(self, device,log=None, debug=False, number=0,
+                 read_timeout=0.1):
         Driver.__init__(self, device, log, debug)
         self.number = number
+        self.read_timeout = read_timeout  # seconds
+
 
+    @staticmethod
+    def count():
+        """Number of ANT USB2 sticks attached."""
+        return len(_findUSB2Devices())
 
     def _open(self):
         # Most of this is straight from the PyUSB example documentation		
-        devs = usb.core.find(idVendor=0x0fcf, idProduct=0x1008,find_all=True)
-
-        dev = devs[self.number]
+        devs = _findUSB2Devices()
 
-        if dev is None:
+        if self.number >= len(devs):
             raise DriverError('Could not open device (not found)')
+        dev = devs[self.number]
         dev.set_configuration()
         cfg = dev.get_active_configuration()
         interface_number = cfg[(0,0)].bInterfaceNumber
@@ -229,13 +283,20 @@ class USB2Driver(Driver):
     def _close(self):
         usb.util.release_interface(self._dev, self._int)
 
+    def getReadSize(self):
+        return self._ep_in.wMaxPacketSize * self.READ_PACKETS
+
+    def getWriteSize(self):
+        return self._ep_out.wMaxPacketSize
+
     def _read(self, count):
-        arr_inp = array('B')
         try:
-            arr_inp = self._ep_in.read(count)
-        except usb.core.USBError:
-            # Timeout errors seem to occasionally be expected
-            pass
+            arr_inp = self._ep_in.read(count, int(self.read_timeout * 1000))
+        except usb.core.USBError, e:
+            # A timeout only means the stick had nothing to say
+            if isTimeout(e):
+                return ''
+            raise DriverError(str(e))
 
         return arr_inp.tostring()
 
@@ -30,15 +30,35 @@
 
 MAX_ACK_QUEUE = 25
 MAX_MSG_QUEUE = 25
-
+MAX_DISPATCH_QUEUE = 1024
+MAX_READ_ERRORS = 5  # failed reads in a row before the pump gives up
+READ_RETRY_DELAY = 0.1
+
+import Queue
+import collections
+import itertools
+import sys
 import thread
+import threading
 import time
 
 from ant.core.constants import *
-from ant.core.message import Message, ChannelEventMessage
-from ant.core.exceptions import MessageError
+from ant.core.message import Message, ChannelMessage, ChannelEventMessage, \
+                             ChannelBroadcastDataMessage, \
+                             ChannelAcknowledgedDataMessage, \
+                             ChannelBurstDataMessage, \
+                             LegacyChannelBroadcastDataMessage, \
+                             LegacyChannelAcknowledgedDataMessage, \
+                             LegacyChannelBurstDataMessage, \
+                             validateFrame, FRAME_INCOMPLETE, FRAME_CORRUPT
+from ant.core.exceptions import MessageError, TimeoutError, CancelledError, \
+                               DriverError
 import struct
 
+SYNC_BYTE = chr(MESSAGE_TX_SYNC)
+SYNC_BYTE_LSB = chr(MESSAGE_TX_SYNC_LSB)
+SYNC_VALUES = (MESSAGE_TX_SYNC, MESSAGE_TX_SYNC_LSB)
+
 
 def ProcessBuffer(buffer_):
     messages = []
@@ -88,58 +108,390 @@ def ProcessBuffer(buffer_):
     return (buffer_, messages,)
 
 
+class FrameScanner(object):
+    """
+    Incremental framer for the raw byte stream read from the stick.
+
+    Data handed to feed() is kept in a bytearray together with a read
+    offset; frames passing validateFrame() are returned as memoryview
+    slices of that buffer, so nothing is copied until a Message is built
+    from them. A view stays valid after later feeds, since the buffer is
+    replaced rather than resized once frames have been handed out.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offset = 0
+
+    def feed(self, data):
+        if len(data) == 0:
+            return
+
+        if self.offset >= len(self.buffer):
+            self.buffer = bytearray(data)
+        else:
+            # Only the unconsumed tail (usually part of one frame) is copied
+            buffer_ = self.buffer[self.offset:]
+            buffer_.extend(data)
+            self.buffer = buffer_
+        self.offset = 0
+
+    def _findSync(self, start):
+        buffer_ = self.buffer
+        if start < len(buffer_) and buffer_[start] in SYNC_VALUES:
+            return start
+
+        sync = buffer_.find(SYNC_BYTE, start)
+        if sync < 0:
+            return buffer_.find(SYNC_BYTE_LSB, start)
+        # Don't look for the LSB variant past the first regular sync byte
+        sync_lsb = buffer_.find(SYNC_BYTE_LSB, start, sync)
+        if sync_lsb < 0:
+            return sync
+        return sync_lsb
+
+    def getFrame(self):
+        buffer_ = self.buffer
+        end = len(buffer_)
+
+        while True:
+            start = self._findSync(self.offset)
+            if start < 0:
+                # No sync byte left, nothing worth keeping
+                self.offset = end
+                return None
+
+            size = validateFrame(buffer_, start)
+            if size == FRAME_INCOMPLETE:
+                self.offset = start
+                return None
+            if size == FRAME_CORRUPT:
+                # Resynchronize on the next sync byte
+                self.offset = start + 1
+                continue
+
+            self.offset = start + size
+            return memoryview(buffer_)[start:start + size]
+
+    def __iter__(self):
+        while True:
+            frame = self.getFrame()
+            if frame is None:
+                break
+            yield frame
+
+
 def EventPump(evm):
+    """
+    Reader stage: frame and decode whatever the driver returns, file
+    responses in the mailboxes and queue everything for the dispatchers.
+
+    Failed reads are retried after READ_RETRY_DELAY; after MAX_READ_ERRORS
+    in a row the pump gives up, failing whatever waits for a response.
+    """
     evm.pump_lock.acquire()
     evm.pump = True
+    evm.pump_cond.notifyAll()
     evm.pump_lock.release()
     go = True
-    buffer_ = ''
-    while go:
-        evm.running_lock.acquire()
-        if not evm.running:
-            go = False
-        evm.running_lock.release()
-
-        buffer_ += evm.driver.read(20)
-        if len(buffer_) == 0:
-            continue
-        buffer_, messages = ProcessBuffer(buffer_)
-
-        evm.callbacks_lock.acquire()
-        for message in messages:
-            #print message
-            for callback in evm.callbacks:
+    scanner = FrameScanner()
+    decoder = Message()
+    stats = evm.stats
+    read_errors = 0
+    # Drivers framing the data themselves (worker.ProcessDriver) hand over
+    # whole frames
+    readFrames = getattr(evm.driver, 'readFrames', None)
+    try:
+        while go:
+            evm.running_lock.acquire()
+            if not evm.running:
+                go = False
+            evm.running_lock.release()
+
+            # No sleeping here: the driver read blocks until data arrives or
+            # its timeout expires, which is what paces this loop when idle.
+            try:
+                if readFrames is not None:
+                    frames = readFrames()
+                else:
+                    data = evm.driver.read()
+                    if len(data) == 0:
+                        continue
+                    scanner.feed(data)
+                    frames = scanner
+            except DriverError, e:
+                stats['read_errors'] += 1
+                read_errors += 1
+                print e
+                if read_errors >= MAX_READ_ERRORS:
+                    evm.failPending(e)
+                    break
+                time.sleep(READ_RETRY_DELAY)
+                continue
+            read_errors = 0
+
+            for frame in frames:
                 try:
-                    callback.process(message)
-                except Exception, e:
+                    message = decoder.getHandler(frame)
+                except MessageError, e:
+                    stats['errors'] += 1
                     print e
-                    pass
+                    continue
+                stats['received'] += 1
+
+                # Responses never wait behind slow callbacks
+                for callback in evm.mailboxes:
+                    try:
+                        callback.process(message)
+                    except Exception, e:
+                        stats['errors'] += 1
+                        print e
+                evm.queueMessage(message)
+    finally:
+        evm.pump_lock.acquire()
+        evm.pump = False
+        evm.pump_cond.notifyAll()
+        evm.pump_lock.release()
+
+
+def EventDispatcher(evm):
+    """Dispatch stage: run callbacks for queued messages until told to stop."""
+    while True:
+        message = evm.queue.get()
+        if message is None:
+            break
+
+        errors = 0
+        for callback in evm.callbacks:
+            try:
+                callback.process(message)
+            except Exception, e:
+                errors += 1
+                print e
 
-        evm.callbacks_lock.release()
+        if isinstance(message, ChannelMessage):
+            channel = evm.channels[message.getChannelNumber()]
+            if channel is not None:
+                channel.process(message)
 
-        time.sleep(0.002)
+        evm.stats_lock.acquire()
+        evm.stats['dispatched'] += 1
+        evm.stats['callback_errors'] += errors
+        evm.stats_lock.release()
 
     evm.pump_lock.acquire()
-    evm.pump = False
+    evm.dispatching -= 1
+    evm.pump_cond.notifyAll()
     evm.pump_lock.release()
 
 
+def EventWriter(evm):
+    """
+    Writer stage: write queued frames in priority order, packing as many
+    as fit into one driver write, until the stop sentinel comes up.
+    """
+    limit = evm.driver.getWriteSize()
+    stats = evm.write_stats
+    held = None
+    go = True
+    while go:
+        if held is None:
+            held = evm.write_queue.get()
+        frames = []
+        entries = []
+        size = 0
+        while held is not None:
+            priority, seq, data, queued = held
+            if data is None:
+                go = False
+                break
+            if frames and size + len(data) > limit:
+                break
+            frames.append(data)
+            entries.append(held)
+            size += len(data)
+            try:
+                held = evm.write_queue.get_nowait()
+            except Queue.Empty:
+                held = None
+        if not frames:
+            continue
+
+        try:
+            evm.driver.write(''.join(frames))
+        except Exception, e:
+            stats['errors'] += 1
+            print e
+        stats['writes'] += 1
+
+        now = time.time()
+        for priority, seq, data, queued in entries:
+            latency = now - queued
+            counters = stats[priority]
+            counters['frames'] += 1
+            counters['latency'] += latency
+            if latency > counters['max_latency']:
+                counters['max_latency'] = latency
+
+    evm.pump_lock.acquire()
+    evm.writing = False
+    evm.pump_cond.notifyAll()
+    evm.pump_lock.release()
+
+    # Anything queued while the sentinel was being handled
+    while True:
+        try:
+            priority, seq, data, queued = evm.write_queue.get_nowait()
+        except Queue.Empty:
+            break
+        if data is not None:
+            evm.driver.write(data)
+
+
+def writePriority(msg):
+    """Default WritePriority for sending msg."""
+    if isinstance(msg, (ChannelAcknowledgedDataMessage,
+                        LegacyChannelAcknowledgedDataMessage)):
+        return WritePriority.ACKNOWLEDGED
+    if isinstance(msg, (ChannelBroadcastDataMessage, ChannelBurstDataMessage,
+                        LegacyChannelBroadcastDataMessage,
+                        LegacyChannelBurstDataMessage)):
+        return WritePriority.DATA
+    return WritePriority.CONFIG
+
+
 class EventCallback(object):
     def process(self, msg):
         pass
 
 
+class Future(object):
+    """Result of an operation completed later, usually by the event pump."""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._done = False
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done
+
+    def cancel(self):
+        return self._complete(None, CancelledError('Operation cancelled.'))
+
+    def setResult(self, result):
+        return self._complete(result, None)
+
+    def setException(self, exception):
+        return self._complete(None, exception)
+
+    def addDoneCallback(self, callback):
+        self._cond.acquire()
+        if not self._done:
+            self._callbacks.append(callback)
+            self._cond.release()
+            return
+        self._cond.release()
+        callback(self)
+
+    def result(self, timeout=None):
+        self._cond.acquire()
+        try:
+            if timeout is None:
+                while not self._done:
+                    self._cond.wait()
+            else:
+                deadline = time.time() + timeout
+                while not self._done:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise TimeoutError('Operation timed out.')
+                    self._cond.wait(remaining)
+        finally:
+            self._cond.release()
+
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def _complete(self, result, exception):
+        self._cond.acquire()
+        if self._done:
+            self._cond.release()
+            return False
+        self._result = result
+        self._exception = exception
+        self._done = True
+        callbacks, self._callbacks = self._callbacks, []
+        self._cond.notifyAll()
+        self._cond.release()
+
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception, e:
+                print e
+        return True
+
+
+def ackKey(msg):
+    """Mailbox key of the response to (or of) msg: (channel, message ID)."""
+    if isinstance(msg, ChannelEventMessage):
+        return (msg.getChannelNumber(), msg.getMessageID())
+    # Responses echo the first payload byte of the command (channel or
+    # network number, zero for commands that have neither).
+    number = msg.payload[0] if len(msg.payload) > 0 else 0x00
+    return (number, msg.getType())
+
+
+def postMessage(mailbox, dropped, key, msg, maxlen):
+    box = mailbox.get(key)
+    if box is None:
+        box = mailbox[key] = collections.deque(maxlen=maxlen)
+    elif len(box) == maxlen:
+        dropped[key] = dropped.get(key, 0) + 1
+    box.append(msg)
+
+
 class AckCallback(EventCallback):
     def __init__(self, evm):
         self.evm = evm
 
     def process(self, msg):
-        if isinstance(msg, ChannelEventMessage):
-            self.evm.ack_lock.acquire()
-            self.evm.ack.append(msg)
-            if len(self.evm.ack) > MAX_ACK_QUEUE:
-                self.evm.ack = self.evm.ack[-MAX_ACK_QUEUE:]
-            self.evm.ack_lock.release()
+        if not isinstance(msg, ChannelEventMessage):
+            return
+
+        if msg.getMessageID() == MESSAGE_RF_EVENT:
+            key = (msg.getChannelNumber(), msg.getMessageCode())
+            futures = self.evm.event_futures
+        else:
+            key = ackKey(msg)
+            futures = self.evm.ack_futures
+
+        self.evm.ack_lock.acquire()
+        # A pending future (see expectAck()) takes the message, otherwise
+        # responses are left in the mailbox for waitForAck()
+        future = None
+        pending = futures.get(key)
+        while pending:
+            future = pending.popleft()
+            if not future.done():
+                break
+            future = None
+        if future is None and futures is self.evm.ack_futures:
+            postMessage(self.evm.ack, self.evm.ack_dropped, key, msg,
+                        MAX_ACK_QUEUE)
+            waiter = self.evm.ack_waiters.get(key)
+            if waiter is not None:
+                waiter.notifyAll()
+        self.evm.ack_lock.release()
+
+        if future is not None:
+            if futures is self.evm.ack_futures:
+                future.setResult(msg.getMessageCode())
+            else:
+                future.setResult(msg)
 
 
 class MsgCallback(EventCallback):
@@ -147,65 +499,232 @@ class MsgCallback(EventCallback):
         self.evm = evm
 
     def process(self, msg):
+        class_ = type(msg)
         self.evm.msg_lock.acquire()
-        self.evm.msg.append(msg)
-        if len(self.evm.msg) > MAX_MSG_QUEUE:
-            self.evm.msg = self.evm.msg[-MAX_MSG_QUEUE:]
+        postMessage(self.evm.msg, self.evm.msg_dropped, class_, msg,
+                    MAX_MSG_QUEUE)
+        # waitForMessage() may be waiting on any class msg is an instance of
+        for base in class_.__mro__:
+            waiter = self.evm.msg_waiters.get(base)
+            if waiter is not None:
+                waiter.notifyAll()
         self.evm.msg_lock.release()
 
 
 class EventMachine(object):
-    callbacks_lock = thread.allocate_lock()
-    running_lock = thread.allocate_lock()
-    pump_lock = thread.allocate_lock()
-    ack_lock = thread.allocate_lock()
-    msg_lock = thread.allocate_lock()
-
-    def __init__(self, driver):
+    def __init__(self, driver, dispatchers=1, queue_size=MAX_DISPATCH_QUEUE,
+                 policy=DispatchPolicy.BLOCK):
+        """
+        Messages are read on one thread and handed to the registered
+        callbacks by a pool of dispatcher threads through a queue of
+        queue_size messages. policy (a DispatchPolicy) decides what happens
+        when that queue is full: BLOCK stalls the reader, DROP_OLDEST and
+        DROP_NEWEST keep reading and count the lost messages. With more
+        than one dispatcher, callbacks run concurrently and may see
+        messages out of order.
+        """
+        # Per machine, so the machines of several sticks never contend
+        self.callbacks_lock = thread.allocate_lock()
+        self.running_lock = thread.allocate_lock()
+        self.pump_lock = thread.allocate_lock()
+        self.ack_lock = thread.allocate_lock()
+        self.msg_lock = thread.allocate_lock()
         self.driver = driver
         self.callbacks = []
+        self.channels = [None] * 256  # channel number -> channel callback
         self.running = False
         self.pump = False
-        self.ack = []
-        self.msg = []
-        self.registerCallback(AckCallback(self))
-        self.registerCallback(MsgCallback(self))
-
+        self.dispatchers = dispatchers
+        self.dispatching = 0
+        self.queue = Queue.Queue(queue_size)
+        self.policy = policy
+        self.stats = dict.fromkeys(('received', 'errors', 'read_errors',
+                                    'queued', 'dropped', 'dispatched',
+                                    'callback_errors'), 0)
+        self.stats_lock = thread.allocate_lock()
+        self.writing = False
+        self.write_queue = Queue.PriorityQueue()
+        self.write_seq = itertools.count()  # keeps each priority FIFO
+        self.write_stats = {'writes': 0, 'errors': 0}
+        for priority in (WritePriority.CONFIG, WritePriority.ACKNOWLEDGED,
+                         WritePriority.DATA):
+            self.write_stats[priority] = {'frames': 0, 'latency': 0.0,
+                                          'max_latency': 0.0}
+        self.pump_cond = threading.Condition(self.pump_lock)
+        # Mailboxes: (channel, message ID) -> responses, and message class ->
+        # messages, each a bounded deque. Whatever falls off the end of a
+        # full deque is counted under the same key in *_dropped.
+        self.ack = {}
+        self.ack_dropped = {}
+        self.ack_waiters = {}  # (channel, message ID) -> Condition on ack_lock
+        self.ack_futures = {}  # (channel, message ID) -> deque of Futures
+        self.event_futures = {}  # (channel, event code) -> deque of Futures
+        self.msg = {}
+        self.msg_dropped = {}
+        self.msg_waiters = {}  # message class -> Condition on msg_lock
+        # Run on the reader thread itself, see EventPump
+        self.mailboxes = (AckCallback(self), MsgCallback(self))
+
+    # The callback list is copied on write, so dispatchers walk it unlocked
     def registerCallback(self, callback):
         self.callbacks_lock.acquire()
         if callback not in self.callbacks:
-            self.callbacks.append(callback)
+            self.callbacks = self.callbacks + [callback]
         self.callbacks_lock.release()
 
     def removeCallback(self, callback):
         self.callbacks_lock.acquire()
         if callback in self.callbacks:
-            self.callbacks.remove(callback)
+            callbacks = list(self.callbacks)
+            callbacks.remove(callback)
+            self.callbacks = callbacks
         self.callbacks_lock.release()
 
-    def waitForAck(self, msg):
-        while True:
-            self.ack_lock.acquire()
-            for emsg in self.ack:
-                if msg.getType() != emsg.getMessageID():
-                    continue
-                self.ack.remove(emsg)
-                self.ack_lock.release()
-                return emsg.getMessageCode()
+    def queueMessage(self, message):
+        if self.policy == DispatchPolicy.BLOCK:
+            self.queue.put(message)
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(message)
+                    break
+                except Queue.Full:
+                    pass
+                if self.policy == DispatchPolicy.DROP_NEWEST:
+                    self.stats['dropped'] += 1
+                    return
+                try:
+                    self.queue.get_nowait()
+                    self.stats['dropped'] += 1
+                except Queue.Empty:
+                    pass
+        self.stats['queued'] += 1
+
+    def getStats(self):
+        """Per-stage message counters, plus the current queue depth."""
+        self.stats_lock.acquire()
+        stats = dict(self.stats)
+        self.stats_lock.release()
+        stats['backlog'] = self.queue.qsize()
+        return stats
+
+    def write(self, data, priority=WritePriority.DATA):
+        """
+        Queue encoded frames for the writer thread, or write them straight
+        away while the event machine is stopped.
+        """
+        self.pump_lock.acquire()
+        try:
+            if self.writing:
+                self.write_queue.put((priority, self.write_seq.next(), data,
+                                      time.time()))
+                return
+        finally:
+            self.pump_lock.release()
+        self.driver.write(data)
+
+    def getWriteStats(self):
+        """
+        Writes and errors, plus frames written and their total and maximum
+        queueing latency (seconds) for each WritePriority.
+        """
+        stats = {}
+        for key, value in self.write_stats.items():
+            if isinstance(value, dict):
+                value = dict(value)
+            stats[key] = value
+        stats['backlog'] = self.write_queue.qsize()
+        return stats
+
+    def registerChannel(self, number, callback):
+        """Route every ChannelMessage for channel number to callback."""
+        self.callbacks_lock.acquire()
+        self.channels[number] = callback
+        self.callbacks_lock.release()
+
+    def removeChannel(self, number, callback):
+        self.callbacks_lock.acquire()
+        if self.channels[number] is callback:
+            self.channels[number] = None
+        self.callbacks_lock.release()
+
+    def expectAck(self, msg):
+        """
+        Return a Future for the response code to msg. Call it before
+        writing msg, so the response cannot slip past.
+        """
+        return self._expect(self.ack_futures, ackKey(msg))
+
+    def expectEvent(self, number, code):
+        """Return a Future for the next channel event with the given code."""
+        return self._expect(self.event_futures, (number, code))
+
+    def _expect(self, futures, key):
+        future = Future()
+        self.ack_lock.acquire()
+        pending = futures.get(key)
+        if pending is None:
+            pending = futures[key] = collections.deque()
+        pending.append(future)
+        self.ack_lock.release()
+        return future
+
+    def failPending(self, exception):
+        """Fail every Future waiting for a response or channel event."""
+        self.ack_lock.acquire()
+        pending = []
+        for futures in (self.ack_futures, self.event_futures):
+            for queue in futures.itervalues():
+                pending.extend(queue)
+            futures.clear()
+        self.ack_lock.release()
+        for future in pending:
+            future.setException(exception)
+
+    def waitForAck(self, msg, timeout=None):
+        key = ackKey(msg)
+        self.ack_lock.acquire()
+        try:
+            waiter = self.ack_waiters.get(key)
+            if waiter is None:
+                waiter = threading.Condition(self.ack_lock)
+                self.ack_waiters[key] = waiter
+            self._wait(waiter, lambda: self.ack.get(key), timeout)
+            return self.ack[key].popleft().getMessageCode()
+        finally:
             self.ack_lock.release()
-            time.sleep(0.002)
 
-    def waitForMessage(self, class_):
-        while True:
-            self.msg_lock.acquire()
-            for emsg in self.msg:
-                if not isinstance(emsg, class_):
-                    continue
-                self.msg.remove(emsg)
-                self.msg_lock.release()
-                return emsg
+    def waitForMessage(self, class_, timeout=None):
+        def find():
+            for key, box in self.msg.iteritems():
+                if box and issubclass(key, class_):
+                    return box
+
+        self.msg_lock.acquire()
+        try:
+            waiter = self.msg_waiters.get(class_)
+            if waiter is None:
+                waiter = threading.Condition(self.msg_lock)
+                self.msg_waiters[class_] = waiter
+            return self._wait(waiter, find, timeout).popleft()
+        finally:
             self.msg_lock.release()
-            time.sleep(0.002)
+
+    def _wait(self, waiter, predicate, timeout):
+        found = predicate()
+        if timeout is None:
+            while not found:
+                waiter.wait()
+                found = predicate()
+        else:
+            deadline = time.time() + timeout
+            while not found:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError('Timed out waiting for response.')
+                waiter.wait(remaining)
+                found = predicate()
+        return found
 
     def start(self, driver=None):
         self.running_lock.acquire()
@@ -217,14 +736,19 @@ class EventMachine(object):
         if driver is not None:
             self.driver = driver
 
+        self.pump_lock.acquire()
+        self.dispatching = self.dispatchers
+        self.writing = True
+        self.pump_lock.release()
+        for i in range(self.dispatchers):
+            thread.start_new_thread(EventDispatcher, (self,))
+        thread.start_new_thread(EventWriter, (self,))
+
         thread.start_new_thread(EventPump, (self,))
-        while True:
-            self.pump_lock.acquire()
-            if self.pump:
-                self.pump_lock.release()
-                break
-            self.pump_lock.release()
-            time.sleep(0.001)
+        self.pump_lock.acquire()
+        while not self.pump:
+            self.pump_cond.wait()
+        self.pump_lock.release()
 
         self.running_lock.release()
 
@@ -237,10 +761,23 @@ class EventMachine(object):
         self.running = False
         self.running_lock.release()
 
-        while True:
-            self.pump_lock.acquire()
-            if not self.pump:
-                self.pump_lock.release()
-                break
-            self.pump_lock.release()
-            time.sleep(0.001)
+        self.pump_lock.acquire()
+        while self.pump:
+            self.pump_cond.wait()
+        self.pump_lock.release()
+
+        # Dispatchers finish what is queued, then exit on the sentinels
+        for i in range(self.dispatchers):
+            self.queue.put(None)
+        self.pump_lock.acquire()
+        while self.dispatching:
+            self.pump_cond.wait()
+        self.pump_lock.release()
+
+        # The writer goes last, callbacks may still have been sending. It
+        # drains the queue first: the sentinel sorts after every priority.
+        self.write_queue.put((sys.maxint, self.write_seq.next(), None, 0))
+        self.pump_lock.acquire()
+        while self.writing:
+            self.pump_cond.wait()
+        self.pump_lock.release()
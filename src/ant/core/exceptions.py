@@ -44,3 +44,17 @@ class NodeError(ANTException):
 
 class ChannelError(ANTException):
     pass
+
+
+class TimeoutError(ANTException):
+    pass
+
+
+class CancelledError(ANTException):
+    pass
+
+
+class FSError(ANTException):
+    def __init__(self, msg, code=None):
+        Exception.__init__(self, msg)
+        self.code = code
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+"""
+ANT-LOG version 2: decoded frames, stored in indexed blocks.
+
+    header   ['ANT-LOG', 0x02]
+    block*   [record, ...]
+    footer   ['ANT-LOG-INDEX', [summary, ...]]
+    trailer  footer offset (uint64, little endian) + 'ALX2'
+
+Each record is [direction, wall_us, mono_us, msg_id, channel,
+device_number, device_type, transmission_type, frame], direction being
+log.EVENT_READ or log.EVENT_WRITE. Channel and device fields are None where
+the message does not carry them. Each block summary is [offset, count,
+first_wall_us, last_wall_us, channels, msg_ids, device_numbers], so queries
+only unpack the blocks that can match. A log without a footer (the writer
+died) is still readable, its blocks are summarized by scanning the file.
+"""
+
+import bisect
+import collections
+import struct
+import thread
+import time
+
+import msgpack
+
+from ant.core.event import FrameScanner
+from ant.core.exceptions import MessageError
+from ant.core.log import EVENT_READ, EVENT_WRITE, VERSION_SECONDS, \
+                         LogReader
+from ant.core.message import Message, ChannelMessage, ChannelData
+from ant.utils.clock import monotonic
+
+# Records per block
+BLOCK_SIZE = 1024
+
+HEADER = ['ANT-LOG', 0x02]
+FOOTER_MAGIC = 'ANT-LOG-INDEX'
+TRAILER = struct.Struct('<Q4s')
+TRAILER_MAGIC = 'ALX2'
+
+LogRecord = collections.namedtuple('LogRecord', [
+    'direction', 'wall_us', 'mono_us', 'msg_id', 'channel', 'device_number',
+    'device_type', 'transmission_type', 'frame'])
+
+
+def describeFrame(frame, decoder=None):
+    """(msg_id, channel, device_number, device_type, transmission_type)"""
+    if decoder is None:
+        decoder = Message()
+    msg_id = ord(frame[2])
+    try:
+        msg = decoder.getHandler(frame)
+    except MessageError:
+        return (msg_id, None, None, None, None)
+
+    channel = None
+    if isinstance(msg, ChannelMessage):
+        channel = msg.getChannelNumber()
+    if isinstance(msg, ChannelData):
+        return (msg_id, channel, msg.getDeviceNumber(), msg.getDeviceType(),
+                msg.getTransmissionType())
+    return (msg_id, channel, None, None, None)
+
+
+def summarizeBlock(offset, records):
+    channels = set()
+    msg_ids = set()
+    devices = set()
+    for record in records:
+        msg_ids.add(record[3])
+        if record[4] is not None:
+            channels.add(record[4])
+        if record[5] is not None:
+            devices.add(record[5])
+    return [offset, len(records), records[0][1], records[-1][1],
+            sorted(channels), sorted(msg_ids), sorted(devices)]
+
+
+class IndexedLogWriter(object):
+    """
+    Writes a v2 log. It has the LogWriter interface, so it can be handed
+    to a Driver as its log: the read and write streams are cut into frames
+    as they arrive.
+    """
+    def __init__(self, filename, block_size=BLOCK_SIZE):
+        self.packer = msgpack.Packer()
+        self.lock = thread.allocate_lock()
+        self.block_size = block_size
+        self.is_open = False
+        self.open(filename)
+
+    def __del__(self):
+        if self.is_open:
+            self.close()
+
+    def open(self, filename):
+        if self.is_open:
+            self.close()
+
+        self.filename = filename
+        self.fd = open(filename, 'wb')
+        self.is_open = True
+        self.decoder = Message()
+        self.scanners = {EVENT_READ: FrameScanner(),
+                         EVENT_WRITE: FrameScanner()}
+        self.block = []
+        self.summaries = []
+        self.frames = 0
+        self.fd.write(self.packer.pack(HEADER))
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.lock.acquire()
+        try:
+            self._writeBlock()
+            offset = self.fd.tell()
+            self.fd.write(self.packer.pack([FOOTER_MAGIC, self.summaries]))
+            self.fd.write(TRAILER.pack(offset, TRAILER_MAGIC))
+            self.fd.close()
+            self.is_open = False
+        finally:
+            self.lock.release()
+
+    def logOpen(self):
+        pass
+
+    def logClose(self):
+        pass
+
+    def logRead(self, data, timestamp=None):
+        self._logData(EVENT_READ, data, timestamp)
+
+    def logWrite(self, data, timestamp=None):
+        self._logData(EVENT_WRITE, data, timestamp)
+
+    def logFrame(self, direction, frame, timestamp=None):
+        """Log one complete frame; timestamp is a (wall_us, mono_us) pair."""
+        if timestamp is None:
+            timestamp = self._now()
+        self.lock.acquire()
+        try:
+            self._record(direction, frame, timestamp)
+        finally:
+            self.lock.release()
+
+    def _now(self):
+        return (int(time.time() * 1000000), int(monotonic() * 1000000))
+
+    def _logData(self, direction, data, timestamp):
+        if len(data) == 0:
+            return
+        if timestamp is None:
+            timestamp = self._now()
+        self.lock.acquire()
+        try:
+            scanner = self.scanners[direction]
+            scanner.feed(data)
+            for frame in scanner:
+                self._record(direction, frame.tobytes(), timestamp)
+        finally:
+            self.lock.release()
+
+    def _record(self, direction, frame, timestamp):
+        self.frames += 1
+        self.block.append((direction, timestamp[0], timestamp[1]) +
+                          describeFrame(frame, self.decoder) + (frame,))
+        if len(self.block) >= self.block_size:
+            self._writeBlock()
+
+    def _writeBlock(self):
+        if not self.block:
+            return
+        self.summaries.append(summarizeBlock(self.fd.tell(), self.block))
+        self.fd.write(self.packer.pack(self.block))
+        self.block = []
+
+
+class IndexedLogReader(object):
+    def __init__(self, filename):
+        self.is_open = False
+        self.open(filename)
+
+    def __del__(self):
+        if self.is_open:
+            self.fd.close()
+
+    def open(self, filename):
+        if self.is_open:
+            self.close()
+
+        self.filename = filename
+        self.fd = open(filename, 'rb')
+        self.is_open = True
+
+        unpacker = msgpack.Unpacker(self.fd)
+        try:
+            header = unpacker.unpack()
+        except (StopIteration, msgpack.OutOfData):
+            header = None
+        if header != HEADER:
+            raise IOError('Could not open log file (unknown format).')
+        self.summaries = self._readFooter()
+        if self.summaries is None:
+            self.summaries = self._scanBlocks(unpacker)
+
+    def close(self):
+        if self.is_open:
+            self.fd.close()
+            self.is_open = False
+
+    def __iter__(self):
+        return self.query()
+
+    def query(self, start=None, end=None, channel=None, msg_id=None,
+              device_number=None, direction=None):
+        """
+        Yield the LogRecords logged between start and end (wall clock
+        seconds, inclusive) that match every criterion given.
+        """
+        start_us = None if start is None else int(start * 1000000)
+        end_us = None if end is None else int(end * 1000000)
+
+        for summary in self.summaries:
+            offset, count, first, last, channels, msg_ids, devices = summary
+            if start_us is not None and last < start_us or \
+               end_us is not None and first > end_us or \
+               channel is not None and not self._has(channels, channel) or \
+               msg_id is not None and not self._has(msg_ids, msg_id) or \
+               device_number is not None and \
+               not self._has(devices, device_number):
+                continue
+
+            for record in self._readBlock(offset):
+                record = LogRecord(*record)
+                if start_us is not None and record.wall_us < start_us or \
+                   end_us is not None and record.wall_us > end_us or \
+                   channel is not None and record.channel != channel or \
+                   msg_id is not None and record.msg_id != msg_id or \
+                   device_number is not None and \
+                   record.device_number != device_number or \
+                   direction is not None and record.direction != direction:
+                    continue
+                yield record
+
+    def _has(self, values, value):
+        i = bisect.bisect_left(values, value)
+        return i < len(values) and values[i] == value
+
+    def _readBlock(self, offset):
+        self.fd.seek(offset)
+        return msgpack.Unpacker(self.fd).unpack()
+
+    def _readFooter(self):
+        self.fd.seek(0, 2)
+        size = self.fd.tell()
+        if size < TRAILER.size:
+            return None
+        self.fd.seek(size - TRAILER.size)
+        offset, magic = TRAILER.unpack(self.fd.read(TRAILER.size))
+        if magic != TRAILER_MAGIC or offset >= size:
+            return None
+        self.fd.seek(offset)
+        try:
+            footer = msgpack.Unpacker(self.fd).unpack()
+        except (StopIteration, msgpack.OutOfData, ValueError):
+            return None
+        if len(footer) != 2 or footer[0] != FOOTER_MAGIC:
+            return None
+        return footer[1]
+
+    def _scanBlocks(self, unpacker):
+        summaries = []
+        offset = unpacker.tell()
+        while True:
+            try:
+                block = unpacker.unpack()
+            except (StopIteration, msgpack.OutOfData, ValueError):
+                break
+            if not isinstance(block, list) or not block or \
+               not isinstance(block[0], list):
+                break  # the footer, or garbage left by a crash
+            summaries.append(summarizeBlock(offset, block))
+            offset = unpacker.tell()
+        return summaries
+
+
+def convertLog(source, destination, block_size=BLOCK_SIZE):
+    """
+    Convert a log of raw read/write chunks (version 1 or 3) to version 2.
+    Returns the number of frames written.
+    """
+    reader = LogReader(source)
+    writer = IndexedLogWriter(destination, block_size)
+    try:
+        for event in reader:
+            if event[0] not in (EVENT_READ, EVENT_WRITE):
+                continue
+            if reader.version == VERSION_SECONDS:
+                # No monotonic stamps in these: whole seconds only
+                timestamp = (event[1] * 1000000, event[1] * 1000000)
+            else:
+                timestamp = tuple(event[1])
+            writer._logData(event[0], event[2], timestamp)
+    finally:
+        writer.close()
+        reader.close()
+    return writer.frames
@@ -23,16 +23,54 @@
 #
 ##############################################################################
 
+import Queue
+import bisect
+import os
+import thread
+import threading
 import time
 import datetime
 
 import msgpack
 
+from ant.utils.clock import monotonic
+
 EVENT_OPEN = 0x01
 EVENT_CLOSE = 0x02
 EVENT_READ = 0x03
 EVENT_WRITE = 0x04
 
+# Logs start with a [MAGIC, version] header. Version 1 events are stamped
+# with whole seconds, version 3 events with a [wall clock, monotonic] pair
+# of microsecond timestamps. Version 2 is the frame log of indexedlog.
+MAGIC = 'ANT-LOG'
+VERSION_SECONDS = 0x01
+VERSION_MICROSECONDS = 0x03
+
+# Bytes read from disk at a time while streaming a log
+READ_SIZE = 64 * 1024
+# Seconds of log between two entries of the sparse time index
+INDEX_INTERVAL = 60
+# LogWriter defaults: bytes kept in memory, and seconds, between flushes
+BATCH_SIZE = 64 * 1024
+FLUSH_INTERVAL = 1.0
+
+
+def indexName(filename):
+    """The sparse time index kept alongside a log file."""
+    return filename + '.idx'
+
+
+def eventTime(event):
+    """
+    Wall clock time of a log event, in seconds. Events carry either whole
+    seconds or a [wall, monotonic] pair of microsecond timestamps.
+    """
+    timestamp = event[1]
+    if isinstance(timestamp, (list, tuple)):
+        return timestamp[0] / 1000000.0
+    return timestamp
+
 
 class LogReader(object):
     def __init__(self, filename):
@@ -47,17 +85,17 @@ class LogReader(object):
         if self.is_open == True:
             self.close()
 
-        self.fd = open(filename, 'r')
+        self.filename = filename
+        self.fd = open(filename, 'rb')
         self.is_open = True
-        self.unpacker = msgpack.Unpacker()
-
-        # Here be dragons
-        self.unpacker.feed(self.fd.read())
-        self.fd.close()
+        self.index = None
+        self._rewind(0)
 
-        header = self.unpacker.unpack()
-        if len(header) != 2 or header[0] != 'ANT-LOG' or header[1] != 0x01:
+        header = self.read()
+        if header is None or len(header) != 2 or header[0] != MAGIC or \
+           header[1] not in (VERSION_SECONDS, VERSION_MICROSECONDS):
             raise IOError('Could not open log file (unknown format).')
+        self.version = header[1]
 
     def close(self):
         if self.is_open:
@@ -65,51 +103,257 @@ class LogReader(object):
             self.is_open = False
 
     def read(self):
+        if self.pending is not None:
+            event, self.pending = self.pending, None
+            return event
         try:
             return self.unpacker.unpack()
-        except StopIteration:
+        except (StopIteration, msgpack.OutOfData):
             return None
 
+    def __iter__(self):
+        event = self.read()
+        while event is not None:
+            yield event
+            event = self.read()
+
+    def seekToTime(self, timestamp):
+        """
+        Position the reader on the first event logged at or after
+        timestamp. Uses the sparse index if the log has one, so only the
+        records since the closest preceding index entry are scanned.
+        """
+        if self.index is None:
+            self.index = self._loadIndex()
+
+        times = [entry[0] for entry in self.index]
+        i = bisect.bisect_right(times, timestamp) - 1
+        if i >= 0:
+            self._rewind(self.index[i][1])
+        else:
+            self._rewind(0)
+            self.read()  # header
+
+        event = self.read()
+        while event is not None and self.eventTime(event) < timestamp:
+            event = self.read()
+        self.pending = event
+
+    def eventTime(self, event):
+        """Wall clock time of one of this log's events, in seconds."""
+        if self.version == VERSION_SECONDS:
+            return event[1]
+        return event[1][0] / 1000000.0
+
+    def _rewind(self, offset):
+        self.fd.seek(offset)
+        self.unpacker = msgpack.Unpacker(self.fd, read_size=READ_SIZE)
+        self.pending = None
+
+    def _loadIndex(self):
+        try:
+            fd = open(indexName(self.filename), 'rb')
+        except IOError:
+            return []
+        try:
+            # Entries are [timestamp, file offset of the first record at it]
+            return [entry for entry in msgpack.Unpacker(fd)]
+        except Exception:
+            return []  # A damaged index only makes seeking slower
+        finally:
+            fd.close()
+
 
 class LogWriter(object):
-    def __init__(self, filename=''):
+    """
+    Events are stamped with a [wall clock, monotonic] pair of microsecond
+    timestamps and packed into an in-memory batch, written out once it
+    holds batch_size bytes or is flush_interval seconds old. If max_size
+    (bytes) or max_age (seconds) is given, the log moves on to a new file
+    (name.1.ant, name.2.ant, ...) when the current one gets that big or
+    old. With background=True, events are handed to a writer thread, so
+    logging costs the caller no more than a queue put; otherwise a timer
+    writes out batches left behind once events stop. index=False skips
+    the sparse time index (name.ant.idx) LogReader.seekToTime() uses.
+    """
+    def __init__(self, filename='', batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, max_size=None, max_age=None,
+                 background=False, index=True):
         self.packer = msgpack.Packer()
+        self.lock = thread.allocate_lock()  # reads and writes log concurrently
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.max_age = max_age
+        self.background = background
+        self.index = index
+        self.timer = None  # idle flush of the foreground path
         self.is_open = False
         self.open(filename)
 
     def __del__(self):
         if self.is_open:
-            self.fd.close()
+            self.close()
 
     def open(self, filename=''):
         if filename == '':
             filename = datetime.datetime.now().isoformat() + '.ant'
-        self.filename = filename
 
         if self.is_open == True:
             self.close()
 
-        self.fd = open(filename, 'w')
+        self.filename = filename
+        self.filenames = []
+        self._openFile(filename)
         self.is_open = True
-        self.packer = msgpack.Packer()
 
-        header = ['ANT-LOG', 0x01]  # [MAGIC, VERSION]
-        self.fd.write(self.packer.pack(header))
+        if self.background:
+            self.queue = Queue.Queue()
+            self.writer_done = threading.Event()
+            thread.start_new_thread(self._writer, ())
 
     def close(self):
-        if self.is_open:
-            self.fd.close()
+        if not self.is_open:
+            return
+        if self.background:
+            self.queue.put(None)
+            self.writer_done.wait()
+
+        self.lock.acquire()
+        try:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self._closeFile()
             self.is_open = False
+        finally:
+            self.lock.release()
+
+    def flush(self):
+        self.lock.acquire()
+        try:
+            self._flush()
+        finally:
+            self.lock.release()
 
     def _logEvent(self, event, data=None):
-        ev = [event, int(time.time()), data]
+        if data is not None and len(data) == 0:
+            return
 
-        if data is None:
-            ev = ev[0:-1]
-        elif len(data) == 0:
+        wall = int(time.time() * 1000000)
+        mono = int(monotonic() * 1000000)
+        if self.background:
+            self.queue.put((event, wall, mono, data))
             return
 
-        self.fd.write(self.packer.pack(ev))
+        self.lock.acquire()
+        try:
+            self._record(event, wall, mono, data)
+            if self.buffer and self.timer is None:
+                self.timer = threading.Timer(self.flush_interval,
+                                             self._idleFlush)
+                self.timer.daemon = True
+                self.timer.start()
+        finally:
+            self.lock.release()
+
+    def _idleFlush(self):
+        self.lock.acquire()
+        try:
+            self.timer = None
+            if self.is_open and self.buffer:
+                self._flush()
+        except Exception, e:
+            print e
+        finally:
+            self.lock.release()
+
+    def _writer(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except Queue.Empty:
+                item = ()
+            if item is None:
+                break
+
+            self.lock.acquire()
+            try:
+                if item:
+                    self._record(*item)
+                elif self.buffer:
+                    self._flush()  # Idle, don't sit on a partial batch
+            except Exception, e:
+                print e
+            finally:
+                self.lock.release()
+        self.writer_done.set()
+
+    def _record(self, event, wall, mono, data):
+        if self.max_size is not None and self.offset >= self.max_size or \
+           self.max_age is not None and \
+           monotonic() - self.opened >= self.max_age:
+            self._rotate()
+
+        seconds = wall / 1000000.0
+        if self.index_fd is not None and \
+           (self.next_index is None or seconds >= self.next_index):
+            self.index_buffer.append(self.packer.pack([seconds, self.offset]))
+            self.next_index = seconds + INDEX_INTERVAL
+
+        ev = [event, [wall, mono]]
+        if data is not None:
+            ev.append(data)
+        self._append(self.packer.pack(ev))
+
+        if self.buffered >= self.batch_size or \
+           monotonic() - self.flushed >= self.flush_interval:
+            self._flush()
+
+    def _append(self, packed):
+        self.buffer.append(packed)
+        self.buffered += len(packed)
+        self.offset += len(packed)
+
+    def _flush(self):
+        if self.buffer:
+            self.fd.write(''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+        self.fd.flush()
+        if self.index_fd is not None:
+            if self.index_buffer:
+                self.index_fd.write(''.join(self.index_buffer))
+                self.index_buffer = []
+            self.index_fd.flush()
+        self.flushed = monotonic()
+
+    def _openFile(self, filename):
+        self.fd = open(filename, 'wb')
+        self.index_fd = None
+        if self.index:
+            self.index_fd = open(indexName(filename), 'wb')
+        self.filenames.append(filename)
+        self.buffer = []
+        self.buffered = 0
+        self.index_buffer = []
+        self.next_index = None
+        self.offset = 0
+        self.opened = self.flushed = monotonic()
+
+        header = [MAGIC, VERSION_MICROSECONDS]
+        self._append(self.packer.pack(header))
+
+    def _closeFile(self):
+        self._flush()
+        self.fd.close()
+        if self.index_fd is not None:
+            self.index_fd.close()
+
+    def _rotate(self):
+        self._closeFile()
+        root, ext = os.path.splitext(self.filename)
+        self._openFile('%s.%d%s' % (root, len(self.filenames), ext))
 
     def logOpen(self):
         self._logEvent(EVENT_OPEN)
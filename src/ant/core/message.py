@@ -23,32 +23,73 @@
 #
 ##############################################################################
 
+import collections
+import operator
 import struct
 
 from ant.core.exceptions import MessageError
 from ant.core.constants import *
- 
-def convertBytes(bytes):
-    if len(bytes) == 1:
-        return ord(bytes[0])
-    elif len(bytes) == 2:
-        data_string = ''.join(bytes)
-        return struct.unpack('<H', data_string)[0]
-    else: 
-        raise ValueError('Unsupported number of bytes')
+
+FRAME_INCOMPLETE = 0
+FRAME_CORRUPT = -1
+
+
+def computeChecksum(data, checksum=0x00):
+    """
+    XOR checksum of data (str, bytearray or memoryview), seeded with
+    checksum. XOR-ing a whole frame, checksum included, yields zero.
+    """
+    if not isinstance(data, bytearray):
+        data = bytearray(data)
+    return reduce(operator.xor, data, checksum)
+
+
+def validateFrame(buf, offset=0):
+    """
+    Check the frame starting at buf[offset] without decoding it.
+
+    Returns the size of the frame if it is complete and intact,
+    FRAME_INCOMPLETE if more data is needed or FRAME_CORRUPT if the sync
+    byte, length or checksum are wrong. buf should be a bytearray, other
+    buffers are copied first.
+    """
+    if not isinstance(buf, bytearray):
+        buf = bytearray(buf[offset:])
+        offset = 0
+
+    available = len(buf) - offset
+    if available < 1:
+        return FRAME_INCOMPLETE
+    sync = buf[offset]
+    if sync != MESSAGE_TX_SYNC and sync != MESSAGE_TX_SYNC_LSB:
+        return FRAME_CORRUPT
+    if available < 4:
+        return FRAME_INCOMPLETE
+    length = buf[offset + 1]
+    if length > MAX_MESSAGE_LENGTH:
+        return FRAME_CORRUPT
+    size = length + 4
+    if available < size:
+        return FRAME_INCOMPLETE
+    if reduce(operator.xor, buf[offset:offset + size], 0x00) != 0x00:
+        return FRAME_CORRUPT
+
+    return size
 
 
 class Message(object):
+    __slots__ = ('type_', 'sync', 'payload')
+
     def __init__(self, type_=0x00, payload='',sync= MESSAGE_TX_SYNC):
         self.setType(type_)
         self.setPayload(payload)
         self.setSync(sync)
 
     def getPayload(self):
-        return ''.join(self.payload)
+        return str(self.payload)
 
     def getPayloadAsList(self):
-        return self.payload
+        return list(str(self.payload))
 
     def setPayload(self, payload):
         if len(payload) > 9:
@@ -56,18 +97,17 @@ class Message(object):
             #      'Could not set payload (payload too long).')
             pass
 
-        self.payload = []
-        for byte in payload:
-            self.payload += byte
+        if isinstance(payload, list):
+            payload = ''.join(payload)
+        self.payload = bytearray(payload)
 
     def getRawData(self):
         payload = self.getPayload()[1:9]
         return payload
 
     def setRawData(self,raw):
-        payload = self.getPayloadAsList()
-        payload[1:9] = raw
-        self.setPayload(payload)
+        self.payload[1:9] = raw
+        self.update()
 
     def getType(self):
         return self.type_
@@ -87,35 +127,25 @@ class Message(object):
         self.sync = sync    
 
     def getChecksum(self):
-        data = chr(len(self.getPayload()))
-        data += chr(self.getType())
-        data += self.getPayload()
-
-        checksum = self.getSync()
-        for byte in data:
-            checksum = (checksum ^ ord(byte)) % 0xFF
-
-        return checksum
+        payload = self.payload
+        return computeChecksum(payload, self.sync ^ len(payload) ^ self.type_)
 
 
     def getSize(self):
-        return len(self.getPayload()) + 4
+        return len(self.payload) + 4
 
     def encode(self):
-        raw = struct.pack('BBB',
-                          self.getSync(),
-                          len(self.getPayload()),
-                          self.getType())
-        raw += self.getPayload()
-        raw += chr(self.getChecksum())
+        raw = bytearray((self.sync, len(self.payload), self.type_))
+        raw += self.payload
+        raw.append(computeChecksum(raw))
 
-        return raw
+        return str(raw)
 
     def decode(self, raw):
         if len(raw) < 5:
             raise MessageError('Could not decode (message is incomplete).')
 
-        sync, length, type_ = struct.unpack('BBB', raw[:3])
+        sync, length, type_ = struct.unpack_from('BBB', raw)
 
         if sync != MESSAGE_TX_SYNC and sync != MESSAGE_TX_SYNC_LSB:
             raise MessageError('Could not decode (expected TX sync).')
@@ -130,122 +160,53 @@ class Message(object):
         self.setPayload(raw[3:length + 3])
         self.setSync(sync)
 
-        if self.getChecksum() != ord(raw[length + 3]):
+        if self.getChecksum() != struct.unpack_from('B', raw, length + 3)[0]:
             raise MessageError('Could not decode (bad checksum).',
                                internal='CHECKSUM')
 
         return self.getSize()
 
-    def _getBurstMsg(self):
-        format = self.getFormat()
-        if format == MessageFormat.EXTENDED:
-            msg = ExtendedChannelBurstDataMessage()
-        else:
-            msg = ChannelBurstDataMessage() 
-        return msg
-
-    def _getBroadcastMessage(self):
-        format = self.getFormat()
-        if format == MessageFormat.EXTENDED:
-            msg = ExtendedChannelBroadcastDataMessage()
-        else:
-            msg = ChannelBroadcastDataMessage()
-        return msg
-
-    def _getAckDataMessage(self):
-        format = self.getFormat()
-        if format == MessageFormat.EXTENDED:
-            msg = ExtendedChannelAcknowledgedDataMessage()
-        else:
-            msg = ChannelAcknowledgedDataMessage() 
-        return msg           
-
     def getFormat(self):
-        length = len(self.getPayloadAsList())
+        length = len(self.payload)
         format = MessageFormat.LEGACY
         if length > MESSAGE_LENGTH_LEGACY:
             format = MessageFormat.EXTENDED
         return format
 
+    def update(self):
+        # Hook for subclasses deriving state from the payload
+        pass
+
     def getHandler(self, raw=None):
         if raw:
             self.decode(raw)
 
-        msg = None
-        if self.type_ == MESSAGE_CHANNEL_UNASSIGN:
-            msg = ChannelUnassignMessage()
-        elif self.type_ == MESSAGE_CHANNEL_ASSIGN:
-            msg = ChannelAssignMessage()
-        elif self.type_ == MESSAGE_CHANNEL_ID:
-            msg = ChannelIDMessage()
-        elif self.type_ == MESSAGE_CHANNEL_PERIOD:
-            msg = ChannelPeriodMessage()
-        elif self.type_ == MESSAGE_CHANNEL_SEARCH_TIMEOUT:
-            msg = ChannelSearchTimeoutMessage()
-        elif self.type_ == MESSAGE_CHANNEL_FREQUENCY:
-            msg = ChannelFrequencyMessage()
-        elif self.type_ == MESSAGE_CHANNEL_TX_POWER:
-            msg = ChannelTXPowerMessage()
-        elif self.type_ == MESSAGE_NETWORK_KEY:
-            msg = NetworkKeyMessage()
-        elif self.type_ == MESSAGE_TX_POWER:
-            msg = TXPowerMessage()
-        elif self.type_ == MESSAGE_SYSTEM_RESET:
-            msg = SystemResetMessage()
-        elif self.type_ == MESSAGE_CHANNEL_OPEN:
-            msg = ChannelOpenMessage()
-        elif self.type_ == MESSAGE_CHANNEL_CLOSE:
-            msg = ChannelCloseMessage()
-        elif self.type_ == MESSAGE_CHANNEL_REQUEST:
-            msg = ChannelRequestMessage()
-        elif self.type_ == MESSAGE_CHANNEL_BROADCAST_DATA:
-            msg = self._getBroadcastMessage()
-        elif self.type_ == MESSAGE_CHANNEL_ACKNOWLEDGED_DATA:
-            msg = self._getAckDataMessage()
-        elif self.type_ == MESSAGE_CHANNEL_BURST_DATA:
-            msg = self._getBurstMsg()
-        elif self.type_ == MESSAGE_CHANNEL_EXTENDED_BROADCAST_DATA:
-            msg = LegacyChannelBroadcastDataMessage()
-        elif self.type_ == MESSAGE_CHANNEL_EXTENDED_ACKNOWLEDGED_DATA:
-            msg = LegacyChannelAcknowledgedDataMessage()
-        elif self.type_ == MESSAGE_CHANNEL_EXTENDED_BURST_DATA:
-            msg = LegacyChannelBurstDataMessage()
-        elif self.type_ == MESSAGE_CHANNEL_EVENT:
-            msg = ChannelEventMessage()
-        elif self.type_ == MESSAGE_CHANNEL_STATUS:
-            msg = ChannelStatusMessage()
-        elif self.type_ == MESSAGE_VERSION:
-            msg = VersionMessage()
-        elif self.type_ == MESSAGE_CAPABILITIES:
-            msg = CapabilitiesMessage()
-        elif self.type_ == MESSAGE_SERIAL_NUMBER:
-            msg = SerialNumberMessage()
-        elif self.type_ == MESSAGE_STARTUP:
-            msg = StartupMessage()
-        else:
+        handlers = _handlers.get(self.type_)
+        if handlers is not None:
+            class_ = handlers.get(self.getFormat()) or \
+                     handlers.get(MessageFormat.LEGACY)
+        if handlers is None or class_ is None:
             raise MessageError('Could not find message handler ' \
                                '(unknown message type).', internal = 'UNKNOWN_MESSAGE_TYPE')
 
-        msg.setPayload(self.getPayload())
+        # Build the handler straight from the decoded frame, skipping the
+        # defaults its constructor would set up
+        msg = class_.__new__(class_)
+        msg.type_ = self.type_
+        msg.sync = self.sync
+        msg.payload = self.payload[:]
+        msg.update()
         return msg
 
 
-class IncompleteReadException(Exception):
+class IncompleteReadException(MessageError):
+    """Extended data announced by the flag byte is missing."""
     pass
 
-class TrackedBuffer(object):
-    def __init__(self, payload):
-        self.payload = payload
-        self.index = 0
-
-    def read(self, length):
-        if self.index + length > len(self.payload):
-            raise IncompleteReadException("Too few bytes for requested read")
-        rtn = self.payload[self.index:self.index+length]
-        self.index += length
-        return rtn
-
 class ChannelData(object):
+    # Storage is provided by the message classes mixing this in
+    __slots__ = ()
+
     def __init__(self,device_number=None, device_type=None, transmission_type=None):
         self.device_number = device_number
         self.device_type = device_type
@@ -270,6 +231,9 @@ class ChannelData(object):
         self.transmission_type = trans_type   
 
 class ExtendedMessage(Message,ChannelData):
+    __slots__ = ('device_number', 'device_type', 'transmission_type', 'flag',
+                 'rssi_type', 'rssi_value', 'rssi_threshold', 'timestamp')
+
     def __init__(self, type_=0x00, payload='\x00'*11,sync= MESSAGE_TX_SYNC):
         Message.__init__(self,type_=type_,payload=payload,sync=sync)
         self.flag = None    
@@ -283,66 +247,45 @@ class ExtendedMessage(Message,ChannelData):
         self.update()
 
     def update(self):
-        payload = self.getPayloadAsList()
-        
+        payload = self.payload
+
         if len(payload) < 10:
             raise MessageError('Too few bytes for an extended message (too few bytes)')
 
-        flag = convertBytes(payload[9:10])
-        self.setFlag(flag)
+        flag = payload[9]
+        self.flag = flag
+        self.device_number = None
+        self.device_type = None
+        self.transmission_type = None
+        self.rssi_type = None
+        self.rssi_value = None
+        self.rssi_threshold = None
+        self.timestamp = None
 
         # start at first byte of extended data
-        extended_data = TrackedBuffer(payload[10:])
-        if flag & ExtendedMessageFlags.ENABLE_CHANNEL_ID == ExtendedMessageFlags.ENABLE_CHANNEL_ID:
-            # piggy back ChannelIDMessage
-            #id_message = ChannelIDMessage()
-
-            #dummy_payload = []
-            #payload = self.getPayloadAsList()
-            
-            #include channel id
-            #dummy_payload.extend(payload[:ElementSize.CHANNEL_ID])
-
-            # include actual data 
-            #length =  ElementSize.DEVICE_NUMBER + ElementSize.DEVICE_TYPE + ElementSize.TRANSMISSION_TYPE
-            #dummy_payload.extend(extended_data.read(length))
-
-            #id_message.setPayload(dummy_payload)
-            
-            device_number = convertBytes(extended_data.read(ElementSize.DEVICE_NUMBER))
-            self.setDeviceNumber(device_number)
-
-            device_type = convertBytes(extended_data.read(ElementSize.DEVICE_TYPE))
-            self.setDeviceType(device_type)
-            
-            transmission_type = convertBytes(extended_data.read(ElementSize.TRANSMISSION_TYPE))
-            self.setTransmissionType(transmission_type)
-
-        if flag & ExtendedMessageFlags.ENABLE_RSSI_OUTPUT == ExtendedMessageFlags.ENABLE_RSSI_OUTPUT:
-            rssi_type = convertBytes(extended_data.read(ElementSize.RSSI_MEASUREMENT_TYPE))
-            self.setRssiType(rssi_type)
-
-            rssi_value = convertBytes(extended_data.read(ElementSize.RSSI_VALUE))
-            self.setRssiValue(rssi_value)
-
-            rssi_threshold = convertBytes(extended_data.read(ElementSize.RSSI_THRESHOLD_CONFIG))
-            self.setRssiThreshold(rssi_threshold)
-
-        if flag & ExtendedMessageFlags.ENABLE_RX_TIMESTAMP == ExtendedMessageFlags.ENABLE_RX_TIMESTAMP:
-            timestamp = convertBytes(extended_data.read(ElementSize.RX_TIMESTAMP))
-            self.setTimestamp(timestamp)
-
-    
-    def decode(self,raw):
-        size = Message.decode(self,raw)
-        
-        self.update()
-
-        return size
+        offset = 10
+        try:
+            if flag & ExtendedMessageFlags.ENABLE_CHANNEL_ID == ExtendedMessageFlags.ENABLE_CHANNEL_ID:
+                self.device_number, self.device_type, self.transmission_type = \
+                    struct.unpack_from('<HBB', payload, offset)
+                offset += ElementSize.DEVICE_NUMBER + ElementSize.DEVICE_TYPE + \
+                          ElementSize.TRANSMISSION_TYPE
+
+            if flag & ExtendedMessageFlags.ENABLE_RSSI_OUTPUT == ExtendedMessageFlags.ENABLE_RSSI_OUTPUT:
+                self.rssi_type, self.rssi_value, self.rssi_threshold = \
+                    struct.unpack_from('BBB', payload, offset)
+                offset += ElementSize.RSSI_MEASUREMENT_TYPE + \
+                          ElementSize.RSSI_VALUE + \
+                          ElementSize.RSSI_THRESHOLD_CONFIG
+
+            if flag & ExtendedMessageFlags.ENABLE_RX_TIMESTAMP == ExtendedMessageFlags.ENABLE_RX_TIMESTAMP:
+                self.timestamp = struct.unpack_from('<H', payload, offset)[0]
+        except struct.error:
+            raise IncompleteReadException("Too few bytes for requested read")
 
     def encode(self):
-        payload = self.getPayload()[0:9]
-        msg = Message(type_=self.getType(),payload=payload,sync=self.getSync())
+        payload = self.payload[0:9]
+        msg = Message(type_=self.type_,payload=payload,sync=self.sync)
         raw = msg.encode()
         return raw                                                                    
 
@@ -379,121 +322,78 @@ class ExtendedMessage(Message,ChannelData):
     
 
 class LegacyExtendedMessage(Message, ChannelData):
+    __slots__ = ()
+
     def __init__(self, type_=0x00, payload='\x00'*13,sync= MESSAGE_TX_SYNC):
         Message.__init__(self,type_=type_,payload=payload,sync=sync)
-        self.device_number = 0x00
-        self.device_type = 0x00
-        self.transmission_type = 0x00
-
 
     def setPayload(self, payload, update=True):
         Message.setPayload(self,payload)
         if update:
             self.update()
 
-    def update(self):
-        payload = self.getPayloadAsList()
-               
-        extended_data = TrackedBuffer(payload[1:5])
-    
-        device_number = convertBytes(extended_data.read(ElementSize.DEVICE_NUMBER))
-        self.setDeviceNumber(device_number)
-
-        device_type = convertBytes(extended_data.read(ElementSize.DEVICE_TYPE))
-        self.setDeviceType(device_type)
-        
-        transmission_type = convertBytes(extended_data.read(ElementSize.TRANSMISSION_TYPE))
-        self.setTransmissionType(transmission_type)
-
-
-    def decode(self,raw):
-        size = Message.decode(self,raw)
-        self.update()
-
-        return size
-
     def encode(self):
-        payload = self.getPayload()
+        payload = self.payload
         if len(payload) != 13:
             raise MessageError('Length of payload doesn\'t match expected value')
 
-        #payload[1:3] = struct.pack('<H', self.getDeviceNumber())
-        #payload[4] = chr(self.getDeviceType())
-        #payload[5] = chr(self.getTransmissionType())
-        
-        raw = struct.pack('BBB',
-                          self.getSync(),
-                          len(payload),
-                          self.getType())
-        raw += payload
-        raw += chr(self.getChecksum())
-
-        return raw
+        return Message.encode(self)
 
     def setDeviceNumber(self, device_number):
-        payload = self.getPayloadAsList()
-        payload[1:3] = struct.pack('<H', device_number)
-        self.setPayload(payload,update=False)
-        
+        struct.pack_into('<H', self.payload, 1, device_number)
+
     def setDeviceType(self, device_type):
-        payload = self.getPayloadAsList()
-        payload[3] = chr(device_type)
-        self.setPayload(payload,update=False)
+        self.payload[3] = device_type
 
     def setTransmissionType(self, trans_type):
-        payload = self.getPayloadAsList()
-        payload[4] = chr(trans_type)
-        self.setPayload(payload,update=False)
+        self.payload[4] = trans_type
 
     def getDeviceNumber(self):
-        payload = self.getPayloadAsList()
-        return convertBytes(payload[1:3])
-        
+        return struct.unpack_from('<H', self.payload, 1)[0]
+
     def getDeviceType(self):
-        payload = self.getPayloadAsList()
-        return convertBytes(payload[3])
+        return self.payload[3]
 
     def getTransmissionType(self):
-        payload = self.getPayloadAsList()
-        return convertBytes(payload[4])
+        return self.payload[4]
 
     def getRawData(self):
         payload = self.getPayload()[5:]
         return payload
 
     def setRawData(self,raw):
-        payload = self.getPayloadAsList()
-        payload[5:] = raw
-        self.setPayload(payload)
-                    
+        self.payload[5:] = raw
+        self.update()
+
 
 class ChannelMessage(Message):
+    __slots__ = ()
+
     def __init__(self, type_, payload='', number=0x00):
         Message.__init__(self, type_, '\x00' + payload)
         self.setChannelNumber(number)
 
     def getChannelNumber(self):
-        payload = self.getPayloadAsList()
-        return ord(payload[0])
+        return self.payload[0]
 
     def setChannelNumber(self, number):
         if (number > 0xFF) or (number < 0x00):
             raise MessageError('Could not set channel number ' \
                                    '(out of range).')
-        payload = self.getPayloadAsList()
-        payload[0] = chr(number)
-        self.setPayload(payload)
+        self.payload[0] = number
 
 class LegacyChannelMessage(ChannelMessage, LegacyExtendedMessage):
-    pass
+    __slots__ = ()
 
 class ExtendedChannelMessage(ChannelMessage, ExtendedMessage):
-    pass
+    __slots__ = ()
 
 
 # Config messages
 
 class ChannelLibConfigMessage(Message):
+    __slots__ = ()
+
     def __init__(self, type_=MESSAGE_LIB_CONFIG, mask=ExtendedMessageFlags.ENABLE_RX_TIMESTAMP | ExtendedMessageFlags.ENABLE_CHANNEL_ID):
         #usb2 stick doesn't support rssi | ExtendedMessageFlags.ENABLE_RSSI_OUTPUT 
         # filler byte required
@@ -503,6 +403,8 @@ class ChannelLibConfigMessage(Message):
         
 
 class ChannelEnableExtendedMessage(Message):
+    __slots__ = ()
+
     def __init__(self, type_=MESSAGE_ENABLE_EXTENDED_MESSAGES, enable=True):
 
         enable_flag = 1
@@ -515,31 +417,37 @@ class ChannelEnableExtendedMessage(Message):
 
 
 class ChannelUnassignMessage(ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00):
         ChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_UNASSIGN,
                          number=number)
 
 
 class ChannelAssignMessage(ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, type_=0x00, network=0x00):
         payload = struct.pack('BB', type_, network)
         ChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_ASSIGN,
                                 payload=payload, number=number)
 
     def getChannelType(self):
-        return ord(self.payload[1])
+        return self.payload[1]
 
     def setChannelType(self, type_):
-        self.payload[1] = chr(type_)
+        self.payload[1] = type_
 
     def getNetworkNumber(self):
-        return ord(self.payload[2])
+        return self.payload[2]
 
     def setNetworkNumber(self, number):
-        self.payload[2] = chr(number)
+        self.payload[2] = number
 
 
 class ChannelIDMessage(ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, device_number=0x0000, device_type=0x00,
                  trans_type=0x00):
         ChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_ID,
@@ -549,195 +457,218 @@ class ChannelIDMessage(ChannelMessage):
         self.setTransmissionType(trans_type)
 
     def getDeviceNumber(self):
-        return struct.unpack('<H', self.getPayload()[1:3])[0]
+        return struct.unpack_from('<H', self.payload, 1)[0]
 
     def setDeviceNumber(self, device_number):
-        self.payload[1:3] = struct.pack('<H', device_number)
+        struct.pack_into('<H', self.payload, 1, device_number)
 
     def getDeviceType(self):
-        return ord(self.payload[3])
+        return self.payload[3]
 
     def setDeviceType(self, device_type):
-        self.payload[3] = chr(device_type)
+        self.payload[3] = device_type
 
     def getTransmissionType(self):
-        return ord(self.payload[4])
+        return self.payload[4]
 
     def setTransmissionType(self, trans_type):
-        self.payload[4] = chr(trans_type)
+        self.payload[4] = trans_type
 
 
 class ChannelPeriodMessage(ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, period=8192):
         ChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_PERIOD,
                                 payload='\x00' * 2, number=number)
         self.setChannelPeriod(period)
 
     def getChannelPeriod(self):
-        return struct.unpack('<H', self.getPayload()[1:3])[0]
+        return struct.unpack_from('<H', self.payload, 1)[0]
 
     def setChannelPeriod(self, period):
-        self.payload[1:3] = struct.pack('<H', period)
+        struct.pack_into('<H', self.payload, 1, period)
 
 
 class ChannelSearchTimeoutMessage(ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, timeout=0xFF):
         ChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_SEARCH_TIMEOUT,
                                 payload='\x00', number=number)
         self.setTimeout(timeout)
 
     def getTimeout(self):
-        return ord(self.payload[1])
+        return self.payload[1]
 
     def setTimeout(self, timeout):
-        self.payload[1] = chr(timeout)
+        self.payload[1] = timeout
 
 
 class ChannelFrequencyMessage(ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, frequency=66):
         ChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_FREQUENCY,
                                 payload='\x00', number=number)
         self.setFrequency(frequency)
 
     def getFrequency(self):
-        return ord(self.payload[1])
+        return self.payload[1]
 
     def setFrequency(self, frequency):
-        self.payload[1] = chr(frequency)
+        self.payload[1] = frequency
 
 
 class ChannelTXPowerMessage(ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, power=0x00):
         ChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_TX_POWER,
                                 payload='\x00', number=number)
 
     def getPower(self):
-        return ord(self.payload[1])
+        return self.payload[1]
 
     def setPower(self, power):
-        self.payload[1] = chr(power)
+        self.payload[1] = power
 
 
 class NetworkKeyMessage(Message):
+    __slots__ = ()
+
     def __init__(self, number=0x00, key='\x00' * 8):
         Message.__init__(self, type_=MESSAGE_NETWORK_KEY, payload='\x00' * 9)
         self.setNumber(number)
         self.setKey(key)
 
     def getNumber(self):
-        return ord(self.payload[0])
+        return self.payload[0]
 
     def setNumber(self, number):
-        self.payload[0] = chr(number)
+        self.payload[0] = number
 
     def getKey(self):
-        return self.getPayload()[1:]
+        return str(self.payload[1:])
 
     def setKey(self, key):
         self.payload[1:] = key
 
 
 class TXPowerMessage(Message):
+    __slots__ = ()
+
     def __init__(self, power=0x00):
         Message.__init__(self, type_=MESSAGE_TX_POWER, payload='\x00\x00')
         self.setPower(power)
 
     def getPower(self):
-        return ord(self.payload[1])
+        return self.payload[1]
 
     def setPower(self, power):
-        self.payload[1] = chr(power)
+        self.payload[1] = power
 
 
 # Control messages
 class SystemResetMessage(Message):
+    __slots__ = ()
+
     def __init__(self):
         Message.__init__(self, type_=MESSAGE_SYSTEM_RESET, payload='\x00')
 
 
 class ChannelOpenMessage(ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00):
         ChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_OPEN,
                                 number=number)
 
 class ChannelOpenRxScanMessage(ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00):
         ChannelMessage.__init__(self, type_=MESSAGE_OPEN_RX_SCAN,
                                 number=number)
 
 class ChannelCloseMessage(ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00):
         ChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_CLOSE,
                                 number=number)
 
 
 class ChannelRequestMessage(ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, message_id=MESSAGE_CHANNEL_STATUS):
         ChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_REQUEST,
                                 number=number, payload='\x00')
         self.setMessageID(message_id)
 
     def getMessageID(self):
-        return ord(self.payload[1])
+        return self.payload[1]
 
     def setMessageID(self, message_id):
         if (message_id > 0xFF) or (message_id < 0x00):
             raise MessageError('Could not set message ID ' \
                                    '(out of range).')
 
-        self.payload[1] = chr(message_id)
+        self.payload[1] = message_id
 
 
 class RequestMessage(ChannelRequestMessage):
-    pass
+    __slots__ = ()
 
 
 class BurstChannelMixin(object):
-    
+    __slots__ = ()
+
     CHANNEL_MASK = 0b11111
     SEQUENCE_MASK = 0b111 << 5
 
     def getChannelNumber(self):
-        payload = self.getPayloadAsList()
-        return ord(payload[0]) & BurstChannelMixin.CHANNEL_MASK
+        return self.payload[0] & BurstChannelMixin.CHANNEL_MASK
 
     def setChannelNumber(self, number):
         if (number > BurstChannelMixin.CHANNEL_MASK) or (number < 0x00):
             raise MessageError('Could not set channel number ' \
                                    '(out of range).')
-        payload = self.getPayloadAsList()
-        burstSequence = ord(payload[0]) & BurstChannelMixin.SEQUENCE_MASK
-        payload[0] = chr(number | burstSequence << 5)
-        self.setPayload(payload)
+        burstSequence = self.payload[0] & BurstChannelMixin.SEQUENCE_MASK
+        self.payload[0] = number | burstSequence
     
     def getSequenceCode(self):
-        payload = self.getPayloadAsList()
-        return ord(payload[0]) & BurstChannelMixin.SEQUENCE_MASK
+        return (self.payload[0] & BurstChannelMixin.SEQUENCE_MASK) >> 5
     
     def setSequenceCode(self, code):
         if (code > 0b111) or (code < 0x00):
             raise MessageError('Could not set sequence code ' \
                                    '(out of range).')
-        payload = self.getPayloadAsList()        
-        number = ord(payload[0]) & BurstChannelMixin.CHANNEL_MASK
-        payload[0] = chr(number | code << 5)
-        self.setPayload(payload)
+        number = self.payload[0] & BurstChannelMixin.CHANNEL_MASK
+        self.payload[0] = number | code << 5
         
 
 # Data messages
 class ChannelBroadcastDataMessage(ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, data='\x00' * 8):
         ChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_BROADCAST_DATA,
                                 payload=data, number=number)
 
 
 class ChannelAcknowledgedDataMessage(ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, data='\x00' * 8):
         ChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_ACKNOWLEDGED_DATA,
                                 payload=data, number=number)
 
 
 class ChannelBurstDataMessage(BurstChannelMixin,ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, data='\x00' * 8):
         ChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_BURST_DATA,
                                 payload=data, number=number)
@@ -745,16 +676,22 @@ class ChannelBurstDataMessage(BurstChannelMixin,ChannelMessage):
 #legacy extended data
 
 class LegacyChannelBroadcastDataMessage(LegacyChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, data='\x00' * 12):
         LegacyChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_EXTENDED_BROADCAST_DATA,
                                 payload=data, number=number)
 
 class LegacyChannelAcknowledgedDataMessage(LegacyChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, data='\x00' * 12):
         LegacyChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_EXTENDED_ACKNOWLEDGED_DATA,
                                 payload=data, number=number)
 
 class LegacyChannelBurstDataMessage(BurstChannelMixin,LegacyChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, data='\x00' * 12):
         LegacyChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_EXTENDED_BURST_DATA,
                                 payload=data, number=number)
@@ -762,18 +699,24 @@ class LegacyChannelBurstDataMessage(BurstChannelMixin,LegacyChannelMessage):
 #extended data
 
 class ExtendedChannelBroadcastDataMessage(ChannelBroadcastDataMessage,ExtendedChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, data='\x00' * 10):
         ExtendedChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_BROADCAST_DATA,
                                 payload=data, number=number)
 
 
 class ExtendedChannelAcknowledgedDataMessage(ChannelAcknowledgedDataMessage,ExtendedChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, data='\x00' * 10):
         ExtendedChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_ACKNOWLEDGED_DATA,
                                 payload=data, number=number)
 
 
 class ExtendedChannelBurstDataMessage(ChannelBurstDataMessage,ExtendedChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, data='\x00' * 10):
         ExtendedChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_BURST_DATA,
                                 payload=data, number=number)
@@ -781,6 +724,8 @@ class ExtendedChannelBurstDataMessage(ChannelBurstDataMessage,ExtendedChannelMes
 
 # Channel event messages
 class ChannelEventMessage(ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, message_id=0x00, message_code=0x00):
         ChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_EVENT,
                                 number=number, payload='\x00\x00')
@@ -788,47 +733,51 @@ class ChannelEventMessage(ChannelMessage):
         self.setMessageCode(message_code)
 
     def getMessageID(self):
-        return ord(self.payload[1])
+        return self.payload[1]
 
     def setMessageID(self, message_id):
         if (message_id > 0xFF) or (message_id < 0x00):
             raise MessageError('Could not set message ID ' \
                                    '(out of range).')
 
-        self.payload[1] = chr(message_id)
+        self.payload[1] = message_id
 
     def getMessageCode(self):
-        return ord(self.payload[2])
+        return self.payload[2]
 
     def setMessageCode(self, message_code):
         if (message_code > 0xFF) or (message_code < 0x00):
             raise MessageError('Could not set message code ' \
                                    '(out of range).')
 
-        self.payload[2] = chr(message_code)
+        self.payload[2] = message_code
 
 
 # Requested response messages
 class ChannelStatusMessage(ChannelMessage):
+    __slots__ = ()
+
     def __init__(self, number=0x00, status=0x00):
         ChannelMessage.__init__(self, type_=MESSAGE_CHANNEL_STATUS,
                                 payload='\x00', number=number)
         self.setStatus(status)
 
     def getStatus(self):
-        return ord(self.payload[1])
+        return self.payload[1]
 
     def setStatus(self, status):
         if (status > 0xFF) or (status < 0x00):
             raise MessageError('Could not set channel status ' \
                                    '(out of range).')
 
-        self.payload[1] = chr(status)
+        self.payload[1] = status
 
 #class ChannelIDMessage(ChannelMessage):
 
 
 class VersionMessage(Message):
+    __slots__ = ()
+
     def __init__(self, version='\x00' * 9):
         Message.__init__(self, type_=MESSAGE_VERSION, payload='\x00' * 9)
         self.setVersion(version)
@@ -845,6 +794,8 @@ class VersionMessage(Message):
 
 
 class CapabilitiesMessage(Message):
+    __slots__ = ()
+
     def __init__(self, max_channels=0x00, max_nets=0x00, std_opts=0x00,
                  adv_opts=0x00, adv_opts2=0x00):
         Message.__init__(self, type_=MESSAGE_CAPABILITIES, payload='\x00' * 4)
@@ -856,47 +807,47 @@ class CapabilitiesMessage(Message):
             self.setAdvOptions2(adv_opts2)
 
     def getMaxChannels(self):
-        return ord(self.payload[0])
+        return self.payload[0]
 
     def getMaxNetworks(self):
-        return ord(self.payload[1])
+        return self.payload[1]
 
     def getStdOptions(self):
-        return ord(self.payload[2])
+        return self.payload[2]
 
     def getAdvOptions(self):
-        return ord(self.payload[3])
+        return self.payload[3]
 
     def getAdvOptions2(self):
-        return ord(self.payload[4]) if len(self.payload) == 5 else 0x00
+        return self.payload[4] if len(self.payload) == 5 else 0x00
 
     def setMaxChannels(self, num):
         if (num > 0xFF) or (num < 0x00):
             raise MessageError('Could not set max channels ' \
                                    '(out of range).')
 
-        self.payload[0] = chr(num)
+        self.payload[0] = num
 
     def setMaxNetworks(self, num):
         if (num > 0xFF) or (num < 0x00):
             raise MessageError('Could not set max networks ' \
                                    '(out of range).')
 
-        self.payload[1] = chr(num)
+        self.payload[1] = num
 
     def setStdOptions(self, num):
         if (num > 0xFF) or (num < 0x00):
             raise MessageError('Could not set std options ' \
                                    '(out of range).')
 
-        self.payload[2] = chr(num)
+        self.payload[2] = num
 
     def setAdvOptions(self, num):
         if (num > 0xFF) or (num < 0x00):
             raise MessageError('Could not set adv options ' \
                                    '(out of range).')
 
-        self.payload[3] = chr(num)
+        self.payload[3] = num
 
     def setAdvOptions2(self, num):
         if (num > 0xFF) or (num < 0x00):
@@ -904,11 +855,13 @@ class CapabilitiesMessage(Message):
                                    '(out of range).')
 
         if len(self.payload) == 4:
-            self.payload.append('\x00')
-        self.payload[4] = chr(num)
+            self.payload.append(0x00)
+        self.payload[4] = num
 
 
 class SerialNumberMessage(Message):
+    __slots__ = ()
+
     def __init__(self, serial='\x00' * 4):
         Message.__init__(self, type_=MESSAGE_SERIAL_NUMBER)
         self.setSerialNumber(serial)
@@ -927,70 +880,78 @@ class SerialNumberMessage(Message):
 # notification messages 
 
 class StartupMessage(Message):
+    __slots__ = ()
+
     def __init__(self):
         Message.__init__(self, type_=MESSAGE_STARTUP, payload = '\x00'  )
 
     def isPowerOnReset(self):
-        if ord(self.getPayload()[0]) == 0x00:
+        if self.payload[0] == 0x00:
             return True
         return False
 
     def isHardwareLineReset(self):
-        if ord(self.getPayload()[0]) & (1 << 0) != 0:
+        if self.payload[0] & (1 << 0) != 0:
             return True
         return False    
 
     def isWatchDogReset(self):
-        if ord(self.getPayload()[0]) & (1 << 1) != 0:
+        if self.payload[0] & (1 << 1) != 0:
             return True
         return False
 
     def isCommandReset(self):
-        if ord(self.getPayload()[0]) & (1 << 5) != 0:
+        if self.payload[0] & (1 << 5) != 0:
             return True
         return False
 
     def isSynchronousReset(self):
-        if ord(self.getPayload()[0]) & (1 << 6) != 0:
+        if self.payload[0] & (1 << 6) != 0:
             return True
         return False
 
     def isSuspendReset(self):
-        if ord(self.getPayload()[0]) & (1 << 7) != 0:
+        if self.payload[0] & (1 << 7) != 0:
             return True
         return False        
 
 # utilities for burst messages
 
 class BurstSequence(object):
+    """
+    Sequence codes for the packets of a burst transfer: 0 for the first
+    packet, then 1, 2, 3, 1, 2, 3... After finish() the next code also
+    carries the last packet flag.
+    """
 
-    INIT_VAL = 0b00
+    INIT_VAL = 0b000
     MAX_VAL = 0b011
     WRAP_VAL = 0b001
-    FINISH_VAL = 0b110
+    FINISH_VAL = 0b100
     MAX_CHANNEL = 0b11111
 
-    
     def __init__(self):
-        self.current_val = BurstSequence.INIT_VAL    
-    
+        self.current_val = BurstSequence.INIT_VAL
+        self.finished = False
+
     def next(self):
         rtn = self.current_val
+        if self.finished:
+            return rtn | BurstSequence.FINISH_VAL
         if self.current_val == BurstSequence.MAX_VAL:
-            self.current_val = BurstSequence.INIT_VAL
-        elif self.current_val > BurstSequence.FINISH_VAL:
+            self.current_val = BurstSequence.WRAP_VAL
+        elif self.current_val > BurstSequence.MAX_VAL:
             raise ValueError('Value out of bounds. Who has been messing with my internals?')
-        elif self.current_val == BurstSequence.FINISH_VAL:
-            pass
         else:
             self.current_val += 1
         return rtn
-    
+
     def finish(self):
-        self.current_val = BurstSequence.FINISH_VAL
-    
+        self.finished = True
+
     def reset(self):
-        self.current_val = INIT_VAL
+        self.current_val = BurstSequence.INIT_VAL
+        self.finished = False
 
     def combine(self,channel_no):
         if channel_no > BurstSequence.MAX_CHANNEL:
@@ -1000,4 +961,163 @@ class BurstSequence(object):
         return channel_no | (self.next() << 5)
 
 
-    
+# Message handler registry
+
+_handlers = {}
+
+
+def registerMessage(type_, class_, format_=MessageFormat.LEGACY):
+    """
+    Make Message.getHandler() build class_ for frames of type type_.
+
+    Classes registered with MessageFormat.EXTENDED are used for frames
+    carrying extended data, the MessageFormat.LEGACY entry for everything
+    else. Handlers are created without calling __init__: the decoded type,
+    sync and payload are set directly and update() is called afterwards.
+    """
+    if (type_ > 0xFF) or (type_ < 0x00):
+        raise MessageError('Could not register message ' \
+                           '(type out of range).')
+
+    _handlers.setdefault(type_, {})[format_] = class_
+
+
+registerMessage(MESSAGE_CHANNEL_UNASSIGN, ChannelUnassignMessage)
+registerMessage(MESSAGE_CHANNEL_ASSIGN, ChannelAssignMessage)
+registerMessage(MESSAGE_CHANNEL_ID, ChannelIDMessage)
+registerMessage(MESSAGE_CHANNEL_PERIOD, ChannelPeriodMessage)
+registerMessage(MESSAGE_CHANNEL_SEARCH_TIMEOUT, ChannelSearchTimeoutMessage)
+registerMessage(MESSAGE_CHANNEL_FREQUENCY, ChannelFrequencyMessage)
+registerMessage(MESSAGE_CHANNEL_TX_POWER, ChannelTXPowerMessage)
+registerMessage(MESSAGE_NETWORK_KEY, NetworkKeyMessage)
+registerMessage(MESSAGE_TX_POWER, TXPowerMessage)
+registerMessage(MESSAGE_SYSTEM_RESET, SystemResetMessage)
+registerMessage(MESSAGE_CHANNEL_OPEN, ChannelOpenMessage)
+registerMessage(MESSAGE_CHANNEL_CLOSE, ChannelCloseMessage)
+registerMessage(MESSAGE_CHANNEL_REQUEST, ChannelRequestMessage)
+registerMessage(MESSAGE_CHANNEL_BROADCAST_DATA, ChannelBroadcastDataMessage)
+registerMessage(MESSAGE_CHANNEL_BROADCAST_DATA,
+                ExtendedChannelBroadcastDataMessage, MessageFormat.EXTENDED)
+registerMessage(MESSAGE_CHANNEL_ACKNOWLEDGED_DATA,
+                ChannelAcknowledgedDataMessage)
+registerMessage(MESSAGE_CHANNEL_ACKNOWLEDGED_DATA,
+                ExtendedChannelAcknowledgedDataMessage, MessageFormat.EXTENDED)
+registerMessage(MESSAGE_CHANNEL_BURST_DATA, ChannelBurstDataMessage)
+registerMessage(MESSAGE_CHANNEL_BURST_DATA,
+                ExtendedChannelBurstDataMessage, MessageFormat.EXTENDED)
+registerMessage(MESSAGE_CHANNEL_EXTENDED_BROADCAST_DATA,
+                LegacyChannelBroadcastDataMessage)
+registerMessage(MESSAGE_CHANNEL_EXTENDED_ACKNOWLEDGED_DATA,
+                LegacyChannelAcknowledgedDataMessage)
+registerMessage(MESSAGE_CHANNEL_EXTENDED_BURST_DATA,
+                LegacyChannelBurstDataMessage)
+registerMessage(MESSAGE_CHANNEL_EVENT, ChannelEventMessage)
+registerMessage(MESSAGE_CHANNEL_STATUS, ChannelStatusMessage)
+registerMessage(MESSAGE_VERSION, VersionMessage)
+registerMessage(MESSAGE_CAPABILITIES, CapabilitiesMessage)
+registerMessage(MESSAGE_SERIAL_NUMBER, SerialNumberMessage)
+registerMessage(MESSAGE_STARTUP, StartupMessage)
+
+
+# Batch decoding
+
+DataRecord = collections.namedtuple('DataRecord', (
+    'msg_id', 'channel', 'sequence', 'data', 'device_number', 'device_type',
+    'transmission_type', 'rssi_value', 'rx_timestamp'))
+
+_DATA_TYPES = frozenset((MESSAGE_CHANNEL_BROADCAST_DATA,
+                         MESSAGE_CHANNEL_ACKNOWLEDGED_DATA,
+                         MESSAGE_CHANNEL_BURST_DATA))
+_LEGACY_DATA_TYPES = frozenset((MESSAGE_CHANNEL_EXTENDED_BROADCAST_DATA,
+                                MESSAGE_CHANNEL_EXTENDED_ACKNOWLEDGED_DATA,
+                                MESSAGE_CHANNEL_EXTENDED_BURST_DATA))
+_DATA = struct.Struct('<B8s')
+_LEGACY_DATA = struct.Struct('<BHBB8s')
+_CHANNEL_ID = struct.Struct('<HBB')
+_RX_TIMESTAMP = struct.Struct('<H')
+
+
+def _decodeData(type_, buf, start, length):
+    channel, data = _DATA.unpack_from(buf, start)
+    sequence = None
+    if type_ == MESSAGE_CHANNEL_BURST_DATA:
+        sequence = channel >> 5
+        channel &= BurstChannelMixin.CHANNEL_MASK
+
+    device_number = device_type = transmission_type = None
+    rssi_value = rx_timestamp = None
+    if length > 9:
+        flag = buf[start + 9]
+        offset = start + 10
+        end = start + length
+        if flag & ExtendedMessageFlags.ENABLE_CHANNEL_ID and \
+           offset + _CHANNEL_ID.size <= end:
+            device_number, device_type, transmission_type = \
+                _CHANNEL_ID.unpack_from(buf, offset)
+            offset += _CHANNEL_ID.size
+        if flag & ExtendedMessageFlags.ENABLE_RSSI_OUTPUT and \
+           offset + 3 <= end:
+            rssi_value = buf[offset + 1]
+            offset += 3
+        if flag & ExtendedMessageFlags.ENABLE_RX_TIMESTAMP and \
+           offset + _RX_TIMESTAMP.size <= end:
+            rx_timestamp = _RX_TIMESTAMP.unpack_from(buf, offset)[0]
+
+    return DataRecord(type_, channel, sequence, data, device_number,
+                      device_type, transmission_type, rssi_value,
+                      rx_timestamp)
+
+
+def _decodeLegacyData(type_, buf, start):
+    channel, device_number, device_type, transmission_type, data = \
+        _LEGACY_DATA.unpack_from(buf, start)
+    sequence = None
+    if type_ == MESSAGE_CHANNEL_EXTENDED_BURST_DATA:
+        sequence = channel >> 5
+        channel &= BurstChannelMixin.CHANNEL_MASK
+    return DataRecord(type_, channel, sequence, data, device_number,
+                      device_type, transmission_type, None, None)
+
+
+def decodeBatch(buffer_):
+    """
+    Decode every complete frame in buffer_ in a single pass.
+
+    Broadcast, acknowledged and burst data frames (extended and legacy
+    extended ones included) become DataRecord tuples, unpacked straight
+    from the buffer with precompiled structs. Other frames are decoded to
+    full Message objects through Message.getHandler(); frames of unknown
+    type are dropped and corrupt bytes skipped.
+
+    Returns (records, consumed): the caller keeps buffer_[consumed:], the
+    start of an incomplete frame, for the next read.
+    """
+    buf = buffer_ if isinstance(buffer_, bytearray) else bytearray(buffer_)
+    records = []
+    append = records.append
+    decoder = Message()
+
+    offset = 0
+    end = len(buf)
+    while offset < end:
+        size = validateFrame(buf, offset)
+        if size == FRAME_INCOMPLETE:
+            break
+        elif size == FRAME_CORRUPT:
+            offset += 1
+            continue
+
+        type_ = buf[offset + 2]
+        length = size - 4
+        if type_ in _DATA_TYPES and length >= 9:
+            append(_decodeData(type_, buf, offset + 3, length))
+        elif type_ in _LEGACY_DATA_TYPES and length == 13:
+            append(_decodeLegacyData(type_, buf, offset + 3))
+        else:
+            try:
+                append(decoder.getHandler(buf[offset:offset + size]))
+            except MessageError:
+                pass
+        offset += size
+
+    return records, offset
@@ -23,8 +23,10 @@
 #
 ##############################################################################
 
+import collections
 import time
 import thread
+import threading
 import uuid
 
 from ant.core.constants import *
@@ -32,6 +34,14 @@ from ant.core.exceptions import *
 from ant.core import message
 from ant.core import event
 
+BURST_RETRIES = 3
+BURST_WINDOW = 8  # packets written ahead of the radio
+BURST_PACKET_TIME = 0.0032  # 8 bytes at the 20 kbit/s burst rate
+
+BurstStats = collections.namedtuple('BurstStats', (
+    'size', 'packets', 'retries', 'elapsed', 'throughput'))
+BURST_BUFFER_SIZE = 1024
+
 
 class NetworkKey(object):
     def __init__(self, name=None, key='\x00' * 8):
@@ -44,89 +54,174 @@ class NetworkKey(object):
 
 
 class Channel(event.EventCallback):
-    cb_lock = thread.allocate_lock()
-
-    def __init__(self, node):
+    def __init__(self, node, number=0x00):
         self.node = node
         self.is_free = True
         self.name = str(uuid.uuid4())
-        self.number = 0
+        self.number = number
         self.cb = []
-        self.node.evm.registerCallback(self)
+        self.cb_lock = thread.allocate_lock()
+        self.node.evm.registerChannel(number, self)
 
     def __del__(self):
-        self.node.evm.removeCallback(self)
+        self.node.evm.removeChannel(self.number, self)
 
-    def assign(self, net_key, ch_type):
+    def assign(self, net_key, ch_type, timeout=None):
+        self._wait(self.assignAsync(net_key, ch_type), timeout)
+
+    def assignAsync(self, net_key, ch_type):
         msg = message.ChannelAssignMessage(number=self.number)
         msg.setNetworkNumber(self.node.getNetworkKey(net_key).number)
         msg.setChannelType(ch_type)
-        self.node.driver.write(msg.encode())
-        if self.node.evm.waitForAck(msg) != RESPONSE_NO_ERROR:
-            raise ChannelError('Could not assign channel.')
-        self.is_free = False
+        return self._request(msg, 'Could not assign channel.',
+                             lambda: setattr(self, 'is_free', False))
+
+    def setID(self, dev_type, dev_num, trans_type, timeout=None):
+        self._wait(self.setIDAsync(dev_type, dev_num, trans_type), timeout)
 
-    def setID(self, dev_type, dev_num, trans_type):
+    def setIDAsync(self, dev_type, dev_num, trans_type):
         msg = message.ChannelIDMessage(number=self.number)
         msg.setDeviceType(dev_type)
         msg.setDeviceNumber(dev_num)
         msg.setTransmissionType(trans_type)
-        self.node.driver.write(msg.encode())
-        if self.node.evm.waitForAck(msg) != RESPONSE_NO_ERROR:
-            raise ChannelError('Could not set channel ID.')
+        return self._request(msg, 'Could not set channel ID.')
 
-    def setSearchTimeout(self, timeout):
+    def setSearchTimeout(self, search_timeout, timeout=None):
+        self._wait(self.setSearchTimeoutAsync(search_timeout), timeout)
+
+    def setSearchTimeoutAsync(self, search_timeout):
         msg = message.ChannelSearchTimeoutMessage(number=self.number)
-        msg.setTimeout(timeout)
-        self.node.driver.write(msg.encode())
-        if self.node.evm.waitForAck(msg) != RESPONSE_NO_ERROR:
-            raise ChannelError('Could not set channel search timeout.')
+        msg.setTimeout(search_timeout)
+        return self._request(msg, 'Could not set channel search timeout.')
+
+    def setPeriod(self, counts, timeout=None):
+        self._wait(self.setPeriodAsync(counts), timeout)
 
-    def setPeriod(self, counts):
+    def setPeriodAsync(self, counts):
         msg = message.ChannelPeriodMessage(number=self.number)
         msg.setChannelPeriod(counts)
-        self.node.driver.write(msg.encode())
-        if self.node.evm.waitForAck(msg) != RESPONSE_NO_ERROR:
-            raise ChannelError('Could not set channel period.')
+        return self._request(msg, 'Could not set channel period.')
 
-    def setFrequency(self, frequency):
+    def setFrequency(self, frequency, timeout=None):
+        self._wait(self.setFrequencyAsync(frequency), timeout)
+
+    def setFrequencyAsync(self, frequency):
         msg = message.ChannelFrequencyMessage(number=self.number)
         msg.setFrequency(frequency)
-        self.node.driver.write(msg.encode())
-        if self.node.evm.waitForAck(msg) != RESPONSE_NO_ERROR:
-            raise ChannelError('Could not set channel frequency.')
+        return self._request(msg, 'Could not set channel frequency.')
+
+    def configure(self, net_key, ch_type, dev_type, dev_num, trans_type,
+                  period, frequency, search_timeout=None, timeout=None):
+        """
+        Assign and configure the channel. All configuration messages are
+        written back to back and their responses gathered afterwards.
+        """
+        futures = [self.assignAsync(net_key, ch_type),
+                   self.setIDAsync(dev_type, dev_num, trans_type)]
+        if search_timeout is not None:
+            futures.append(self.setSearchTimeoutAsync(search_timeout))
+        futures.append(self.setPeriodAsync(period))
+        futures.append(self.setFrequencyAsync(frequency))
+
+        if timeout is not None:
+            deadline = time.time() + timeout
+        try:
+            for future in futures:
+                if timeout is not None:
+                    timeout = max(0, deadline - time.time())
+                self._wait(future, timeout)
+        finally:
+            for future in futures:
+                future.cancel()
 
     def getNumber(self):
         return self.number
 
-    def open(self):
+    def open(self, timeout=None):
+        self._wait(self.openAsync(), timeout)
+
+    def openAsync(self):
         msg = message.ChannelOpenMessage(number=self.number)
-        self.node.driver.write(msg.encode())
-        if self.node.evm.waitForAck(msg) != RESPONSE_NO_ERROR:
-            raise ChannelError('Could not open channel.')
+        return self._request(msg, 'Could not open channel.')
 
-    def close(self):
+    def close(self, timeout=None):
+        self._wait(self.closeAsync(), timeout)
+
+    def closeAsync(self):
+        """Complete once the channel has reported EVENT_CHANNEL_CLOSED."""
+        closed = self.node.evm.expectEvent(self.number, EVENT_CHANNEL_CLOSED)
         msg = message.ChannelCloseMessage(number=self.number)
-        self.node.driver.write(msg.encode())
-        if self.node.evm.waitForAck(msg) != RESPONSE_NO_ERROR:
-            raise ChannelError('Could not close channel.')
+        request = self._request(msg, 'Could not close channel.')
+        future = event.Future()
 
-        while True:
-            msg = self.node.evm.waitForMessage(message.ChannelEventMessage)
-            if msg.getMessageCode() == EVENT_CHANNEL_CLOSED:
-                break
+        def requestDone(request):
+            try:
+                request.result()
+            except ANTException, e:
+                future.setException(e)
 
-    def unassign(self):
+        def futureDone(future):
+            request.cancel()
+            closed.cancel()
+
+        request.addDoneCallback(requestDone)
+        closed.addDoneCallback(lambda closed: future.setResult(None))
+        future.addDoneCallback(futureDone)
+        return future
+
+    def unassign(self, timeout=None):
+        self._wait(self.unassignAsync(), timeout)
+
+    def unassignAsync(self):
         msg = message.ChannelUnassignMessage(number=self.number)
-        self.node.driver.write(msg.encode())
-        if self.node.evm.waitForAck(msg) != RESPONSE_NO_ERROR:
-            raise ChannelError('Could not unassign channel.')
-        self.is_free = True
+        return self._request(msg, 'Could not unassign channel.',
+                             lambda: setattr(self, 'is_free', True))
+
+    def _request(self, msg, error, success=None):
+        """
+        Write a configuration message and return a Future that completes
+        when its response arrives, raising ChannelError(error) on failure.
+        """
+        ack = self.node.evm.expectAck(msg)
+        future = event.Future()
+
+        def ackDone(ack):
+            try:
+                code = ack.result()
+            except ANTException, e:
+                future.setException(e)
+                return
+            if code != RESPONSE_NO_ERROR:
+                future.setException(ChannelError(error))
+                return
+            if success is not None:
+                success()
+            future.setResult(None)
+
+        ack.addDoneCallback(ackDone)
+        # Once the caller gives up, the response must not be consumed by
+        # this request any more
+        future.addDoneCallback(lambda future: ack.cancel())
+        try:
+            self.node.evm.write(msg.encode(), WritePriority.CONFIG)
+        except:
+            future.cancel()
+            raise
+        return future
+
+    def _wait(self, future, timeout):
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise
+            return future.result()
 
     def registerCallback(self, callback):
+        # Copy on write, so process() can walk the list without locking
         self.cb_lock.acquire()
         if callback not in self.cb:
-            self.cb.append(callback)
+            self.cb = self.cb + [callback]
         self.cb_lock.release()
 
     def send(self,msg):
@@ -153,16 +248,189 @@ class Channel(event.EventCallback):
             msg.setSequenceCode(seq.next())
             self.node.send(msg)        
 
+    def burstSend(self, data, timeout=None, retries=BURST_RETRIES):
+        return self._wait(self.burstSendAsync(data, retries), timeout)
+
+    def burstSendAsync(self, data, retries=BURST_RETRIES,
+                       window=BURST_WINDOW):
+        """
+        Send data as a burst transfer from a background thread.
+
+        data is split into 8-byte packets, the last one zero padded, and
+        written no more than window packets ahead of the radio's burst
+        rate. A transfer the stick reports as failed (or rejects) is sent
+        again, up to retries times. Returns a Future for the BurstStats
+        of the transfer, failing with ChannelError once the retries are
+        used up; cancelling it abandons the transfer.
+        """
+        data = str(data)
+        packets = [data[i:i + 8].ljust(8, '\x00')
+                   for i in xrange(0, len(data), 8)] or ['\x00' * 8]
+        future = event.Future()
+        sender = threading.Thread(target=self._burst,
+                                  args=(packets, len(data), retries, window,
+                                        future))
+        sender.daemon = True
+        sender.start()
+        return future
+
+    def _burst(self, packets, size, retries, window, future):
+        evm = self.node.evm
+        start = time.time()
+        attempt = 0
+        while True:
+            done = threading.Event()
+            completed = evm.expectEvent(self.number,
+                                        EVENT_TRANSFER_TX_COMPLETED)
+            failed = evm.expectEvent(self.number, EVENT_TRANSFER_TX_FAILED)
+            # Burst packets are only answered when the stick rejects them
+            rejected = evm.expectAck(
+                message.ChannelBurstDataMessage(number=self.number))
+            for pending in (completed, failed, rejected, future):
+                pending.addDoneCallback(lambda pending: done.set())
+            try:
+                self._writeBurst(packets, window, done)
+                done.wait()
+            except Exception, e:
+                future.setException(e)
+            finally:
+                # Only a future that already holds its event fails to cancel
+                succeeded = not completed.cancel()
+                failed.cancel()
+                rejected.cancel()
+
+            if future.done():
+                return
+            if succeeded:
+                elapsed = time.time() - start
+                future.setResult(BurstStats(
+                    size, len(packets), attempt, elapsed,
+                    size / elapsed if elapsed else 0.0))
+                return
+            if attempt == retries:
+                future.setException(ChannelError('Burst transfer failed.'))
+                return
+            attempt += 1
+
+    def _writeBurst(self, packets, window, done):
+        seq = message.BurstSequence()
+        last = len(packets) - 1
+        start = time.time()
+        for i, data in enumerate(packets):
+            ahead = i - window - (time.time() - start) / BURST_PACKET_TIME
+            if ahead > 0:
+                done.wait(ahead * BURST_PACKET_TIME)
+            if done.isSet():
+                return
+            if i == last:
+                seq.finish()
+            msg = message.ChannelBurstDataMessage(number=self.number,
+                                                  data=data)
+            msg.setSequenceCode(seq.next())
+            self.node.evm.write(msg.encode(), WritePriority.DATA)
+
     def process(self, msg):
-        self.cb_lock.acquire()
-        if isinstance(msg, message.ChannelMessage) and \
-        msg.getChannelNumber() == self.number:
-            for callback in self.cb:
-                try:
-                    callback.process(msg)
-                except:
-                    pass  # Who cares?
-        self.cb_lock.release()
+        # Only called by the event machine for this channel's messages
+        for callback in self.cb:
+            try:
+                callback.process(msg)
+            except:
+                pass  # Who cares?
+
+
+class BurstAssembler(event.EventCallback):
+    """
+    Reassemble the burst transfers received on a channel. Register it with
+    Channel.registerCallback().
+
+    Packets are checked against the burst sequence counter and collected
+    in a reusable buffer that doubles when a transfer outgrows it. Every
+    complete transfer is passed to callback(data) and to the Futures
+    returned by nextTransfer(); a sequence gap or EVENT_TRANSFER_RX_FAILED
+    drops the transfer and fails those Futures with ChannelError instead.
+    Packets must be dispatched in order (a single event dispatcher).
+    """
+    def __init__(self, callback=None, size=BURST_BUFFER_SIZE):
+        self.callback = callback
+        self.buffer = bytearray(size)
+        self.length = 0
+        self.expected = None  # next sequence counter, None when idle
+        self.lock = thread.allocate_lock()
+        self.futures = []
+        self.stats = {'transfers': 0, 'failed': 0, 'gaps': 0}
+
+    def nextTransfer(self):
+        """Return a Future for the data of the next complete transfer."""
+        future = event.Future()
+        self.lock.acquire()
+        self.futures.append(future)
+        self.lock.release()
+        return future
+
+    def getStats(self):
+        self.lock.acquire()
+        stats = dict(self.stats)
+        self.lock.release()
+        return stats
+
+    def process(self, msg):
+        if isinstance(msg, message.BurstChannelMixin):
+            self._packet(msg)
+        elif isinstance(msg, message.ChannelEventMessage) and \
+             msg.getMessageID() == MESSAGE_RF_EVENT and \
+             msg.getMessageCode() == EVENT_TRANSFER_RX_FAILED and \
+             self.expected is not None:
+            self._fail('failed', 'Burst transfer failed.')
+
+    def _packet(self, msg):
+        code = msg.getSequenceCode()
+        counter = code & message.BurstSequence.MAX_VAL
+
+        if counter == message.BurstSequence.INIT_VAL:
+            if self.expected is not None:
+                self._fail('gaps', 'Burst transfer restarted.')
+            self.length = 0
+        elif counter != self.expected:
+            if self.expected is not None:
+                self._fail('gaps', 'Burst sequence gap.')
+            return
+
+        data = msg.getRawData()
+        end = self.length + len(data)
+        if end > len(self.buffer):
+            self.buffer.extend(bytearray(max(len(self.buffer), len(data))))
+        self.buffer[self.length:end] = data
+        self.length = end
+
+        if code & message.BurstSequence.FINISH_VAL:
+            self.expected = None
+            self._deliver(self.buffer[:self.length])
+        elif counter == message.BurstSequence.MAX_VAL:
+            self.expected = message.BurstSequence.WRAP_VAL
+        else:
+            self.expected = counter + 1
+
+    def _deliver(self, data):
+        self.lock.acquire()
+        self.stats['transfers'] += 1
+        futures, self.futures = self.futures, []
+        self.lock.release()
+
+        for future in futures:
+            future.setResult(data)
+        if self.callback is not None:
+            self.callback(data)
+
+    def _fail(self, stat, error):
+        self.expected = None
+        self.length = 0
+        self.lock.acquire()
+        self.stats[stat] += 1
+        futures, self.futures = self.futures, []
+        self.lock.release()
+
+        for future in futures:
+            future.setException(ChannelError(error))
 
 
 class Node(event.EventCallback):
@@ -201,7 +469,7 @@ class Node(event.EventCallback):
 
     def reset(self):
         msg = message.SystemResetMessage()
-        self.driver.write(msg.encode())
+        self.evm.write(msg.encode(), WritePriority.CONFIG)
         time.sleep(1)
 
     def init(self):
@@ -210,7 +478,7 @@ class Node(event.EventCallback):
 
         msg = message.ChannelRequestMessage()
         msg.setMessageID(MESSAGE_CAPABILITIES)
-        self.driver.write(msg.encode())
+        self.evm.write(msg.encode(), WritePriority.CONFIG)
 
         caps = self.evm.waitForMessage(message.CapabilitiesMessage)
 
@@ -220,8 +488,7 @@ class Node(event.EventCallback):
             self.setNetworkKey(i)
         self.channels = []
         for i in range(0, caps.getMaxChannels()):
-            self.channels.append(Channel(self))
-            self.channels[i].number = i
+            self.channels.append(Channel(self, i))
         self.options = (caps.getStdOptions(),
                         caps.getAdvOptions(),
                         caps.getAdvOptions2(),)
@@ -238,7 +505,7 @@ class Node(event.EventCallback):
         msg = message.NetworkKeyMessage()
         msg.setNumber(number)
         msg.setKey(self.networks[number].key)
-        self.driver.write(msg.encode())
+        self.evm.write(msg.encode(), WritePriority.CONFIG)
         self.evm.waitForAck(msg)
         self.networks[number].number = number
 
@@ -257,8 +524,10 @@ class Node(event.EventCallback):
     def registerEventListener(self, callback):
         self.evm.registerCallback(callback)
 
-    def send(self,msg):
-        self.driver.write(msg.encode())
+    def send(self, msg, priority=None):
+        if priority is None:
+            priority = event.writePriority(msg)
+        self.evm.write(msg.encode(), priority)
 
     def process(self, msg):
         pass
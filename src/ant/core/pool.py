@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import functools
+import Queue
+import thread
+import threading
+
+from ant.core import driver
+from ant.core import event
+from ant.core import worker
+from ant.core.exceptions import NodeError
+from ant.core.node import Node
+
+
+class _Feed(event.EventCallback):
+    # Forwards one node's messages to the pool's dispatch queue
+    def __init__(self, pool, node):
+        self.pool = pool
+        self.node = node
+
+    def process(self, msg):
+        self.pool.queue.put((self.node, msg))
+
+
+class NodePool(object):
+    """
+    Several ANT sticks used as one node.
+
+    Every stick keeps its own Node, event machine and pump thread. Free
+    channels are handed out from the stick with the most of them left, so
+    the channel count grows with each stick added. Messages from all
+    sticks are merged into a single queue and passed, in arrival order, to
+    the callback(node, msg) listeners by one dispatcher thread.
+    """
+    def __init__(self, drivers, queue_size=event.MAX_DISPATCH_QUEUE):
+        self.nodes = [Node(driver_) for driver_ in drivers]
+        self.queue = Queue.Queue(queue_size)
+        self.listeners = []
+        self.lock = thread.allocate_lock()
+        self.dispatcher = None
+        self.running = False
+        for node in self.nodes:
+            node.registerEventListener(_Feed(self, node))
+
+    @classmethod
+    def fromUSB(cls, device='', processes=False, **kwargs):
+        """
+        Open a pool of every ANT USB2 stick attached. With processes each
+        stick is read in a worker process of its own.
+        """
+        count = driver.USB2Driver.count()
+        if count == 0:
+            raise NodeError('Could not find any ANT USB2 sticks.')
+        factories = [functools.partial(driver.USB2Driver, device, number=i,
+                                       **kwargs) for i in range(count)]
+        if processes:
+            return cls([worker.ProcessDriver(factory)
+                        for factory in factories])
+        return cls([factory() for factory in factories])
+
+    def start(self):
+        """Start all nodes at once, stopping them all if one fails."""
+        if self.running:
+            raise NodeError('Could not start ANT node pool (already '
+                            'started).')
+
+        errors = []
+
+        def start(node):
+            try:
+                node.start()
+            except Exception, e:
+                errors.append(e)
+
+        starters = [threading.Thread(target=start, args=(node,))
+                    for node in self.nodes]
+        for starter in starters:
+            starter.start()
+        for starter in starters:
+            starter.join()
+        if errors:
+            for node in self.nodes:
+                if node.running:
+                    node.stop()
+            raise NodeError('Could not start ANT node pool (%s).' % errors[0])
+
+        self.dispatcher = threading.Thread(target=self._dispatch)
+        self.dispatcher.start()
+        self.running = True
+
+    def stop(self, reset=True):
+        if not self.running:
+            raise NodeError('Could not stop ANT node pool (not started).')
+
+        for node in self.nodes:
+            node.stop(reset)
+        self.queue.put(None)
+        self.dispatcher.join()
+        self.dispatcher = None
+        self.running = False
+
+    def getCapabilities(self):
+        """Total channels and networks of all sticks."""
+        channels = networks = 0
+        for node in self.nodes:
+            channels += len(node.channels)
+            networks += len(node.networks)
+        return channels, networks
+
+    def setNetworkKey(self, number, key=None):
+        for node in self.nodes:
+            node.setNetworkKey(number, key)
+
+    def getFreeChannel(self):
+        """A free channel of the stick with the most free channels."""
+        self.lock.acquire()
+        try:
+            best = None
+            best_free = 0
+            for node in self.nodes:
+                free = [channel for channel in node.channels
+                        if channel.is_free]
+                if len(free) > best_free:
+                    best = free[0]
+                    best_free = len(free)
+            if best is None:
+                raise NodeError('Could not find free channel.')
+            # Claimed until assigned, so concurrent callers get another one
+            best.is_free = False
+            return best
+        finally:
+            self.lock.release()
+
+    def releaseChannel(self, channel):
+        """Return a channel obtained from getFreeChannel() unused."""
+        channel.is_free = True
+
+    def registerEventListener(self, callback):
+        # Copy on write, so the dispatcher can walk the list without locking
+        self.lock.acquire()
+        if callback not in self.listeners:
+            self.listeners = self.listeners + [callback]
+        self.lock.release()
+
+    def removeEventListener(self, callback):
+        self.lock.acquire()
+        if callback in self.listeners:
+            self.listeners = [listener for listener in self.listeners
+                              if listener != callback]
+        self.lock.release()
+
+    def _dispatch(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            node, msg = item
+            for callback in self.listeners:
+                try:
+                    callback(node, msg)
+                except Exception, e:
+                    print e
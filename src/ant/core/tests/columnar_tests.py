@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+LOG_LOCATION = '/tmp/python-ant.columnartest.ant'
+NPY_LOCATION = '/tmp/python-ant.columnartest.npy'
+NPZ_LOCATION = '/tmp/python-ant.columnartest.npz'
+
+import unittest
+
+import numpy
+
+from ant.core import log
+from ant.core.columnar import *
+from ant.core.indexedlog import IndexedLogWriter
+from ant.core.message import *
+
+
+class ColumnarTest(unittest.TestCase):
+    def setUp(self):
+        self.frames = [
+            ChannelBroadcastDataMessage(number=1,
+                                        data='\x01\x02\x03\x04\x05\x06\x07\x48'
+                                        ).encode(),
+            Message(type_=MESSAGE_CHANNEL_BROADCAST_DATA,
+                    payload='\x02' + '\x09' * 8 +
+                            '\xE0\x34\x12\x78\x01\x20\xC8\x05\x10\x27'
+                    ).encode(),
+            LegacyChannelBroadcastDataMessage(number=3).encode(),
+            CapabilitiesMessage(max_channels=8, max_nets=3).encode(),
+        ]
+        lw = log.LogWriter(LOG_LOCATION)
+        lw.logOpen()
+        data = ''.join(self.frames)
+        for i in range(0, len(data), 5):
+            lw.logRead(data[i:i + 5])
+        lw.logWrite(ChannelOpenMessage(number=1).encode())
+        lw.close()
+
+    def check(self, frames):
+        self.assertEquals(len(frames), 5)
+        self.assertEquals(list(frames['msg_id']), [0x4E, 0x4E, 0x5D, 0x54,
+                                                   0x4B])
+        self.assertEquals(list(frames['channel']), [1, 2, 3, -1, 1])
+        self.assertEquals(list(frames['direction']),
+                          [log.EVENT_READ] * 4 + [log.EVENT_WRITE])
+        self.assertEquals(frames['data'][0, 7], 0x48)
+        self.assertEquals(list(frames['data'][3, :2]), [8, 3])
+
+        ext = frames[1]
+        self.assertEquals(ext['flag'], 0xE0)
+        self.assertEquals(ext['device_number'], 0x1234)
+        self.assertEquals(ext['device_type'], 0x78)
+        self.assertEquals(ext['rssi_value'], 0xC8)
+        self.assertEquals(ext['rx_timestamp'], 0x2710)
+        self.assertEquals(frames[2]['flag'], 0x80)
+        self.assertEquals(frames[0]['flag'], 0)
+
+    def test_decodeLog(self):
+        self.check(decodeLog(LOG_LOCATION))
+
+    def test_decodeLog_v2(self):
+        writer = IndexedLogWriter(LOG_LOCATION)
+        for frame in self.frames:
+            writer.logRead(frame)
+        writer.logWrite(ChannelOpenMessage(number=1).encode())
+        writer.close()
+        self.check(decodeLog(LOG_LOCATION))
+
+    def test_npy(self):
+        frames = exportLog(LOG_LOCATION, NPY_LOCATION)
+        self.assertTrue(isinstance(frames, numpy.memmap))
+        self.check(frames)
+
+    def test_npz(self):
+        save(NPZ_LOCATION, decodeLog(LOG_LOCATION))
+        self.check(load(NPZ_LOCATION))
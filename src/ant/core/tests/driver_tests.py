@@ -23,6 +23,7 @@
 #
 ##############################################################################
 
+import threading
 import unittest
 
 from ant.core.driver import *
@@ -69,6 +70,7 @@ class DriverTest(unittest.TestCase):
         self.assertRaises(DriverError, self.driver.read, 1)
         self.driver.open()
         self.assertEqual(len(self.driver.read(5)), 5)
+        self.assertEqual(len(self.driver.read()), self.driver.getReadSize())
         self.assertRaises(DriverError, self.driver.read, -1)
         self.assertRaises(DriverError, self.driver.read, 0)
         self.driver.close()
@@ -81,6 +83,47 @@ class DriverTest(unittest.TestCase):
         self.driver.close()
 
 
+class USBErrorTest(unittest.TestCase):
+    def test_isTimeout(self):
+        error = usb.core.USBError('Operation timed out', -7, errno.ETIMEDOUT)
+        self.assertTrue(isTimeout(error))
+        error = usb.core.USBError('No such device', -4, errno.ENODEV)
+        self.assertFalse(isTimeout(error))
+
+
+class BlockingDriver(DummyDriver):
+    def __init__(self, device):
+        DummyDriver.__init__(self, device)
+        self.reading = threading.Event()
+        self.release = threading.Event()
+
+    def _read(self, count):
+        self.reading.set()
+        self.release.wait(1)
+        return DummyDriver._read(self, count)
+
+
+class DriverLockTest(unittest.TestCase):
+    def test_full_duplex(self):
+        driver = BlockingDriver('superdrive')
+        other = DummyDriver('otherdrive')
+        driver.open()
+        other.open()
+        reader = threading.Thread(target=driver.read, args=(1,))
+        reader.start()
+        try:
+            self.assertTrue(driver.reading.wait(1))
+            # Neither this driver's writes nor another driver wait on the read
+            self.assertEquals(driver.write('\xFF'), 1)
+            self.assertEquals(other.read(1), '\x00')
+            self.assertTrue(reader.is_alive())
+        finally:
+            driver.release.set()
+            reader.join()
+        driver.close()
+        other.close()
+
+
 # How do you even test this without hardware?
 class USB1DriverTest(unittest.TestCase):
     def _open(self):
@@ -23,8 +23,272 @@
 #
 ##############################################################################
 
+import Queue
+import threading
 import unittest
 
 from ant.core.event import *
+from ant.core.message import *
+from ant.core.exceptions import *
 
 #TODO: How exactly do you properly test threaded code?
+
+
+class FrameScannerTest(unittest.TestCase):
+    def setUp(self):
+        self.scanner = FrameScanner()
+        self.frame1 = ChannelBroadcastDataMessage(number=1,
+                                                  data='\x01' * 8).encode()
+        self.frame2 = ChannelEventMessage(number=2).encode()
+
+    def test_whole_frames(self):
+        self.scanner.feed(self.frame1 + self.frame2)
+        frames = list(self.scanner)
+        self.assertEquals(len(frames), 2)
+        self.assertTrue(isinstance(frames[0], memoryview))
+        self.assertEquals(frames[0].tobytes(), self.frame1)
+        self.assertEquals(frames[1].tobytes(), self.frame2)
+        self.assertEquals(self.scanner.getFrame(), None)
+
+    def test_split_frames(self):
+        data = self.frame1 + self.frame2
+        frames = []
+        for i in range(0, len(data), 3):
+            self.scanner.feed(data[i:i + 3])
+            frames.extend(frame.tobytes() for frame in self.scanner)
+        self.assertEquals(frames, [self.frame1, self.frame2])
+
+    def test_resync(self):
+        corrupt = self.frame1[:-1] + chr(ord(self.frame1[-1]) ^ 0xFF)
+        self.scanner.feed('\x00\x01' + corrupt + self.frame2)
+        frames = [frame.tobytes() for frame in self.scanner]
+        self.assertEquals(frames, [self.frame2])
+
+    def test_views_survive_feed(self):
+        self.scanner.feed(self.frame1 + self.frame2[:4])
+        frame = self.scanner.getFrame()
+        self.scanner.feed(self.frame2[4:])
+        self.assertEquals(frame.tobytes(), self.frame1)
+        self.assertEquals(self.scanner.getFrame().tobytes(), self.frame2)
+
+    def test_handler(self):
+        self.scanner.feed(self.frame1)
+        msg = Message().getHandler(self.scanner.getFrame())
+        self.assertTrue(isinstance(msg, ChannelBroadcastDataMessage))
+        self.assertEquals(msg.getChannelNumber(), 1)
+
+
+class FutureTest(unittest.TestCase):
+    def test_result(self):
+        future = Future()
+        done = []
+        future.addDoneCallback(done.append)
+        threading.Timer(0.05, future.setResult, (42,)).start()
+        self.assertEquals(future.result(1), 42)
+        self.assertEquals(done, [future])
+        self.assertFalse(future.cancel())
+
+    def test_timeout(self):
+        future = Future()
+        self.assertRaises(TimeoutError, future.result, 0.01)
+        self.assertTrue(future.cancel())
+        self.assertRaises(CancelledError, future.result)
+
+    def test_exception(self):
+        future = Future()
+        future.setException(MessageError('Bad.'))
+        self.assertRaises(MessageError, future.result, 0)
+
+
+class FakeDriver(object):
+    """Blocking driver stand-in fed from a queue."""
+    def __init__(self):
+        self.data = Queue.Queue()
+
+    def read(self, count=None):
+        try:
+            data = self.data.get(timeout=0.05)
+        except Queue.Empty:
+            return ''
+        if isinstance(data, Exception):
+            raise data
+        return data
+
+    def getWriteSize(self):
+        return 64
+
+
+class EventMachineTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = FakeDriver()
+        self.evm = EventMachine(self.driver)
+        self.evm.start()
+
+    def tearDown(self):
+        self.evm.stop()
+
+    def test_start_stop(self):
+        self.assertTrue(self.evm.pump)
+        self.evm.stop()
+        self.assertFalse(self.evm.pump)
+        self.evm.start()
+        self.assertTrue(self.evm.pump)
+
+    def test_independent_machines(self):
+        other = EventMachine(FakeDriver())
+        for name in ('callbacks_lock', 'running_lock', 'pump_lock',
+                     'ack_lock', 'msg_lock'):
+            self.assertFalse(getattr(self.evm, name) is
+                             getattr(other, name))
+        # A busy machine does not hold up the other's writes
+        self.evm.pump_lock.acquire()
+        try:
+            other.driver.write = other.driver.data.put
+            other.write('\x01')
+        finally:
+            self.evm.pump_lock.release()
+        self.assertEquals(other.driver.data.get_nowait(), '\x01')
+
+    def test_waitForAck(self):
+        sent = ChannelAssignMessage(number=1)
+        ack = ChannelEventMessage(number=1, message_id=sent.getType(),
+                                  message_code=EVENT_TX)
+        timer = threading.Timer(0.1, self.driver.data.put, (ack.encode(),))
+        timer.start()
+        self.assertEquals(self.evm.waitForAck(sent), EVENT_TX)
+        timer.join()
+
+    def test_waitForMessage(self):
+        msg = ChannelBroadcastDataMessage(number=3, data='\x05' * 8)
+        timer = threading.Timer(0.1, self.driver.data.put, (msg.encode(),))
+        timer.start()
+        received = self.evm.waitForMessage(ChannelMessage)
+        self.assertTrue(isinstance(received, ChannelBroadcastDataMessage))
+        self.assertEquals(received.getChannelNumber(), 3)
+        timer.join()
+
+    def test_ack_mailbox(self):
+        sent = ChannelAssignMessage(number=1)
+        ack = ChannelEventMessage(number=1, message_id=sent.getType(),
+                                  message_code=RESPONSE_NO_ERROR)
+        callback = AckCallback(self.evm)
+        # Chatter from other channels cannot push the ack out
+        for i in range(MAX_ACK_QUEUE * 2):
+            callback.process(ChannelEventMessage(number=2,
+                                                 message_id=sent.getType()))
+        callback.process(ack)
+        self.assertEquals(self.evm.ack_dropped,
+                          {(2, sent.getType()): MAX_ACK_QUEUE})
+        self.assertEquals(self.evm.waitForAck(sent), RESPONSE_NO_ERROR)
+        self.assertEquals(len(self.evm.ack[(1, sent.getType())]), 0)
+
+    def test_msg_mailbox(self):
+        callback = MsgCallback(self.evm)
+        for i in range(MAX_MSG_QUEUE + 3):
+            callback.process(ChannelBroadcastDataMessage(number=i % 8))
+        self.assertEquals(self.evm.msg_dropped,
+                          {ChannelBroadcastDataMessage: 3})
+        msg = self.evm.waitForMessage(ChannelMessage)
+        self.assertEquals(msg.getChannelNumber(), 3)
+
+    def test_read_error(self):
+        msg = ChannelBroadcastDataMessage(number=3)
+        self.driver.data.put(DriverError('Transient USB error.'))
+        self.driver.data.put(msg.encode())
+        received = self.evm.waitForMessage(ChannelMessage, timeout=1)
+        self.assertEquals(received.getChannelNumber(), 3)
+        self.assertEquals(self.evm.getStats()['read_errors'], 1)
+        self.assertTrue(self.evm.pump)
+
+    def test_read_errors_give_up(self):
+        future = self.evm.expectAck(ChannelAssignMessage(number=1))
+        for i in range(MAX_READ_ERRORS):
+            self.driver.data.put(DriverError('Stick unplugged.'))
+        self.assertRaises(DriverError, future.result, 2)
+        self.evm.pump_lock.acquire()
+        while self.evm.pump:
+            self.evm.pump_cond.wait(1)
+        self.evm.pump_lock.release()
+        self.evm.stop()
+        self.assertFalse(self.evm.pump)
+
+
+class DispatchTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = FakeDriver()
+        self.release = threading.Event()
+        self.seen = Queue.Queue()
+
+    def runMachine(self, policy):
+        evm = EventMachine(self.driver, queue_size=2, policy=policy)
+        callback = EventCallback()
+
+        def process(msg):
+            self.seen.put(msg.getChannelNumber())
+            self.release.wait()  # a consumer that is stuck
+        callback.process = process
+        evm.registerCallback(callback)
+        evm.start()
+        try:
+            for number in range(6):
+                msg = ChannelBroadcastDataMessage(number=number)
+                self.driver.data.put(msg.encode())
+                if number == 0:
+                    self.assertEquals(self.seen.get(timeout=1), 0)
+            # Mailboxes are filled by the reader, whatever the callbacks do
+            for number in range(6):
+                msg = evm.waitForMessage(ChannelBroadcastDataMessage, 1)
+                self.assertEquals(msg.getChannelNumber(), number)
+        finally:
+            self.release.set()
+            evm.stop()
+        seen = [0]
+        while not self.seen.empty():
+            seen.append(self.seen.get())
+        return evm.getStats(), seen
+
+    def test_drop_oldest(self):
+        stats, seen = self.runMachine(DispatchPolicy.DROP_OLDEST)
+        self.assertEquals(stats['received'], 6)
+        self.assertEquals(stats['dropped'], 3)
+        self.assertEquals(stats['dispatched'], 3)
+        self.assertEquals(seen, [0, 4, 5])
+
+    def test_drop_newest(self):
+        stats, seen = self.runMachine(DispatchPolicy.DROP_NEWEST)
+        self.assertEquals(stats['dropped'], 3)
+        self.assertEquals(seen, [0, 1, 2])
+
+
+class WriterTest(unittest.TestCase):
+    def test_priority_and_coalescing(self):
+        driver = FakeDriver()
+        writes = Queue.Queue()
+        release = threading.Event()
+
+        def write(data):
+            writes.put(data)
+            release.wait(1)  # hold the writer on its first write
+            return len(data)
+        driver.write = write
+        evm = EventMachine(driver)
+        evm.start()
+        try:
+            data = [ChannelBroadcastDataMessage(number=i).encode()
+                    for i in range(3)]
+            config = ChannelOpenMessage(number=1).encode()
+            evm.write(data[0])
+            self.assertEquals(writes.get(timeout=1), data[0])
+            evm.write(data[1])
+            evm.write(data[2])
+            evm.write(config, WritePriority.CONFIG)
+            release.set()
+            self.assertEquals(writes.get(timeout=1),
+                              config + data[1] + data[2])
+        finally:
+            release.set()
+            evm.stop()
+        stats = evm.getWriteStats()
+        self.assertEquals(stats['writes'], 2)
+        self.assertEquals(stats[WritePriority.DATA]['frames'], 3)
+        self.assertEquals(stats[WritePriority.CONFIG]['frames'], 1)
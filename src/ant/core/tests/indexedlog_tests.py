@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+LOG_LOCATION = '/tmp/python-ant.indexedlogtest.ant'
+LOG2_LOCATION = '/tmp/python-ant.indexedlogtest.ant2'
+
+import unittest
+
+from ant.core import log
+from ant.core.indexedlog import *
+from ant.core.message import *
+
+
+class IndexedLogTest(unittest.TestCase):
+    def setUp(self):
+        self.extended = Message(type_=MESSAGE_CHANNEL_BROADCAST_DATA,
+                                payload='\x02' + '\x03' * 8 +
+                                        '\x80\x34\x12\x78\x01').encode()
+        self.writer = IndexedLogWriter(LOG2_LOCATION, block_size=4)
+        for i in range(20):
+            timestamp = ((1000 + i) * 1000000, i)
+            frame = ChannelBroadcastDataMessage(number=i % 2).encode()
+            self.writer.logRead(frame, timestamp)
+            if i % 5 == 4:
+                self.writer.logRead(self.extended, timestamp)
+        self.writer.logWrite(ChannelOpenMessage(number=1).encode())
+
+    def test_query(self):
+        self.writer.close()
+        reader = IndexedLogReader(LOG2_LOCATION)
+        self.assertEquals(len(list(reader)), 25)
+        self.assertEquals(len(list(reader.query(channel=1))), 11)
+        self.assertEquals(len(list(reader.query(msg_id=0x4B))), 1)
+        self.assertEquals(len(list(reader.query(direction=log.EVENT_WRITE))),
+                          1)
+
+        records = list(reader.query(device_number=0x1234))
+        self.assertEquals(len(records), 4)
+        self.assertEquals(records[0].channel, 2)
+        self.assertEquals(records[0].device_type, 0x78)
+        self.assertEquals(records[0].frame, self.extended)
+
+        records = list(reader.query(start=1005, end=1006.5))
+        self.assertEquals([r.wall_us for r in records],
+                          [1005000000, 1006000000])
+
+    def test_block_summaries(self):
+        self.writer.close()
+        reader = IndexedLogReader(LOG2_LOCATION)
+        self.assertEquals(len(reader.summaries), 7)
+        blocks = []
+        reader._readBlock = lambda offset, read=reader._readBlock: \
+            blocks.append(offset) or read(offset)
+        list(reader.query(device_number=0x1234))
+        self.assertEquals(len(blocks), 4)
+
+    def test_no_footer(self):
+        # What a writer killed before close() leaves behind
+        self.writer._writeBlock()
+        self.writer.fd.flush()
+        reader = IndexedLogReader(LOG2_LOCATION)
+        self.assertEquals(len(list(reader)), 25)
+        self.assertEquals(len(reader.summaries), 7)
+
+    def test_convertLog(self):
+        self.writer.close()
+        v1 = log.LogWriter(LOG_LOCATION)
+        data = ''.join(record.frame
+                       for record in IndexedLogReader(LOG2_LOCATION))
+        for i in range(0, len(data), 7):  # chunks don't respect frames
+            v1.logRead(data[i:i + 7])
+        v1.close()
+
+        self.assertEquals(convertLog(LOG_LOCATION, LOG2_LOCATION), 25)
+        reader = IndexedLogReader(LOG2_LOCATION)
+        self.assertEquals(len(list(reader.query(device_number=0x1234))), 4)
+        self.assertRaises(IOError, log.LogReader, LOG2_LOCATION)
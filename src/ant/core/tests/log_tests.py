@@ -25,11 +25,24 @@
 
 LOG_LOCATION = '/tmp/python-ant.logtest.ant'
 
+import os
+import time
 import unittest
 
+import msgpack
+
+from ant.core import log
 from ant.core.log import *
 
 
+class FakeClock(object):
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
 class LogReaderTest(unittest.TestCase):
     def setUp(self):
         lw = LogWriter(LOG_LOCATION)
@@ -59,16 +72,16 @@ class LogReaderTest(unittest.TestCase):
         self.assertEquals(self.log.read(), None)
 
         self.assertEquals(t1[0], EVENT_OPEN)
-        self.assertTrue(isinstance(t1[1], int))
+        self.assertTrue(isinstance(t1[1], list))
         self.assertEquals(len(t1), 2)
 
         self.assertEquals(t2[0], EVENT_READ)
-        self.assertTrue(isinstance(t1[1], int))
+        self.assertTrue(isinstance(t1[1], list))
         self.assertEquals(len(t2), 3)
         self.assertEquals(t2[2], '\x01')
 
         self.assertEquals(t3[0], EVENT_WRITE)
-        self.assertTrue(isinstance(t1[1], int))
+        self.assertTrue(isinstance(t1[1], list))
         self.assertEquals(len(t3), 3)
         self.assertEquals(t3[2], '\x00')
 
@@ -76,9 +89,70 @@ class LogReaderTest(unittest.TestCase):
         self.assertEquals(t4[2], 'TEST')
 
         self.assertEquals(t5[0], EVENT_CLOSE)
-        self.assertTrue(isinstance(t1[1], int))
+        self.assertTrue(isinstance(t1[1], list))
         self.assertEquals(len(t5), 2)
 
+    def test_version(self):
+        self.assertEquals(self.log.version, VERSION_MICROSECONDS)
+
+    def test_version1(self):
+        packer = msgpack.Packer()
+        fd = open(LOG_LOCATION, 'wb')
+        fd.write(packer.pack([MAGIC, VERSION_SECONDS]))
+        for i in range(3):
+            fd.write(packer.pack([EVENT_READ, 1000 + i, chr(i)]))
+        fd.close()
+        os.remove(indexName(LOG_LOCATION))
+
+        lr = LogReader(LOG_LOCATION)
+        self.assertEquals(lr.version, VERSION_SECONDS)
+        lr.seekToTime(1001)
+        event = lr.read()
+        self.assertEquals(lr.eventTime(event), 1001)
+        self.assertEquals(event[2], '\x01')
+
+    def test_iter(self):
+        events = [event[0] for event in self.log]
+        self.assertEquals(events, [EVENT_OPEN, EVENT_READ, EVENT_WRITE,
+                                   EVENT_READ, EVENT_CLOSE])
+
+
+class LogSeekTest(unittest.TestCase):
+    def setUp(self):
+        clock = FakeClock(1000)
+        log.time, self.time = clock, log.time
+        try:
+            lw = LogWriter(LOG_LOCATION)
+            for i in range(600):  # one record every 10 s
+                clock.now = 1000 + i * 10
+                lw.logRead(chr(i % 256))
+            lw.close()
+        finally:
+            log.time = self.time
+
+    def test_index(self):
+        lr = LogReader(LOG_LOCATION)
+        lr.seekToTime(0)
+        self.assertEquals(eventTime(lr.read()), 1000)
+        self.assertEquals(len(lr._loadIndex()), 100)
+
+    def test_seekToTime(self):
+        lr = LogReader(LOG_LOCATION)
+        lr.seekToTime(3005)
+        event = lr.read()
+        self.assertEquals(eventTime(event), 3010)
+        self.assertEquals(event[2], chr(201))
+        lr.seekToTime(1500)
+        self.assertEquals(eventTime(lr.read()), 1500)
+        lr.seekToTime(7000)
+        self.assertEquals(lr.read(), None)
+
+    def test_seekToTime_unindexed(self):
+        os.remove(indexName(LOG_LOCATION))
+        lr = LogReader(LOG_LOCATION)
+        lr.seekToTime(3005)
+        self.assertEquals(eventTime(lr.read()), 3010)
+
 
 class LogWriterTest(unittest.TestCase):
     def setUp(self):
@@ -95,3 +169,70 @@ class LogWriterTest(unittest.TestCase):
         # Redundant, any error in log* methods will cause the LogReader test
         # suite to fail.
         pass
+
+    def test_timestamps(self):
+        self.log.logRead('\x01')
+        self.log.logRead('\x02')
+        self.log.close()
+        t1, t2 = LogReader(LOG_LOCATION)
+        wall, mono = t1[1]
+        self.assertTrue(abs(wall / 1000000.0 - time.time()) < 60)
+        self.assertTrue(t2[1][1] >= mono)
+
+    def test_batching(self):
+        self.log.close()
+        self.log = LogWriter(LOG_LOCATION, batch_size=1024,
+                             flush_interval=60)
+        self.log.logRead('\x01' * 100)
+        self.assertEquals(os.path.getsize(LOG_LOCATION), 0)
+        for i in range(10):
+            self.log.logRead('\x01' * 100)
+        self.assertTrue(os.path.getsize(LOG_LOCATION) > 1024)
+        self.log.close()
+        self.assertEquals(len(list(LogReader(LOG_LOCATION))), 11)
+
+    def test_idle_flush(self):
+        self.log.close()
+        self.log = LogWriter(LOG_LOCATION, flush_interval=0.1)
+        self.log.logRead('\x01' * 100)
+        self.assertEquals(os.path.getsize(LOG_LOCATION), 0)
+        time.sleep(0.5)
+        self.assertTrue(os.path.getsize(LOG_LOCATION) > 100)
+        self.log.close()
+
+    def test_rotation(self):
+        self.log.close()
+        self.log = LogWriter(LOG_LOCATION, max_size=1000)
+        for i in range(30):
+            self.log.logRead(chr(i) * 100)
+        self.log.close()
+        self.assertEquals(len(self.log.filenames), 4)
+        self.assertEquals(self.log.filenames[1],
+                          LOG_LOCATION[:-4] + '.1.ant')
+        events = []
+        for filename in self.log.filenames:
+            self.assertTrue(os.path.getsize(filename) < 1200)
+            events.extend(LogReader(filename))
+        self.assertEquals([event[2][0] for event in events],
+                          [chr(i) for i in range(30)])
+
+    def test_no_index(self):
+        self.log.close()
+        os.remove(indexName(LOG_LOCATION))
+        self.log = LogWriter(LOG_LOCATION, index=False)
+        self.log.logRead('\x01')
+        self.log.close()
+        self.assertFalse(os.path.exists(indexName(LOG_LOCATION)))
+        lr = LogReader(LOG_LOCATION)
+        lr.seekToTime(0)
+        self.assertEquals(lr.read()[2], '\x01')
+
+    def test_background(self):
+        self.log.close()
+        self.log = LogWriter(LOG_LOCATION, background=True)
+        for i in range(100):
+            self.log.logWrite(chr(i))
+        self.log.close()
+        events = list(LogReader(LOG_LOCATION))
+        self.assertEquals([event[2] for event in events],
+                          [chr(i) for i in range(100)])
@@ -25,6 +25,7 @@
 
 import unittest
 
+from ant.core import message
 from ant.core.message import *
 
 
@@ -38,6 +39,19 @@ class MessageTest(unittest.TestCase):
         self.message.setPayload('\x11' * 5)
         self.assertEquals(self.message.getPayload(), '\x11' * 5)
 
+    def test_getPayloadAsList(self):
+        self.message.setPayload('\x01\x02')
+        payload = self.message.getPayloadAsList()
+        self.assertEquals(payload, ['\x01', '\x02'])
+        payload[0] = '\x03'
+        self.assertEquals(self.message.getPayload(), '\x01\x02')
+
+    def test_truncatedExtendedData(self):
+        # The flag announces a channel ID the payload does not carry
+        raw = Message(type_=MESSAGE_CHANNEL_BROADCAST_DATA,
+                      payload='\x00' * 9 + '\x80').encode()
+        self.assertRaises(MessageError, Message().getHandler, raw)
+
     def test_get_setType(self):
         self.assertRaises(MessageError, self.message.setType, -1)
         self.assertRaises(MessageError, self.message.setType, 300)
@@ -84,6 +98,70 @@ class MessageTest(unittest.TestCase):
         self.assertRaises(MessageError, self.message.getHandler,
                           '\xA4\x05\x42\x00\x00\x00\x00')
 
+    def test_getHandler_extended(self):
+        raw = Message(type_=MESSAGE_CHANNEL_BROADCAST_DATA,
+                      payload='\x01' * 9).encode()
+        handler = self.message.getHandler(raw)
+        self.assertEquals(type(handler), ChannelBroadcastDataMessage)
+        self.assertEquals(handler.getChannelNumber(), 1)
+
+        raw = Message(type_=MESSAGE_CHANNEL_BROADCAST_DATA,
+                      payload='\x01' * 9 + '\x80\x34\x12\x78\x01').encode()
+        handler = self.message.getHandler(raw)
+        self.assertEquals(type(handler), ExtendedChannelBroadcastDataMessage)
+        self.assertEquals(handler.getDeviceNumber(), 0x1234)
+        self.assertEquals(handler.getDeviceType(), 0x78)
+        self.assertEquals(handler.getRssiValue(), None)
+
+    def test_slots(self):
+        for handlers in message._handlers.values():
+            for class_ in handlers.values():
+                msg = class_()
+                self.assertFalse(hasattr(msg, '__dict__'), class_.__name__)
+                self.assertTrue(isinstance(msg.payload, bytearray))
+
+    def test_registerMessage(self):
+        class CustomMessage(Message):
+            pass
+
+        raw = Message(type_=0xFE, payload='\x01\x02').encode()
+        self.assertRaises(MessageError, self.message.getHandler, raw)
+        registerMessage(0xFE, CustomMessage)
+        try:
+            handler = self.message.getHandler(raw)
+            self.assertTrue(isinstance(handler, CustomMessage))
+            self.assertEquals(handler.getPayload(), '\x01\x02')
+        finally:
+            del message._handlers[0xFE]
+        self.assertRaises(MessageError, registerMessage, 0x100, CustomMessage)
+
+
+class ChecksumTest(unittest.TestCase):
+    def test_computeChecksum(self):
+        self.assertEquals(computeChecksum('\xA4\x01\x4A\x00'), 0xEF)
+        self.assertEquals(computeChecksum(bytearray('\x4A\x00'), 0xA5), 0xEF)
+        self.assertEquals(computeChecksum(memoryview('\xA4\x01\x4A\x00')),
+                          0xEF)
+        self.assertEquals(computeChecksum('\xA4\x5B'), 0xFF)
+
+    def test_validateFrame(self):
+        frame = bytearray('\x00\xA4\x03\x42\x00\x00\x00\xE5')
+        self.assertEquals(validateFrame(frame, 1), 7)
+        self.assertEquals(validateFrame(str(frame), 1), 7)
+        self.assertEquals(validateFrame(frame, 0), FRAME_CORRUPT)
+        self.assertEquals(validateFrame(frame[:-1], 1), FRAME_INCOMPLETE)
+        self.assertEquals(validateFrame(frame, 8), FRAME_INCOMPLETE)
+        frame[-1] = 0xE6
+        self.assertEquals(validateFrame(frame, 1), FRAME_CORRUPT)
+        self.assertEquals(validateFrame(bytearray('\xA4\xFF\x42\x00'), 0),
+                          FRAME_CORRUPT)
+
+    def test_checksum_0xFF(self):
+        msg = Message(type_=0x5A, payload='\x00')
+        self.assertEquals(msg.getChecksum(), 0xFF)
+        self.assertEquals(msg.encode(), '\xA4\x01\x5A\x00\xFF')
+        self.assertEquals(Message().decode(msg.encode()), 5)
+
 
 class ChannelMessageTest(unittest.TestCase):
     def setUp(self):
@@ -272,8 +350,15 @@ class ChannelAcknowledgedDataMessageTest(unittest.TestCase):
 
 
 class ChannelBurstDataMessageTest(unittest.TestCase):
-    # No currently defined methods need testing
-    pass
+    def setUp(self):
+        self.message = ChannelBurstDataMessage(number=3)
+
+    def test_get_setSequenceCode(self):
+        self.message.setSequenceCode(0b101)
+        self.assertEquals(self.message.getSequenceCode(), 0b101)
+        self.message.setChannelNumber(4)
+        self.assertEquals(self.message.getSequenceCode(), 0b101)
+        self.assertEquals(self.message.getChannelNumber(), 4)
 
 
 class ChannelEventMessageTest(unittest.TestCase):
@@ -379,3 +464,63 @@ class SerialNumberMessageTest(unittest.TestCase):
     def test_payload(self):
         self.message.setSerialNumber('\x01\x02\x03\x04')
         self.assertEquals(self.message.getPayload(), '\x01\x02\x03\x04')
+
+
+class DecodeBatchTest(unittest.TestCase):
+    def test_data(self):
+        stream = ChannelBroadcastDataMessage(number=1, data='\x01' * 8).encode()
+        burst = ChannelBurstDataMessage(number=2, data='\x02' * 8)
+        burst.payload[0] = 2 | 0b011 << 5
+        stream += burst.encode()
+        records, consumed = decodeBatch(stream)
+        self.assertEquals(consumed, len(stream))
+        self.assertEquals(records[0],
+                          DataRecord(MESSAGE_CHANNEL_BROADCAST_DATA, 1, None,
+                                     '\x01' * 8, None, None, None, None, None))
+        self.assertEquals(records[1].channel, 2)
+        self.assertEquals(records[1].sequence, 0b011)
+
+    def test_extended(self):
+        raw = Message(type_=MESSAGE_CHANNEL_BROADCAST_DATA,
+                      payload='\x03' * 9 + '\xE0\x34\x12\x78\x01'
+                              '\x20\xC4\x00\x10\x27').encode()
+        (record,), consumed = decodeBatch(raw)
+        msg = Message().getHandler(raw)
+        self.assertEquals(record.data, msg.getRawData())
+        self.assertEquals(record.device_number, msg.getDeviceNumber())
+        self.assertEquals(record.device_type, 0x78)
+        self.assertEquals(record.transmission_type, 0x01)
+        self.assertEquals(record.rssi_value, 0xC4)
+        self.assertEquals(record.rx_timestamp, msg.getTimestamp())
+
+    def test_legacy(self):
+        msg = LegacyChannelBroadcastDataMessage()
+        msg.setChannelNumber(4)
+        msg.setDeviceNumber(0x1234)
+        msg.setDeviceType(0x78)
+        msg.setTransmissionType(0x01)
+        (record,), consumed = decodeBatch(msg.encode())
+        self.assertEquals(record.channel, 4)
+        self.assertEquals(record.device_number, 0x1234)
+        self.assertEquals(record.data, msg.getRawData())
+
+    def test_fallback(self):
+        event = ChannelEventMessage(number=2, message_code=0x07)
+        stream = '\x00' + event.encode() + '\xA4\x03\x42'
+        records, consumed = decodeBatch(stream)
+        self.assertEquals(consumed, len(stream) - 3)
+        self.assertEquals(len(records), 1)
+        self.assertTrue(isinstance(records[0], ChannelEventMessage))
+        self.assertEquals(records[0].getMessageCode(), 0x07)
+
+
+class BurstSequenceTest(unittest.TestCase):
+    def test_sequence(self):
+        seq = BurstSequence()
+        self.assertEquals([seq.next() for i in range(6)],
+                          [0b000, 0b001, 0b010, 0b011, 0b001, 0b010])
+        seq.finish()
+        self.assertEquals(seq.next(), 0b111)
+        seq.reset()
+        seq.finish()
+        self.assertEquals(seq.combine(3), 0b100 << 5 | 3)
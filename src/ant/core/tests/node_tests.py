@@ -23,8 +23,205 @@
 #
 ##############################################################################
 
+import Queue
 import unittest
 
 from ant.core.node import *
+from ant.core.message import Message, ChannelEventMessage
 
-#TODO
+
+class FakeStick(object):
+    """Driver stand-in that answers every command like an ANT stick."""
+    def __init__(self):
+        self.data = Queue.Queue()
+        self.written = []
+        self.codes = {}  # message type -> response code, None for silence
+
+    def read(self, count=None):
+        try:
+            return self.data.get(timeout=0.05)
+        except Queue.Empty:
+            return ''
+
+    def getWriteSize(self):
+        return 64
+
+    def write(self, data):
+        scanner = event.FrameScanner()
+        scanner.feed(data)
+        for frame in scanner:
+            self.respond(Message().getHandler(frame))
+        return len(data)
+
+    def respond(self, msg):
+        self.written.append(msg)
+        code = self.codes.get(msg.getType(), RESPONSE_NO_ERROR)
+        if code is None:
+            return
+        number = msg.getChannelNumber()
+        self.data.put(ChannelEventMessage(number=number,
+                                          message_id=msg.getType(),
+                                          message_code=code).encode())
+        if isinstance(msg, message.ChannelCloseMessage) and \
+           code == RESPONSE_NO_ERROR:
+            self.data.put(ChannelEventMessage(
+                number=number, message_id=MESSAGE_RF_EVENT,
+                message_code=EVENT_CHANNEL_CLOSED).encode())
+
+
+class ChannelTest(unittest.TestCase):
+    def setUp(self):
+        self.stick = FakeStick()
+        self.node = Node(self.stick)
+        self.node.networks = [NetworkKey('N:TEST')]
+        self.node.evm.start()
+        self.channel = Channel(self.node, 2)
+
+    def tearDown(self):
+        self.node.evm.stop()
+
+    def test_assign(self):
+        self.channel.assign('N:TEST', CHANNEL_TYPE_TWOWAY_RECEIVE, timeout=1)
+        self.assertFalse(self.channel.is_free)
+        self.assertEquals(self.stick.written[0].getChannelNumber(), 2)
+
+    def test_error(self):
+        self.stick.codes[MESSAGE_CHANNEL_PERIOD] = CHANNEL_IN_WRONG_STATE
+        self.assertRaises(ChannelError, self.channel.setPeriod, 8070, 1)
+
+    def test_timeout(self):
+        self.stick.codes[MESSAGE_CHANNEL_OPEN] = None
+        self.assertRaises(TimeoutError, self.channel.open, 0.1)
+        # The abandoned request must not swallow the next response
+        del self.stick.codes[MESSAGE_CHANNEL_OPEN]
+        self.channel.open(timeout=1)
+
+    def test_configure(self):
+        self.channel.configure('N:TEST', CHANNEL_TYPE_TWOWAY_RECEIVE,
+                               120, 0, 0, 8070, 57, timeout=1)
+        self.assertEquals([msg.getType() for msg in self.stick.written],
+                          [MESSAGE_CHANNEL_ASSIGN, MESSAGE_CHANNEL_ID,
+                           MESSAGE_CHANNEL_PERIOD, MESSAGE_CHANNEL_FREQUENCY])
+        self.assertFalse(self.channel.is_free)
+
+    def test_close(self):
+        future = self.channel.closeAsync()
+        self.assertEquals(future.result(1), None)
+        self.stick.codes[MESSAGE_CHANNEL_CLOSE] = CHANNEL_IN_WRONG_STATE
+        self.assertRaises(ChannelError, self.channel.close, 1)
+
+    def test_dispatch(self):
+        received = Queue.Queue()
+        callback = event.EventCallback()
+        callback.process = received.put
+        self.channel.registerCallback(callback)
+        other = Channel(self.node, 3)
+        self.assertTrue(self.node.evm.channels[3] is other)
+        for number in (3, 2, 3, 2):
+            msg = message.ChannelBroadcastDataMessage(number=number)
+            self.stick.data.put(msg.encode())
+        self.assertEquals(received.get(timeout=1).getChannelNumber(), 2)
+        self.assertEquals(received.get(timeout=1).getChannelNumber(), 2)
+
+
+class BurstStick(FakeStick):
+    """
+    Reports the outcome of every burst once its last packet arrives, taken
+    from outcomes (None for silence) or EVENT_TRANSFER_TX_COMPLETED.
+    """
+    def __init__(self):
+        FakeStick.__init__(self)
+        self.codes[MESSAGE_CHANNEL_BURST_DATA] = None
+        self.outcomes = []
+
+    def respond(self, msg):
+        FakeStick.respond(self, msg)
+        if isinstance(msg, message.ChannelBurstDataMessage) and \
+           msg.payload[0] & (message.BurstSequence.FINISH_VAL << 5):
+            code = EVENT_TRANSFER_TX_COMPLETED
+            if self.outcomes:
+                code = self.outcomes.pop(0)
+            if code is None:
+                return
+            self.data.put(ChannelEventMessage(
+                number=msg.getChannelNumber(), message_id=MESSAGE_RF_EVENT,
+                message_code=code).encode())
+
+
+class BurstTest(unittest.TestCase):
+    def setUp(self):
+        self.stick = BurstStick()
+        self.node = Node(self.stick)
+        self.node.evm.start()
+        self.channel = Channel(self.node, 2)
+
+    def tearDown(self):
+        self.node.evm.stop()
+
+    def test_burst(self):
+        stats = self.channel.burstSend('\x01' * 20, timeout=1)
+        self.assertEquals((stats.size, stats.packets, stats.retries),
+                          (20, 3, 0))
+        self.assertEquals([msg.payload[0] >> 5 for msg in self.stick.written],
+                          [0b000, 0b001, 0b110])
+        self.assertEquals([msg.getChannelNumber()
+                           for msg in self.stick.written], [2, 2, 2])
+        self.assertEquals(self.stick.written[-1].getRawData(),
+                          '\x01' * 4 + '\x00' * 4)
+
+    def test_retry(self):
+        self.stick.outcomes = [EVENT_TRANSFER_TX_FAILED]
+        stats = self.channel.burstSend('\x01' * 16, timeout=1)
+        self.assertEquals(stats.retries, 1)
+        self.assertEquals(len(self.stick.written), 4)
+
+    def test_failed(self):
+        self.stick.outcomes = [EVENT_TRANSFER_TX_FAILED] * 2
+        self.assertRaises(ChannelError, self.channel.burstSend, '\x01' * 8,
+                          1, 1)
+
+    def test_rejected(self):
+        self.stick.codes[MESSAGE_CHANNEL_BURST_DATA] = TRANSFER_IN_PROGRESS
+        self.stick.outcomes = [None]
+        future = self.channel.burstSendAsync('\x01' * 8, retries=0)
+        self.assertRaises(ChannelError, future.result, 1)
+
+
+class BurstAssemblerTest(unittest.TestCase):
+    def setUp(self):
+        self.received = []
+        self.assembler = BurstAssembler(self.received.append, size=8)
+
+    def feed(self, codes, number=1):
+        for i, code in enumerate(codes):
+            msg = message.ChannelBurstDataMessage(number=number,
+                                                  data=chr(i) * 8)
+            msg.setSequenceCode(code)
+            self.assembler.process(msg)
+
+    def test_transfer(self):
+        future = self.assembler.nextTransfer()
+        self.feed([0b000, 0b001, 0b010, 0b011, 0b001, 0b110])
+        data = ''.join(chr(i) * 8 for i in range(6))
+        self.assertEquals(future.result(0), data)
+        self.assertEquals(self.received, [data])
+        self.feed([0b100])
+        self.assertEquals(self.received[1], '\x00' * 8)
+        self.assertEquals(self.assembler.getStats()['transfers'], 2)
+
+    def test_gap(self):
+        future = self.assembler.nextTransfer()
+        self.feed([0b000, 0b010, 0b111])
+        self.assertRaises(ChannelError, future.result, 0)
+        self.assertEquals(self.received, [])
+        self.assertEquals(self.assembler.getStats()['gaps'], 1)
+
+    def test_rx_failed(self):
+        future = self.assembler.nextTransfer()
+        self.feed([0b000, 0b001])
+        self.assembler.process(ChannelEventMessage(
+            number=1, message_id=MESSAGE_RF_EVENT,
+            message_code=EVENT_TRANSFER_RX_FAILED))
+        self.assertRaises(ChannelError, future.result, 0)
+        self.feed([0b000, 0b101])
+        self.assertEquals(len(self.received), 1)
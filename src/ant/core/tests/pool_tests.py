@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import Queue
+import unittest
+
+from ant.core import event
+from ant.core import message
+from ant.core.constants import *
+from ant.core.exceptions import NodeError
+from ant.core.pool import *
+
+
+class PoolStick(object):
+    """Driver stand-in for a stick with the given number of channels."""
+    def __init__(self, channels):
+        self.channels = channels
+        self.data = Queue.Queue()
+        self.is_open = False
+
+    def isOpen(self):
+        return self.is_open
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def read(self, count=None):
+        try:
+            return self.data.get(timeout=0.05)
+        except Queue.Empty:
+            return ''
+
+    def getWriteSize(self):
+        return 64
+
+    def write(self, data):
+        scanner = event.FrameScanner()
+        scanner.feed(data)
+        for frame in scanner:
+            msg = message.Message().getHandler(frame)
+            if isinstance(msg, message.ChannelRequestMessage):
+                self.data.put(message.CapabilitiesMessage(
+                    max_channels=self.channels, max_nets=1).encode())
+            elif isinstance(msg, message.NetworkKeyMessage):
+                self.data.put(message.ChannelEventMessage(
+                    number=msg.getNumber(), message_id=msg.getType(),
+                    message_code=RESPONSE_NO_ERROR).encode())
+        return len(data)
+
+
+class NodePoolTest(unittest.TestCase):
+    def setUp(self):
+        self.sticks = [PoolStick(2), PoolStick(3)]
+        self.pool = NodePool(self.sticks)
+        self.pool.start()
+
+    def tearDown(self):
+        self.pool.stop(reset=False)
+
+    def test_capabilities(self):
+        self.assertEquals(self.pool.getCapabilities(), (5, 2))
+
+    def test_getFreeChannel(self):
+        channels = [self.pool.getFreeChannel() for i in range(4)]
+        self.assertEquals([channel.node for channel in channels],
+                          [self.pool.nodes[1], self.pool.nodes[0],
+                           self.pool.nodes[1], self.pool.nodes[0]])
+        self.assertEquals(len(set(channels)), 4)
+        self.pool.getFreeChannel()
+        self.assertRaises(NodeError, self.pool.getFreeChannel)
+        self.pool.releaseChannel(channels[0])
+        self.assertTrue(self.pool.getFreeChannel() is channels[0])
+
+    def test_dispatch(self):
+        received = Queue.Queue()
+
+        def listener(node, msg):
+            # Startup responses may still be on their way
+            if isinstance(msg, message.ChannelBroadcastDataMessage):
+                received.put(node)
+
+        self.pool.registerEventListener(listener)
+        for stick in self.sticks:
+            stick.data.put(message.ChannelBroadcastDataMessage(
+                number=1).encode())
+        nodes = set([received.get(timeout=1), received.get(timeout=1)])
+        self.assertEquals(nodes, set(self.pool.nodes))
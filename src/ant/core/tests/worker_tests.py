@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import Queue
+import time
+import unittest
+
+from ant.core import event
+from ant.core import message
+from ant.core.driver import Driver
+from ant.core.exceptions import DriverError
+from ant.core.worker import *
+
+
+class EchoDriver(Driver):
+    """Stick stand-in reading back whatever was written to it."""
+    def __init__(self):
+        Driver.__init__(self, None)
+        self.data = Queue.Queue()
+
+    def _open(self):
+        pass
+
+    def _close(self):
+        pass
+
+    def _read(self, count):
+        try:
+            return self.data.get(timeout=0.01)
+        except Queue.Empty:
+            return ''
+
+    def _write(self, data):
+        # Split the frame to check that the worker frames the stream
+        self.data.put(data[:3])
+        self.data.put(data[3:])
+        return len(data)
+
+
+class UnpluggedDriver(EchoDriver):
+    """Stick stand-in failing its first read."""
+    def _read(self, count):
+        raise DriverError('Stick unplugged.')
+
+
+class FlakyDriver(EchoDriver):
+    """Stick stand-in failing its first reads, then working."""
+    def __init__(self):
+        EchoDriver.__init__(self)
+        self.failures = 2
+
+    def _read(self, count):
+        if self.failures:
+            self.failures -= 1
+            raise DriverError('USB hiccup.')
+        return EchoDriver._read(self, count)
+
+
+class ReadOnlyDriver(EchoDriver):
+    """Stick stand-in failing every write."""
+    def _write(self, data):
+        raise DriverError('Write failed.')
+
+
+def failingDriver():
+    raise DriverError('No stick here.')
+
+
+class FrameRingTest(unittest.TestCase):
+    def test_push_pop(self):
+        ring = FrameRing(4)
+        self.assertEquals(ring.pop(), [])
+        self.assertFalse(ring.wait(0))
+        ring.push(['a', 'bb', 'ccc'])
+        self.assertTrue(ring.wait(0))
+        self.assertEquals(ring.pop(2), ['a', 'bb'])
+        ring.push(['dddd', 'e', 'f', 'g'])  # wraps, 'g' doesn't fit
+        self.assertEquals(ring.pop(), ['ccc', 'dddd', 'e', 'f'])
+        self.assertEquals(ring.getStats(),
+                          {'written': 6, 'read': 6, 'dropped': 1})
+
+    def test_fail(self):
+        ring = FrameRing(4)
+        self.assertEquals(ring.getError(), None)
+        ring.push(['a'])
+        ring.fail('Stick unplugged.')
+        self.assertTrue(ring.wait(0))
+        self.assertEquals(ring.getError(), 'Stick unplugged.')
+        self.assertEquals(ring.pop(), ['a'])
+
+    def test_size(self):
+        self.assertRaises(ValueError, FrameRing, 3)
+
+
+class ProcessDriverTest(unittest.TestCase):
+    def test_echo(self):
+        stick = ProcessDriver(EchoDriver)
+        stick.open()
+        try:
+            frame = message.ChannelBroadcastDataMessage(number=1).encode()
+            stick.write(frame + frame)
+            frames = []
+            deadline = time.time() + 5
+            while len(frames) < 2 and time.time() < deadline:
+                frames.extend(stick.readFrames())
+            self.assertEquals(frames, [frame, frame])
+        finally:
+            stick.close()
+        self.assertFalse(stick.process.is_alive())
+
+    def test_event_machine(self):
+        stick = ProcessDriver(EchoDriver)
+        stick.open()
+        evm = event.EventMachine(stick)
+        received = Queue.Queue()
+        callback = event.EventCallback()
+        callback.process = received.put
+        evm.registerCallback(callback)
+        evm.start()
+        try:
+            evm.write(message.ChannelBroadcastDataMessage(number=2).encode())
+            msg = received.get(timeout=5)
+            self.assertEquals(msg.getChannelNumber(), 2)
+        finally:
+            evm.stop()
+            stick.close()
+
+    def test_read_error(self):
+        stick = ProcessDriver(UnpluggedDriver)
+        stick.open()
+        try:
+            deadline = time.time() + 5
+            while time.time() < deadline:
+                try:
+                    stick.readFrames()
+                except DriverError, e:
+                    self.assertTrue('Stick unplugged.' in str(e))
+                    break
+            else:
+                self.fail('Worker failure not reported.')
+        finally:
+            stick.close()
+
+    def test_read_retry(self):
+        stick = ProcessDriver(FlakyDriver)
+        stick.open()
+        try:
+            frame = message.ChannelBroadcastDataMessage(number=1).encode()
+            stick.write(frame)
+            frames = []
+            deadline = time.time() + 5
+            while not frames and time.time() < deadline:
+                frames.extend(stick.readFrames())
+            self.assertEquals(frames, [frame])
+        finally:
+            stick.close()
+
+    def test_write_error(self):
+        stick = ProcessDriver(ReadOnlyDriver)
+        stick.open()
+        try:
+            self.assertRaises(DriverError, stick.write, '\xA4\x00')
+        finally:
+            stick.close()
+
+    def test_open_error(self):
+        stick = ProcessDriver(failingDriver)
+        self.assertRaises(DriverError, stick.open)
+        self.assertFalse(stick.isOpen())
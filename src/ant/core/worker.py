@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+"""
+Run a stick's driver in its own process. The worker reads the stick and
+frames its data; valid frames reach the parent through a shared memory
+ring of fixed-size slots, without pickling. ProcessDriver stands in for
+the driver on the parent side, so Node and Channel work unchanged:
+
+    stick = worker.ProcessDriver(functools.partial(driver.USB2Driver,
+                                                   SERIAL, number=1))
+    antnode = node.Node(stick)
+
+The worker takes the USB reads, the sync search and the checksums off the
+parent. Turning frames into Message objects (Message.getHandler()) stays
+in the parent's event pump: Node and Channel need those objects, and they
+cannot cross a process boundary without pickling. Each slot holds one
+checksummed frame, so that last step is cheap.
+"""
+
+import ctypes
+import multiprocessing
+import threading
+import time
+
+from ant.core import driver
+from ant.core.event import FrameScanner, MAX_READ_ERRORS, READ_RETRY_DELAY
+from ant.core.exceptions import DriverError
+
+# A length byte and the largest frame (MAX_MESSAGE_LENGTH + 4), rounded up
+SLOT_SIZE = 32
+RING_SLOTS = 4096
+START_TIMEOUT = 10.0  # seconds for the worker to open the stick
+WRITE_TIMEOUT = 5.0  # seconds for the worker to report a write
+
+ERROR_SIZE = 256  # bytes kept of the message of a failed worker
+
+_HEAD, _TAIL, _DROPPED, _FAILED = range(4)
+
+
+class FrameRing(object):
+    """
+    Ring of frames in memory shared with the processes forked after its
+    creation, for a single producer and a single consumer.
+
+    The producer only moves the head and the consumer only the tail, each
+    after touching the slots. Both go through a lock, taken once per batch,
+    which is also the memory barrier making the slots visible before the
+    index that publishes them, on any platform. Frames pushed while the
+    ring is full are dropped and counted. A failing producer leaves its
+    error in the ring (fail()) for the consumer to raise.
+    """
+    def __init__(self, slots=RING_SLOTS):
+        if slots <= 0 or slots & (slots - 1):
+            raise ValueError('Ring size must be a power of two.')
+        self.slots = slots
+        self.mask = slots - 1
+        self.buffer = multiprocessing.RawArray(ctypes.c_char,
+                                               slots * SLOT_SIZE)
+        self.counters = multiprocessing.RawArray(ctypes.c_ulonglong, 4)
+        self.error = multiprocessing.RawArray(ctypes.c_char, ERROR_SIZE)
+        self.lock = multiprocessing.Lock()
+        self.ready = multiprocessing.Event()
+
+    def push(self, frames):
+        """Producer side: append frames (str, up to SLOT_SIZE - 1 bytes)."""
+        counters = self.counters
+        self.lock.acquire()
+        head = counters[_HEAD]
+        tail = counters[_TAIL]
+        self.lock.release()
+        base = ctypes.addressof(self.buffer)
+        dropped = 0
+        for frame in frames:
+            if head - tail >= self.slots:
+                self.lock.acquire()
+                tail = counters[_TAIL]
+                self.lock.release()
+                if head - tail >= self.slots:
+                    dropped += 1
+                    continue
+            slot = base + (head & self.mask) * SLOT_SIZE
+            ctypes.memmove(slot, chr(len(frame)) + frame, len(frame) + 1)
+            head += 1
+        self.lock.acquire()
+        counters[_HEAD] = head
+        counters[_DROPPED] += dropped
+        self.lock.release()
+        self.ready.set()
+
+    def pop(self, limit=None):
+        """Consumer side: take up to limit (all) available frames."""
+        counters = self.counters
+        self.lock.acquire()
+        head = counters[_HEAD]
+        tail = counters[_TAIL]
+        self.lock.release()
+        if limit is not None:
+            head = min(head, tail + limit)
+        base = ctypes.addressof(self.buffer)
+        frames = []
+        while tail < head:
+            slot = ctypes.string_at(base + (tail & self.mask) * SLOT_SIZE,
+                                    SLOT_SIZE)
+            frames.append(slot[1:1 + ord(slot[0])])
+            tail += 1
+        self.lock.acquire()
+        counters[_TAIL] = tail
+        self.lock.release()
+        return frames
+
+    def wait(self, timeout=None):
+        """Consumer side: wait until frames are available."""
+        self.ready.clear()
+        if not self._available():
+            self.ready.wait(timeout)
+        return self._available()
+
+    def fail(self, error):
+        """Producer side: give up, leaving error for the consumer."""
+        self.error.value = error[:ERROR_SIZE - 1]
+        self.lock.acquire()
+        self.counters[_FAILED] = 1
+        self.lock.release()
+        self.ready.set()
+
+    def getError(self):
+        """Consumer side: the error of a failed producer, or None."""
+        self.lock.acquire()
+        failed = self.counters[_FAILED]
+        self.lock.release()
+        if failed:
+            return self.error.value or 'Worker failed.'
+        return None
+
+    def getStats(self):
+        counters = self.counters
+        self.lock.acquire()
+        stats = {'written': counters[_HEAD], 'read': counters[_TAIL],
+                 'dropped': counters[_DROPPED]}
+        self.lock.release()
+        return stats
+
+    def _available(self):
+        self.lock.acquire()
+        available = self.counters[_HEAD] != self.counters[_TAIL]
+        self.lock.release()
+        return available
+
+
+def _work(factory, ring, conn, stop):
+    try:
+        stick = factory()
+        stick.open()
+    except Exception, e:
+        conn.send(('error', str(e)))
+        return
+    conn.send(('ok', stick.getWriteSize()))
+
+    writer = threading.Thread(target=_write, args=(stick, conn))
+    writer.daemon = True
+    writer.start()
+
+    # Failed reads are retried like the event pump does
+    scanner = FrameScanner()
+    errors = 0
+    try:
+        while not stop.is_set():
+            try:
+                data = stick.read()
+            except DriverError:
+                errors += 1
+                if errors >= MAX_READ_ERRORS:
+                    raise
+                time.sleep(READ_RETRY_DELAY)
+                continue
+            errors = 0
+            if len(data) == 0:
+                continue
+            scanner.feed(data)
+            ring.push([frame.tobytes() for frame in scanner])
+    except Exception, e:
+        ring.fail(str(e) or e.__class__.__name__)
+    finally:
+        try:
+            stick.close()
+        except Exception:
+            pass
+
+
+def _write(stick, conn):
+    while True:
+        try:
+            data = conn.recv()
+        except EOFError:
+            break
+        if data is None:
+            break
+        try:
+            conn.send(('ok', stick.write(data)))
+        except DriverError, e:
+            conn.send(('error', str(e)))
+
+
+class ProcessDriver(driver.Driver):
+    """
+    Driver running factory() (a driver, opened and read in a worker
+    process) and handing its frames over through a FrameRing. The pump of
+    an event machine takes them with readFrames(), skipping the framing
+    already done by the worker. Writes are passed to the worker, which
+    reports back how they went. Once the worker has given up on the stick,
+    reads raise DriverError with its error.
+    """
+    def __init__(self, factory, log=None, debug=False, slots=RING_SLOTS,
+                 read_timeout=0.1):
+        driver.Driver.__init__(self, None, log, debug)
+        self.factory = factory
+        self.slots = slots
+        self.read_timeout = read_timeout  # seconds
+        self.ring = None
+        self.process = None
+        self.write_size = None
+
+    def _open(self):
+        self.ring = FrameRing(self.slots)
+        self.conn, conn = multiprocessing.Pipe()
+        self.stop = multiprocessing.Event()
+        self.process = multiprocessing.Process(
+            target=_work, args=(self.factory, self.ring, conn, self.stop))
+        self.process.daemon = True
+        self.process.start()
+
+        if not self.conn.poll(START_TIMEOUT):
+            self._close()
+            raise DriverError('Could not open device (worker not '
+                              'responding).')
+        status, value = self.conn.recv()
+        if status != 'ok':
+            self._close()
+            raise DriverError(value)
+        self.write_size = value
+
+    def _close(self):
+        self.stop.set()
+        try:
+            self.conn.send(None)
+        except (IOError, OSError):
+            pass
+        self.process.join(START_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+    def readFrames(self):
+        """Frames received since the last call, waiting up to read_timeout."""
+        self._read_lock.acquire()
+        try:
+            if not self.is_open:
+                raise DriverError("Could not read from device (not open).")
+            frames = self._pop(None)
+            if frames and self.log:
+                self.log.logRead(''.join(frames))
+        finally:
+            self._read_lock.release()
+        return frames
+
+    def getReadSize(self):
+        return self.slots * SLOT_SIZE
+
+    def getWriteSize(self):
+        return self.write_size or driver.Driver.getWriteSize(self)
+
+    def getStats(self):
+        return self.ring.getStats()
+
+    def _read(self, count):
+        return ''.join(self._pop(max(1, count // SLOT_SIZE)))
+
+    def _pop(self, limit):
+        frames = self.ring.pop(limit)
+        if not frames and self.ring.wait(self.read_timeout):
+            frames = self.ring.pop(limit)
+        if not frames:
+            error = self.ring.getError()
+            # Whatever the worker got before failing is delivered first
+            if error is not None:
+                frames = self.ring.pop(limit)
+                if not frames:
+                    raise DriverError('Could not read from device (%s).' %
+                                      error)
+        return frames
+
+    def _write(self, data):
+        try:
+            self.conn.send(data)
+            if not self.conn.poll(WRITE_TIMEOUT):
+                raise DriverError('Could not write to device (worker not '
+                                  'responding).')
+            status, value = self.conn.recv()
+        except (EOFError, IOError, OSError):
+            raise DriverError('Could not write to device (worker gone).')
+        if status != 'ok':
+            raise DriverError(value)
+        return value
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+"""
+ANT-FS host: link to a device found by its beacon, authenticate, then
+list, download, upload and erase its files over burst transfers.
+
+    channel.configure('N:ANT-FS', CHANNEL_TYPE_TWOWAY_RECEIVE, 0, 0, 0,
+                      client.SEARCH_PERIOD, client.SEARCH_FREQUENCY)
+    channel.open()
+    fs = client.Client(channel)
+    fs.link()
+    fs.authenticate()
+    for entry in fs.directory().entries:
+        fs.downloadFile(entry.index, '%d.fit' % entry.index)
+
+ANT-FS calls the device holding the files the client; this module is
+the host side of the protocol.
+"""
+
+import os
+import threading
+import time
+
+from ant.core import event
+from ant.core import message
+from ant.core import node
+from ant.core.constants import *
+from ant.core.exceptions import *
+from ant.fs import commands
+from ant.fs.commands import AuthResponse, ClientState, DownloadResponse, \
+                            UploadDataResponse
+
+SEARCH_FREQUENCY = 50  # 2450 MHz
+SEARCH_PERIOD = 4096  # 8 Hz
+LINK_FREQUENCY = 19
+LINK_PERIOD = 4  # beacon period code, 8 Hz
+HOST_SERIAL = 0x00000001
+BLOCK_SIZE = 8192
+COMMAND_TIMEOUT = 5.0
+RETRIES = 3
+READ_SIZE = 64 * 1024
+
+# Download responses worth asking again for, None being a lost or mangled
+# response
+_RETRY_CODES = (None, DownloadResponse.NOT_READY,
+                DownloadResponse.CRC_INCORRECT)
+
+
+def _result(future, timeout):
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        future.cancel()
+        raise
+
+
+class Client(event.EventCallback):
+    def __init__(self, channel, serial=HOST_SERIAL, timeout=COMMAND_TIMEOUT):
+        self.channel = channel
+        self.serial = serial
+        self.timeout = timeout
+        self.beacon = None
+        self.beacon_cond = threading.Condition()
+        self.assembler = node.BurstAssembler()
+        channel.registerCallback(self)
+
+    def process(self, msg):
+        if isinstance(msg, message.BurstChannelMixin) or \
+           isinstance(msg, message.ChannelEventMessage):
+            self.assembler.process(msg)
+        elif isinstance(msg, message.ChannelBroadcastDataMessage) or \
+             isinstance(msg, message.ChannelAcknowledgedDataMessage):
+            data = msg.getRawData()
+            if ord(data[0]) == commands.BEACON_ID:
+                self._setBeacon(data)
+
+    def waitForBeacon(self, state=None, timeout=None):
+        """Return the latest beacon once it reports state (any state)."""
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.time() + timeout
+        self.beacon_cond.acquire()
+        try:
+            while self.beacon is None or \
+                  (state is not None and self.beacon.state != state):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError('No ANT-FS beacon in the expected '
+                                       'state.')
+                self.beacon_cond.wait(remaining)
+            return self.beacon
+        finally:
+            self.beacon_cond.release()
+
+    def link(self, frequency=LINK_FREQUENCY, period=LINK_PERIOD,
+             timeout=None):
+        """
+        Ask the device in range to move to frequency and the beacon period
+        code period, follow it and return its authentication beacon.
+        """
+        self.waitForBeacon(ClientState.LINK, timeout)
+        self._send(commands.link(frequency, period, self.serial), timeout)
+        self.channel.setFrequency(frequency, timeout)
+        self.channel.setPeriod(commands.BEACON_PERIODS[period], timeout)
+        return self.waitForBeacon(ClientState.AUTHENTICATION, timeout)
+
+    def authenticate(self, type_=commands.AuthType.PASS_THROUGH,
+                     auth_string='', timeout=None):
+        """Return the AuthResult, raising FSError if it is a rejection."""
+        result = commands.parseAuthResponse(self._request(
+            commands.authenticate(type_, self.serial, auth_string), timeout))
+        if result.response == AuthResponse.REJECT:
+            raise FSError('Authentication rejected.', result.response)
+        return result
+
+    def ping(self, timeout=None):
+        self._send(commands.ping(), timeout)
+
+    def disconnect(self, type_=commands.DisconnectType.RETURN_TO_LINK,
+                   timeout=None):
+        self._send(commands.disconnect(type_), timeout)
+
+    def directory(self, timeout=None):
+        chunks = []
+        self.download(0, chunks.append, timeout=timeout)
+        return commands.parseDirectory(''.join(chunks))
+
+    def download(self, index, sink, offset=0, crc_seed=0x0000,
+                 block_size=BLOCK_SIZE, timeout=None, retries=RETRIES):
+        """
+        Download file index from offset, passing each block to sink(data)
+        while the request for the next one is already out.
+
+        A download is resumed with the offset and CRC (crc_seed) reached
+        so far. Lost, failed and corrupted blocks are requested again, up
+        to retries times in a row. Returns the file size and its CRC.
+        """
+        crc = crc_seed
+
+        def request():
+            return self._requestAsync(commands.download(
+                index, offset, crc, block_size, offset == 0), timeout)
+
+        transfer = request()
+        failures = 0
+        while True:
+            try:
+                block = commands.parseDownloadResponse(
+                    self._response(transfer, timeout))
+                if block.offset != offset:
+                    raise FSError('Download block out of order.')
+                block_crc = commands.crc16(block.data, crc)
+                if block_crc != block.crc:
+                    raise FSError('Download block CRC mismatch.',
+                                  DownloadResponse.CRC_INCORRECT)
+            except (TimeoutError, ChannelError, FSError), e:
+                if isinstance(e, FSError) and e.code not in _RETRY_CODES:
+                    raise
+                failures += 1
+                if failures > retries:
+                    raise
+                transfer = request()
+                continue
+
+            failures = 0
+            offset += len(block.data)
+            crc = block_crc
+            done = offset >= block.file_size or not block.data
+            if not done:
+                transfer = request()
+            if block.data:
+                sink(block.data)
+            if done:
+                return offset, crc
+
+    def downloadFile(self, index, filename, resume=True, **kwargs):
+        """
+        Download file index into filename. With resume, an existing file
+        is taken as the start of the download and only the rest is
+        fetched.
+        """
+        offset = 0
+        crc = 0x0000
+        if resume and os.path.exists(filename):
+            fd = open(filename, 'rb')
+            try:
+                chunk = fd.read(READ_SIZE)
+                while chunk:
+                    crc = commands.crc16(chunk, crc)
+                    offset += len(chunk)
+                    chunk = fd.read(READ_SIZE)
+            finally:
+                fd.close()
+
+        fd = open(filename, 'ab' if offset else 'wb')
+        try:
+            return self.download(index, fd.write, offset, crc, **kwargs)
+        finally:
+            fd.close()
+
+    def upload(self, index, data, resume=False, timeout=None,
+               retries=RETRIES):
+        """
+        Upload data as file index, in blocks the device accepts. With
+        resume the device's last offset is kept. Returns the bytes
+        written.
+        """
+        offset = 0xFFFFFFFF if resume else 0
+        info = commands.parseUploadResponse(self._request(
+            commands.upload(index, len(data), offset), timeout))
+        if len(data) > info.max_file_size:
+            raise FSError('File too large for the device.')
+        offset, crc = (info.last_offset, info.crc) if resume else (0, 0x0000)
+        block_size = info.max_block_size or len(data)
+
+        failures = 0
+        while offset < len(data):
+            block = data[offset:offset + block_size]
+            try:
+                response = commands.parseResponse(self._request(
+                    commands.uploadData(crc, offset, block), timeout),
+                    commands.UPLOAD_DATA)
+            except (TimeoutError, ChannelError):
+                failures += 1
+                if failures > retries:
+                    raise
+                continue
+            if response != UploadDataResponse.OK:
+                raise FSError('Upload failed.', response)
+            failures = 0
+            crc = commands.crc16(block, crc)
+            offset += len(block)
+        return offset
+
+    def erase(self, index, timeout=None):
+        response = commands.parseResponse(
+            self._request(commands.erase(index), timeout), commands.ERASE)
+        if response != commands.EraseResponse.OK:
+            raise FSError('Erase failed.', response)
+
+    def _setBeacon(self, data):
+        try:
+            beacon = commands.parseBeacon(data)
+        except FSError:
+            return
+        self.beacon_cond.acquire()
+        self.beacon = beacon
+        self.beacon_cond.notifyAll()
+        self.beacon_cond.release()
+
+    def _send(self, packet, timeout):
+        """
+        Send a command: single packets as acknowledged data, waiting for
+        the stick to report it delivered, longer ones as a burst. Returns
+        the burst's Future.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if len(packet) > 8:
+            return self.channel.burstSendAsync(packet)
+
+        evm = self.channel.node.evm
+        number = self.channel.number
+        completed = evm.expectEvent(number, EVENT_TRANSFER_TX_COMPLETED)
+        failed = evm.expectEvent(number, EVENT_TRANSFER_TX_FAILED)
+        failed.addDoneCallback(lambda failed: completed.setException(
+            FSError('Command not acknowledged.')))
+        try:
+            self.channel.send(
+                message.ChannelAcknowledgedDataMessage(data=packet))
+            _result(completed, timeout)
+        finally:
+            completed.cancel()
+            failed.cancel()
+
+    def _requestAsync(self, packet, timeout):
+        """Send a command and return a Future for the response burst."""
+        transfer = self.assembler.nextTransfer()
+        try:
+            sent = self._send(packet, timeout)
+        except:
+            transfer.cancel()
+            raise
+        if sent is not None:
+            def sentDone(sent):
+                try:
+                    sent.result()
+                except ANTException, e:
+                    transfer.setException(e)
+
+            sent.addDoneCallback(sentDone)
+            transfer.addDoneCallback(lambda transfer: sent.cancel())
+        return transfer
+
+    def _response(self, transfer, timeout):
+        """The response in a transfer, after the beacon leading it."""
+        if timeout is None:
+            timeout = self.timeout
+        data = _result(transfer, timeout)
+        self._setBeacon(str(data[:8]))
+        return data[8:]
+
+    def _request(self, packet, timeout):
+        return self._response(self._requestAsync(packet, timeout), timeout)
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+"""ANT-FS packets, CRC and directory format."""
+
+import collections
+import struct
+
+from ant.core.exceptions import FSError
+from ant.utils import enum
+
+BEACON_ID = 0x43
+COMMAND_ID = 0x44
+
+# Commands, answered with command | RESPONSE
+LINK = 0x02
+DISCONNECT = 0x03
+AUTHENTICATE = 0x04
+PING = 0x05
+DOWNLOAD = 0x09
+UPLOAD = 0x0A
+ERASE = 0x0B
+UPLOAD_DATA = 0x0C
+RESPONSE = 0x80
+
+ClientState = enum('LINK', 'AUTHENTICATION', 'TRANSPORT', 'BUSY')
+AuthType = enum('PASS_THROUGH', 'SERIAL', 'PAIRING', 'PASSKEY')
+AuthResponse = enum('NOT_AVAILABLE', 'ACCEPT', 'REJECT')
+DisconnectType = enum('RETURN_TO_LINK', 'RETURN_TO_BROADCAST')
+DownloadResponse = enum('OK', 'NOT_EXIST', 'NOT_READABLE', 'NOT_READY',
+                        'INVALID_REQUEST', 'CRC_INCORRECT')
+UploadResponse = enum('OK', 'NOT_EXIST', 'NOT_WRITEABLE', 'NOT_ENOUGH_SPACE',
+                      'INVALID_REQUEST', 'NOT_READY')
+UploadDataResponse = enum('OK', 'FAILED')
+EraseResponse = enum('OK', 'FAILED', 'NOT_READY')
+
+# Beacon channel periods (status byte 1, bits 0-2) in 1/32768 s counts
+BEACON_PERIODS = {0: 65535, 1: 32768, 2: 16384, 3: 8192, 4: 4096}
+
+# Directory entry general flags
+FILE_READ = 0x80
+FILE_WRITE = 0x40
+FILE_ERASE = 0x20
+FILE_ARCHIVE = 0x10
+FILE_APPEND = 0x08
+FILE_CRYPTO = 0x04
+
+# Directory dates count seconds from 1989-12-31 00:00 UTC
+EPOCH = 631065600
+
+Beacon = collections.namedtuple('Beacon', (
+    'data_available', 'upload_enabled', 'pairing_enabled', 'period',
+    'state', 'auth_type', 'device_type', 'manufacturer_id', 'host_serial'))
+AuthResult = collections.namedtuple('AuthResult', (
+    'response', 'serial', 'auth_string'))
+DownloadBlock = collections.namedtuple('DownloadBlock', (
+    'offset', 'file_size', 'data', 'crc'))
+UploadInfo = collections.namedtuple('UploadInfo', (
+    'last_offset', 'max_file_size', 'max_block_size', 'crc'))
+Directory = collections.namedtuple('Directory', (
+    'version', 'time_format', 'system_time', 'modified', 'entries'))
+DirectoryEntry = collections.namedtuple('DirectoryEntry', (
+    'index', 'data_type', 'sub_type', 'file_number', 'type_flags', 'flags',
+    'size', 'date'))
+
+_BEACON = struct.Struct('<BBBBHH')
+_BEACON_SERIAL = struct.Struct('<4xI')
+_COMMAND = struct.Struct('<BBBBI')
+_DOWNLOAD = struct.Struct('<BBHIxBHI')
+_UPLOAD = struct.Struct('<BBHI4xI')
+_ERASE = struct.Struct('<BBH4x')
+_UPLOAD_DATA = struct.Struct('<BBHI')
+_FOOTER = struct.Struct('<6xH')
+_RESPONSE = struct.Struct('<BBB')
+_AUTH_RESPONSE = struct.Struct('<BBBBI')
+_DOWNLOAD_RESPONSE = struct.Struct('<BBBxIII')
+_UPLOAD_RESPONSE = struct.Struct('<BBBxIII')
+_DIRECTORY = struct.Struct('<BBB5xII')
+_DIRECTORY_ENTRY = struct.Struct('<HBBHBBII')
+
+
+def _crcTable():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for bit in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+_CRC_TABLE = _crcTable()
+
+
+def crc16(data, seed=0x0000):
+    """ANT-FS CRC-16 of data, continuing from seed."""
+    crc = seed
+    table = _CRC_TABLE
+    for byte in bytearray(data):
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def pad(data):
+    """Zero pad data to a whole number of 8-byte packets."""
+    return data + '\x00' * (-len(data) % 8)
+
+
+# Host commands
+
+def link(frequency, period, serial):
+    return _COMMAND.pack(COMMAND_ID, LINK, frequency, period, serial)
+
+
+def disconnect(type_=DisconnectType.RETURN_TO_LINK):
+    return _COMMAND.pack(COMMAND_ID, DISCONNECT, type_, 0, 0)
+
+
+def authenticate(type_, serial, auth_string=''):
+    return _COMMAND.pack(COMMAND_ID, AUTHENTICATE, type_, len(auth_string),
+                         serial) + pad(auth_string)
+
+
+def ping():
+    return _COMMAND.pack(COMMAND_ID, PING, 0, 0, 0)
+
+
+def download(index, offset, crc_seed, max_block_size, initial):
+    return _DOWNLOAD.pack(COMMAND_ID, DOWNLOAD, index, offset, int(initial),
+                          crc_seed, max_block_size)
+
+
+def upload(index, max_size, offset):
+    return _UPLOAD.pack(COMMAND_ID, UPLOAD, index, max_size, offset)
+
+
+def erase(index):
+    return _ERASE.pack(COMMAND_ID, ERASE, index)
+
+
+def uploadData(crc_seed, offset, data):
+    return _UPLOAD_DATA.pack(COMMAND_ID, UPLOAD_DATA, crc_seed, offset) + \
+           pad(data) + _FOOTER.pack(crc16(data, crc_seed))
+
+
+# Client packets
+
+def parseBeacon(data):
+    id_, status1, status2, auth_type, device_type, manufacturer_id = \
+        _BEACON.unpack_from(data)
+    if id_ != BEACON_ID:
+        raise FSError('Not an ANT-FS beacon.')
+    state = status2 & 0x0F
+    host_serial = None
+    if state != ClientState.LINK:
+        host_serial = _BEACON_SERIAL.unpack_from(data)[0]
+        device_type = manufacturer_id = None
+    return Beacon(bool(status1 & 0x20), bool(status1 & 0x10),
+                  bool(status1 & 0x08), status1 & 0x07, state, auth_type,
+                  device_type, manufacturer_id, host_serial)
+
+
+def _checkResponse(data, command, length):
+    if len(data) < length:
+        raise FSError('Truncated ANT-FS response.')
+    id_, response = struct.unpack_from('<BB', data)
+    if id_ != COMMAND_ID or response != command | RESPONSE:
+        raise FSError('Unexpected ANT-FS response 0x%02x.' % response)
+
+
+def parseResponse(data, command):
+    """Response code of a plain (upload data, erase) response."""
+    _checkResponse(data, command, _RESPONSE.size)
+    return _RESPONSE.unpack_from(data)[2]
+
+
+def parseAuthResponse(data):
+    _checkResponse(data, AUTHENTICATE, _AUTH_RESPONSE.size)
+    id_, command, response, length, serial = _AUTH_RESPONSE.unpack_from(data)
+    start = _AUTH_RESPONSE.size
+    return AuthResult(response, serial, str(data[start:start + length]))
+
+
+def parseDownloadResponse(data):
+    """
+    The DownloadBlock of a download response, raising FSError (with the
+    DownloadResponse code) for refused requests.
+    """
+    _checkResponse(data, DOWNLOAD, _DOWNLOAD_RESPONSE.size)
+    id_, command, response, remaining, offset, file_size = \
+        _DOWNLOAD_RESPONSE.unpack_from(data)
+    if response != DownloadResponse.OK:
+        raise FSError('Download refused (response %d).' % response, response)
+    start = _DOWNLOAD_RESPONSE.size
+    if len(data) < start + remaining + _FOOTER.size:
+        raise FSError('Truncated ANT-FS download response.')
+    crc = _FOOTER.unpack_from(data, len(data) - _FOOTER.size)[0]
+    return DownloadBlock(offset, file_size,
+                         str(data[start:start + remaining]), crc)
+
+
+def parseUploadResponse(data):
+    _checkResponse(data, UPLOAD, _UPLOAD_RESPONSE.size + _FOOTER.size)
+    id_, command, response, last_offset, max_file_size, max_block_size = \
+        _UPLOAD_RESPONSE.unpack_from(data)
+    if response != UploadResponse.OK:
+        raise FSError('Upload refused (response %d).' % response, response)
+    crc = _FOOTER.unpack_from(data, _UPLOAD_RESPONSE.size)[0]
+    return UploadInfo(last_offset, max_file_size, max_block_size, crc)
+
+
+def parseDirectory(data):
+    version, length, time_format, system_time, modified = \
+        _DIRECTORY.unpack_from(data)
+    entries = []
+    for offset in xrange(_DIRECTORY.size,
+                         len(data) - _DIRECTORY_ENTRY.size + 1,
+                         _DIRECTORY_ENTRY.size):
+        entries.append(DirectoryEntry(
+            *_DIRECTORY_ENTRY.unpack_from(data, offset)))
+    return Directory(version, time_format, system_time, modified, entries)
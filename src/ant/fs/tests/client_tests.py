@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import os
+import Queue
+import shutil
+import struct
+import tempfile
+import unittest
+
+from ant.core import event
+from ant.core import message
+from ant.core.constants import *
+from ant.core.exceptions import FSError
+from ant.core.node import Node, Channel
+from ant.fs import commands
+from ant.fs.client import *
+from ant.fs.commands import ClientState, DownloadResponse, crc16, pad
+
+
+class FakeDevice(object):
+    """Driver stand-in for a stick linked to an ANT-FS device."""
+    def __init__(self, files):
+        self.data = Queue.Queue()
+        self.files = files
+        self.state = ClientState.LINK
+        self.burst = []
+        self.drop = 0  # download requests left unanswered
+        self.corrupt = 0  # download responses sent with a bad CRC
+        self.requests = []
+        self.upload = None
+
+    def read(self, count=None):
+        try:
+            return self.data.get(timeout=0.01)
+        except Queue.Empty:
+            return message.ChannelBroadcastDataMessage(
+                data=self.beacon()).encode()
+
+    def getWriteSize(self):
+        return 64
+
+    def write(self, data):
+        scanner = event.FrameScanner()
+        scanner.feed(data)
+        for frame in scanner:
+            self.receive(message.Message().getHandler(frame))
+        return len(data)
+
+    def beacon(self):
+        serial = HOST_SERIAL if self.state != ClientState.LINK else 0
+        return struct.pack('<BBBBI', commands.BEACON_ID, 0x24, self.state, 0,
+                           serial)
+
+    def event(self, code):
+        self.data.put(message.ChannelEventMessage(
+            message_id=MESSAGE_RF_EVENT, message_code=code).encode())
+
+    def respond(self, response):
+        data = self.beacon() + pad(response)
+        seq = message.BurstSequence()
+        for i in xrange(0, len(data), 8):
+            if i + 8 == len(data):
+                seq.finish()
+            msg = message.ChannelBurstDataMessage(data=data[i:i + 8])
+            msg.setSequenceCode(seq.next())
+            self.data.put(msg.encode())
+
+    def receive(self, msg):
+        if isinstance(msg, message.ChannelBurstDataMessage):
+            self.burst.append(msg.getRawData())
+            if msg.getSequenceCode() & message.BurstSequence.FINISH_VAL:
+                self.event(EVENT_TRANSFER_TX_COMPLETED)
+                packet, self.burst = ''.join(self.burst), []
+                self.command(packet)
+        elif isinstance(msg, message.ChannelAcknowledgedDataMessage):
+            self.event(EVENT_TRANSFER_TX_COMPLETED)
+            self.command(msg.getRawData())
+        else:
+            self.data.put(message.ChannelEventMessage(
+                number=msg.getChannelNumber(), message_id=msg.getType(),
+                message_code=RESPONSE_NO_ERROR).encode())
+
+    def command(self, packet):
+        command = ord(packet[1])
+        if command == commands.LINK:
+            self.state = ClientState.AUTHENTICATION
+        elif command == commands.AUTHENTICATE:
+            self.state = ClientState.TRANSPORT
+            self.respond(struct.pack('<BBBBI', commands.COMMAND_ID,
+                                     commands.AUTHENTICATE | commands.RESPONSE,
+                                     commands.AuthResponse.ACCEPT, 0, 0xABCD))
+        elif command == commands.DOWNLOAD:
+            self.download(*struct.unpack('<2xHIxBHI', packet[:16]))
+        elif command == commands.UPLOAD:
+            index, size = struct.unpack('<2xHI', packet[:8])
+            self.upload = (index, size)
+            data = self.files.get(index, '')
+            self.respond(struct.pack('<BBBxIII', commands.COMMAND_ID,
+                                     commands.UPLOAD | commands.RESPONSE,
+                                     commands.UploadResponse.OK, len(data),
+                                     1024, 16) +
+                         struct.pack('<6xH', crc16(data)))
+        elif command == commands.UPLOAD_DATA:
+            crc, offset = struct.unpack('<2xHI', packet[:8])
+            index, size = self.upload
+            data = packet[8:8 + min(16, size - offset)]
+            code = commands.UploadDataResponse.FAILED
+            if struct.unpack('<H', packet[-2:])[0] == crc16(data, crc):
+                code = commands.UploadDataResponse.OK
+                self.files[index] = self.files.get(index, '')[:offset] + data
+            self.respond(struct.pack('<BBB', commands.COMMAND_ID,
+                                     commands.UPLOAD_DATA | commands.RESPONSE,
+                                     code))
+
+    def download(self, index, offset, initial, crc, block_size):
+        self.requests.append((offset, crc, initial))
+        if self.drop:
+            self.drop -= 1
+            return
+        data = self.files.get(index)
+        if data is None:
+            self.respond(struct.pack('<BBBxIII', commands.COMMAND_ID,
+                                     commands.DOWNLOAD | commands.RESPONSE,
+                                     DownloadResponse.NOT_EXIST, 0, 0, 0))
+            return
+        block = data[offset:offset + block_size]
+        crc = crc16(block, crc)
+        if self.corrupt:
+            self.corrupt -= 1
+            crc ^= 0x0001
+        self.respond(struct.pack('<BBBxIII', commands.COMMAND_ID,
+                                 commands.DOWNLOAD | commands.RESPONSE,
+                                 DownloadResponse.OK, len(block), offset,
+                                 len(data)) +
+                     pad(block) + struct.pack('<6xH', crc))
+
+
+class ClientTest(unittest.TestCase):
+    def setUp(self):
+        self.data = ''.join(chr(i) for i in range(40))
+        self.device = FakeDevice({1: self.data})
+        self.node = Node(self.device)
+        self.node.evm.start()
+        self.client = Client(Channel(self.node, 0), timeout=1)
+
+    def tearDown(self):
+        self.node.evm.stop()
+
+    def test_link(self):
+        beacon = self.client.link()
+        self.assertEquals(beacon.state, ClientState.AUTHENTICATION)
+        self.assertEquals(beacon.host_serial, HOST_SERIAL)
+        self.assertEquals(self.client.authenticate().serial, 0xABCD)
+        self.assertEquals(self.client.beacon.state, ClientState.TRANSPORT)
+
+    def test_directory(self):
+        self.device.files[0] = struct.pack('<BBB5xII', 1, 16, 0, 0, 0) + \
+                               struct.pack('<HBBHBBII', 1, 0x80, 4, 0, 0,
+                                           commands.FILE_READ, 40, 0)
+        entries = self.client.directory().entries
+        self.assertEquals([(entry.index, entry.size) for entry in entries],
+                          [(1, 40)])
+
+    def test_download(self):
+        blocks = []
+        self.assertEquals(self.client.download(1, blocks.append,
+                                               block_size=16),
+                          (40, crc16(self.data)))
+        self.assertEquals(blocks, [self.data[:16], self.data[16:32],
+                                   self.data[32:]])
+        self.assertEquals(self.device.requests,
+                          [(0, 0, 1), (16, crc16(self.data[:16]), 0),
+                           (32, crc16(self.data[:32]), 0)])
+
+    def test_retry(self):
+        self.device.drop = 1
+        self.device.corrupt = 1
+        blocks = []
+        self.client.download(1, blocks.append, block_size=16, timeout=0.3)
+        self.assertEquals(''.join(blocks), self.data)
+        self.assertEquals(len(self.device.requests), 5)
+
+    def test_not_exist(self):
+        try:
+            self.client.download(2, None)
+            self.fail()
+        except FSError, e:
+            self.assertEquals(e.code, DownloadResponse.NOT_EXIST)
+
+    def test_resume(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, '1.fit')
+            fd = open(filename, 'wb')
+            fd.write(self.data[:20])
+            fd.close()
+            self.client.downloadFile(1, filename)
+            self.assertEquals(self.device.requests,
+                              [(20, crc16(self.data[:20]), 0)])
+            self.assertEquals(open(filename, 'rb').read(), self.data)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_upload(self):
+        self.assertEquals(self.client.upload(5, self.data), 40)
+        self.assertEquals(self.device.files[5], self.data)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import struct
+import unittest
+
+from ant.core.exceptions import FSError
+from ant.fs.commands import *
+
+
+class CRCTest(unittest.TestCase):
+    def test_crc16(self):
+        self.assertEquals(crc16('123456789'), 0xBB3D)
+        self.assertEquals(crc16('56789', crc16('1234')), 0xBB3D)
+        self.assertEquals(crc16(''), 0x0000)
+
+
+class PacketTest(unittest.TestCase):
+    def test_commands(self):
+        self.assertEquals(link(19, 4, 0x01020304),
+                          '\x44\x02\x13\x04\x04\x03\x02\x01')
+        self.assertEquals(len(authenticate(AuthType.PASSKEY, 1, 'secret!!x')),
+                          24)
+        self.assertEquals(download(3, 16, 0xBEEF, 1024, False),
+                          '\x44\x09\x03\x00\x10\x00\x00\x00'
+                          '\x00\x00\xEF\xBE\x00\x04\x00\x00')
+        packet = uploadData(0, 8, 'abc')
+        self.assertEquals(len(packet), 24)
+        self.assertEquals(struct.unpack('<H', packet[-2:])[0], crc16('abc'))
+
+    def test_beacon(self):
+        beacon = parseBeacon('\x43\x24\x00\x00\x34\x12\x01\x00')
+        self.assertEquals((beacon.data_available, beacon.period, beacon.state),
+                          (True, 4, ClientState.LINK))
+        self.assertEquals((beacon.device_type, beacon.manufacturer_id),
+                          (0x1234, 1))
+        beacon = parseBeacon('\x43\x04\x02\x00\x04\x03\x02\x01')
+        self.assertEquals(beacon.host_serial, 0x01020304)
+        self.assertRaises(FSError, parseBeacon, '\x44' * 8)
+
+    def test_download_response(self):
+        response = struct.pack('<BBBxIII', COMMAND_ID, DOWNLOAD | RESPONSE,
+                               DownloadResponse.OK, 3, 8, 11) + \
+                   pad('abc') + struct.pack('<6xH', 0x1234)
+        self.assertEquals(parseDownloadResponse(response),
+                          DownloadBlock(8, 11, 'abc', 0x1234))
+        response = struct.pack('<BBBxIII', COMMAND_ID, DOWNLOAD | RESPONSE,
+                               DownloadResponse.NOT_EXIST, 0, 0, 0)
+        try:
+            parseDownloadResponse(response)
+            self.fail()
+        except FSError, e:
+            self.assertEquals(e.code, DownloadResponse.NOT_EXIST)
+
+    def test_directory(self):
+        data = struct.pack('<BBB5xII', 1, 16, 0, 100, 200) + \
+               struct.pack('<HBBHBBII', 1, 0x80, 4, 7, 0, FILE_READ, 1000,
+                           300) + \
+               struct.pack('<HBBHBBII', 2, 0x80, 1, 0, 0, FILE_READ, 20, 0)
+        directory = parseDirectory(data)
+        self.assertEquals((directory.version, directory.system_time), (1, 100))
+        self.assertEquals(directory.entries[0],
+                          DirectoryEntry(1, 0x80, 4, 7, 0, FILE_READ, 1000,
+                                         300))
+        self.assertEquals(len(directory.entries), 2)
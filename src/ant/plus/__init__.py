@@ -23,4 +23,4 @@
 #
 ##############################################################################
 
-__all__ = []
+__all__ = ['decoders']
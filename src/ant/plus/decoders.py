@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import collections
+import math
+import struct
+
+from ant.core import event
+from ant.core.constants import *
+
+# ANT+ device types
+BIKE_POWER = 0x0B
+HEART_RATE = 0x78
+BIKE_SPEED_CADENCE = 0x79
+BIKE_CADENCE = 0x7A
+BIKE_SPEED = 0x7B
+STRIDE_SPEED_DISTANCE = 0x7C
+
+WHEEL_CIRCUMFERENCE = 2.096  # metres, a 700x23C tyre
+# Pages repeating the last event time before a speed or cadence drops to
+# zero: about 3 s at the 4 Hz message rate, as the profiles recommend
+STALE_PAGES = 12
+
+# Messages carrying the 8 data bytes of a page
+DATA_TYPES = frozenset((MESSAGE_CHANNEL_BROADCAST_DATA,
+                        MESSAGE_CHANNEL_ACKNOWLEDGED_DATA,
+                        MESSAGE_CHANNEL_BURST_DATA,
+                        MESSAGE_CHANNEL_EXTENDED_BROADCAST_DATA,
+                        MESSAGE_CHANNEL_EXTENDED_ACKNOWLEDGED_DATA,
+                        MESSAGE_CHANNEL_EXTENDED_BURST_DATA))
+
+PAGE_MASK = 0x7F
+TOGGLE_MASK = 0x80
+
+HeartRateSample = collections.namedtuple('HeartRateSample', (
+    'device_number', 'heart_rate', 'beats', 'beat_time', 'rr_interval'))
+SpeedCadenceSample = collections.namedtuple('SpeedCadenceSample', (
+    'device_number', 'speed', 'distance', 'cadence', 'crank_revolutions'))
+PowerSample = collections.namedtuple('PowerSample', (
+    'device_number', 'page', 'events', 'cadence', 'power', 'average_power',
+    'torque'))
+StrideSample = collections.namedtuple('StrideSample', (
+    'device_number', 'page', 'speed', 'distance', 'strides', 'cadence'))
+
+# Page layouts, compiled once. The page number byte is skipped.
+
+_PAGE = struct.Struct('B')
+_HR_COMMON = struct.Struct('<xxxxHBB')  # event time, beat count, rate
+_HR_PAGES = {
+    0x01: struct.Struct('<xHB'),  # cumulative operating time (24 bit, 2 s)
+    0x02: struct.Struct('<xBH'),  # manufacturer ID, serial number
+    0x03: struct.Struct('<xBBB'),  # hardware, software version, model
+    0x04: struct.Struct('<xxH'),  # previous heart beat event time
+}
+_SPEED_CADENCE = struct.Struct('<HHHH')  # cadence time, revs, speed time, revs
+_SPEED_OR_CADENCE = struct.Struct('<xxxxHH')  # event time, revolutions
+_POWER_PAGES = {
+    # event count, pedal power or crank/wheel ticks, cadence, then
+    # accumulated and instantaneous power or period and accumulated torque
+    0x10: struct.Struct('<xBBBHH'),
+    0x11: struct.Struct('<xBBBHH'),
+    0x12: struct.Struct('<xBBBHH'),
+}
+_STRIDE_PAGES = {
+    # time fraction and integer, distance integer, distance fraction and
+    # speed integer, speed fraction, stride count, latency
+    0x01: struct.Struct('<xBBBBBBB'),
+    # cadence integer, cadence fraction and speed integer, speed fraction,
+    # status
+    0x02: struct.Struct('<xxxBBBxB'),
+}
+
+
+def pageData(msg):
+    """The 8 data bytes of a channel data message, None for other messages."""
+    if msg.getType() not in DATA_TYPES:
+        return None
+    data = msg.getRawData()
+    if len(data) < 8:
+        return None
+    return data
+
+
+# Not an event.EventCallback: its instances have a __dict__, which would
+# defeat the __slots__ of the decoders. Anything with process() will do.
+class Decoder(object):
+    """
+    Rolling state of one ANT+ sensor.
+
+    Subclasses provide decode(data, offset=0), which takes the 8 data bytes
+    of a broadcast and returns a sample namedtuple, or None when the page
+    carries no measurement. As a channel callback the decoder passes the
+    samples of data messages to callback.
+    """
+    __slots__ = ('device_number', 'callback')
+    device_type = None
+
+    def __init__(self, device_number=None, callback=None):
+        self.device_number = device_number
+        self.callback = callback
+
+    def process(self, msg):
+        data = pageData(msg)
+        if data is None:
+            return
+        sample = self.decode(data)
+        if sample is not None and self.callback is not None:
+            self.callback(sample)
+
+
+class HeartRateDecoder(Decoder):
+    """
+    Heart rate monitor. Tracks the beat count and event time across their
+    8 and 16-bit rollovers; rr_interval is the last beat-to-beat time in
+    seconds when it is known. Pages are only told apart once the sensor
+    has flipped the page toggle bit, legacy straps never do.
+    """
+    __slots__ = ('beats', 'beat_time', 'last_count', 'last_time', 'toggle',
+                 'paged', 'operating_time', 'manufacturer_id',
+                 'serial_number', 'hardware_version', 'software_version',
+                 'model_number')
+    device_type = HEART_RATE
+
+    def __init__(self, device_number=None, callback=None):
+        Decoder.__init__(self, device_number, callback)
+        self.beats = 0
+        self.beat_time = 0.0
+        self.last_count = None
+        self.last_time = None
+        self.toggle = None
+        self.paged = False
+        self.operating_time = None
+        self.manufacturer_id = None
+        self.serial_number = None
+        self.hardware_version = None
+        self.software_version = None
+        self.model_number = None
+
+    def decode(self, data, offset=0):
+        time_, count, heart_rate = _HR_COMMON.unpack_from(data, offset)
+        page = _PAGE.unpack_from(data, offset)[0]
+        toggle = page & TOGGLE_MASK
+        if self.toggle is not None and toggle != self.toggle:
+            self.paged = True
+        self.toggle = toggle
+
+        previous_time = None
+        if self.paged:
+            page &= PAGE_MASK
+            layout = _HR_PAGES.get(page)
+            if layout is not None:
+                fields = layout.unpack_from(data, offset)
+                if page == 0x04:
+                    previous_time = fields[0]
+                elif page == 0x01:
+                    self.operating_time = (fields[0] | fields[1] << 16) * 2
+                elif page == 0x02:
+                    self.manufacturer_id, self.serial_number = fields
+                else:
+                    self.hardware_version, self.software_version, \
+                        self.model_number = fields
+
+        rr_interval = None
+        if self.last_count is not None:
+            beats = (count - self.last_count) & 0xFF
+            if beats:
+                self.beats += beats
+                self.beat_time += ((time_ - self.last_time) & 0xFFFF) / 1024.0
+                if previous_time is not None:
+                    rr_interval = ((time_ - previous_time) & 0xFFFF) / 1024.0
+                elif beats == 1:
+                    rr_interval = ((time_ - self.last_time) & 0xFFFF) / 1024.0
+        self.last_count = count
+        self.last_time = time_
+
+        return HeartRateSample(self.device_number, heart_rate, self.beats,
+                               self.beat_time, rr_interval)
+
+
+class _Revolutions(object):
+    """
+    Revolution rate (per second) and total from a time/count pair. The
+    rate drops to 0 once STALE_PAGES pages in a row bring no new event.
+    """
+    __slots__ = ('total', 'rate', 'last_time', 'last_count', 'stale')
+
+    def __init__(self):
+        self.total = 0
+        self.rate = None
+        self.last_time = None
+        self.last_count = None
+        self.stale = 0
+
+    def update(self, time_, count):
+        if self.last_time is not None:
+            elapsed = (time_ - self.last_time) & 0xFFFF
+            revolutions = (count - self.last_count) & 0xFFFF
+            self.total += revolutions
+            if elapsed:
+                self.rate = revolutions * 1024.0 / elapsed
+                self.stale = 0
+            else:
+                self.stale += 1
+                if self.stale >= STALE_PAGES and self.rate is not None:
+                    self.rate = 0.0
+        self.last_time = time_
+        self.last_count = count
+
+
+class BikeSpeedCadenceDecoder(Decoder):
+    """
+    Combined bike speed and cadence sensor. speed is in m/s and distance
+    in metres for the given wheel circumference, cadence in RPM.
+    """
+    __slots__ = ('wheel_circumference', 'wheel', 'crank')
+    device_type = BIKE_SPEED_CADENCE
+
+    def __init__(self, device_number=None, callback=None,
+                 wheel_circumference=WHEEL_CIRCUMFERENCE):
+        Decoder.__init__(self, device_number, callback)
+        self.wheel_circumference = wheel_circumference
+        self.wheel = _Revolutions()
+        self.crank = _Revolutions()
+
+    def decode(self, data, offset=0):
+        crank_time, crank_count, wheel_time, wheel_count = \
+            _SPEED_CADENCE.unpack_from(data, offset)
+        self.crank.update(crank_time, crank_count)
+        self.wheel.update(wheel_time, wheel_count)
+        return self._sample()
+
+    def _sample(self):
+        speed = cadence = None
+        if self.wheel.rate is not None:
+            speed = self.wheel.rate * self.wheel_circumference
+        if self.crank.rate is not None:
+            cadence = self.crank.rate * 60
+        return SpeedCadenceSample(self.device_number, speed,
+                                  self.wheel.total * self.wheel_circumference,
+                                  cadence, self.crank.total)
+
+
+class BikeSpeedDecoder(BikeSpeedCadenceDecoder):
+    """Bike speed sensor, reported like the combined sensor."""
+    __slots__ = ()
+    device_type = BIKE_SPEED
+
+    def decode(self, data, offset=0):
+        self.wheel.update(*_SPEED_OR_CADENCE.unpack_from(data, offset))
+        return self._sample()
+
+
+class BikeCadenceDecoder(BikeSpeedCadenceDecoder):
+    """Bike cadence sensor, reported like the combined sensor."""
+    __slots__ = ()
+    device_type = BIKE_CADENCE
+
+    def decode(self, data, offset=0):
+        self.crank.update(*_SPEED_OR_CADENCE.unpack_from(data, offset))
+        return self._sample()
+
+
+class BikePowerDecoder(Decoder):
+    """
+    Bike power meter: power-only (0x10), wheel torque (0x11) and crank
+    torque (0x12) pages. average_power (W) and torque (Nm) are averaged
+    over the events since the previous page of the same kind; power is the
+    instantaneous power of 0x10 pages, the average on torque pages.
+    """
+    __slots__ = ('events', 'last')
+    device_type = BIKE_POWER
+
+    def __init__(self, device_number=None, callback=None):
+        Decoder.__init__(self, device_number, callback)
+        self.events = {}  # page -> unwrapped event count
+        self.last = {}  # page -> previous fields
+
+    def decode(self, data, offset=0):
+        page = _PAGE.unpack_from(data, offset)[0]
+        layout = _POWER_PAGES.get(page)
+        if layout is None:
+            return None
+        fields = layout.unpack_from(data, offset)
+        count, ticks, cadence, accumulated, value = fields
+        if cadence == 0xFF:
+            cadence = None
+
+        last = self.last.get(page)
+        self.last[page] = fields
+        events = average_power = torque = None
+        power = value if page == 0x10 else None
+        if last is not None:
+            events = (count - last[0]) & 0xFF
+            self.events[page] = self.events.get(page, 0) + events
+            if events and page == 0x10:
+                average_power = ((accumulated - last[3]) & 0xFFFF) / \
+                                float(events)
+            elif events:
+                period = (accumulated - last[3]) & 0xFFFF
+                torque_sum = (value - last[4]) & 0xFFFF
+                torque = torque_sum / (32.0 * events)
+                if period:
+                    average_power = power = \
+                        128 * math.pi * torque_sum / period
+
+        return PowerSample(self.device_number, page, self.events.get(page, 0),
+                           cadence, power, average_power, torque)
+
+
+class StrideDecoder(Decoder):
+    """
+    Stride based speed and distance monitor (foot pod). distance (m) and
+    strides are unwrapped from their 8-bit rollovers, speed is in m/s and
+    cadence in strides per minute.
+    """
+    __slots__ = ('distance', 'strides', 'speed', 'cadence', 'last_distance',
+                 'last_strides')
+    device_type = STRIDE_SPEED_DISTANCE
+
+    def __init__(self, device_number=None, callback=None):
+        Decoder.__init__(self, device_number, callback)
+        self.distance = 0.0
+        self.strides = 0
+        self.speed = None
+        self.cadence = None
+        self.last_distance = None
+        self.last_strides = None
+
+    def decode(self, data, offset=0):
+        page = _PAGE.unpack_from(data, offset)[0]
+        layout = _STRIDE_PAGES.get(page)
+        if layout is None:
+            return None
+
+        if page == 0x01:
+            time_fraction, time_, distance, distance_speed, speed_fraction, \
+                strides, latency = layout.unpack_from(data, offset)
+            distance += (distance_speed >> 4) / 16.0
+            if self.last_distance is not None:
+                self.distance += (distance - self.last_distance) % 256
+                self.strides += (strides - self.last_strides) & 0xFF
+            self.last_distance = distance
+            self.last_strides = strides
+        else:
+            cadence, cadence_speed, speed_fraction, status = \
+                layout.unpack_from(data, offset)
+            self.cadence = cadence + (cadence_speed >> 4) / 16.0
+            distance_speed = cadence_speed
+        self.speed = (distance_speed & 0x0F) + speed_fraction / 256.0
+
+        return StrideSample(self.device_number, page, self.speed,
+                            self.distance, self.strides, self.cadence)
+
+
+DECODERS = {
+    HEART_RATE: HeartRateDecoder,
+    BIKE_SPEED_CADENCE: BikeSpeedCadenceDecoder,
+    BIKE_SPEED: BikeSpeedDecoder,
+    BIKE_CADENCE: BikeCadenceDecoder,
+    BIKE_POWER: BikePowerDecoder,
+    STRIDE_SPEED_DISTANCE: StrideDecoder,
+}
+
+
+class Gateway(event.EventCallback):
+    """
+    Decode the data of many sensors, keeping one decoder per device.
+
+    factories maps device types to callables building a decoder from a
+    device number (DECODERS by default). Messages need the channel ID of
+    their sender: extended data messages, or DataRecords from
+    message.decodeBatch() for a stick reporting it.
+    """
+    def __init__(self, factories=None, callback=None):
+        self.factories = DECODERS if factories is None else factories
+        self.callback = callback
+        self.decoders = {}
+
+    def decode(self, device_type, device_number, data, offset=0):
+        key = (device_type, device_number)
+        decoder = self.decoders.get(key)
+        if decoder is None:
+            factory = self.factories.get(device_type & 0x7F)
+            if factory is None:
+                return None
+            decoder = self.decoders[key] = factory(device_number)
+        return decoder.decode(data, offset)
+
+    def decodeRecord(self, record):
+        if record.device_type is None or len(record.data) < 8:
+            return None
+        return self.decode(record.device_type, record.device_number,
+                           record.data)
+
+    def process(self, msg):
+        data = pageData(msg)
+        if data is None:
+            return
+        try:
+            device_type = msg.getDeviceType()
+            device_number = msg.getDeviceNumber()
+        except AttributeError:
+            return
+        if device_type is None:
+            return
+        sample = self.decode(device_type, device_number, data)
+        if sample is not None and self.callback is not None:
+            self.callback(sample)
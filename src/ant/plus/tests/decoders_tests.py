@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import math
+import struct
+import unittest
+
+from ant.core import message
+from ant.plus.decoders import *
+
+
+def heartRatePage(page, time_, count, rate, extra='\x00\x00\x00'):
+    return chr(page) + extra + struct.pack('<HBB', time_, count, rate)
+
+
+class HeartRateDecoderTest(unittest.TestCase):
+    def setUp(self):
+        self.decoder = HeartRateDecoder(0x1234)
+
+    def test_beats(self):
+        self.assertEquals(self.decoder.decode(heartRatePage(0, 0xFC00, 0xFF,
+                                                            60)),
+                          HeartRateSample(0x1234, 60, 0, 0.0, None))
+        # Both counters roll over
+        sample = self.decoder.decode(heartRatePage(0, 0x0000, 0x00, 61))
+        self.assertEquals(sample.beats, 1)
+        self.assertEquals(sample.rr_interval, 1.0)
+        sample = self.decoder.decode(heartRatePage(0, 0x0800, 0x02, 62))
+        self.assertEquals((sample.beats, sample.beat_time), (3, 3.0))
+        self.assertEquals(sample.rr_interval, None)
+
+    def test_pages(self):
+        self.decoder.decode(heartRatePage(0x02, 0, 0, 60, '\x01\x34\x12'))
+        self.assertEquals(self.decoder.serial_number, None)  # legacy so far
+        self.decoder.decode(heartRatePage(0x82, 0, 0, 60, '\x01\x34\x12'))
+        self.assertEquals(self.decoder.manufacturer_id, 1)
+        self.assertEquals(self.decoder.serial_number, 0x1234)
+        sample = self.decoder.decode(heartRatePage(0x04, 0x0800, 2, 60,
+                                                   '\x00\x00\x06'))
+        self.assertEquals(sample.rr_interval, 0.5)
+
+
+class BikeSpeedCadenceDecoderTest(unittest.TestCase):
+    def test_rollover(self):
+        decoder = BikeSpeedCadenceDecoder(wheel_circumference=2.0)
+        decoder.decode(struct.pack('<HHHH', 0xFC00, 0xFFFF, 0xFE00, 0xFFFE))
+        sample = decoder.decode(struct.pack('<HHHH', 0x0000, 0x0000,
+                                            0x0200, 0x0002))
+        self.assertEquals(sample.cadence, 60.0)
+        self.assertEquals(sample.crank_revolutions, 1)
+        self.assertEquals(sample.speed, 8.0)
+        self.assertEquals(sample.distance, 8.0)
+
+    def test_speed(self):
+        decoder = BikeSpeedDecoder(wheel_circumference=2.0)
+        decoder.decode('\x00' * 4 + struct.pack('<HH', 0, 10))
+        sample = decoder.decode('\x80' + '\x00' * 3 +
+                                struct.pack('<HH', 1024, 12))
+        self.assertEquals((sample.speed, sample.cadence), (4.0, None))
+
+
+    def test_stopped(self):
+        decoder = BikeCadenceDecoder()
+        decoder.decode('\x00' * 4 + struct.pack('<HH', 0, 10))
+        page = '\x00' * 4 + struct.pack('<HH', 1024, 11)
+        for i in range(STALE_PAGES):
+            self.assertEquals(decoder.decode(page).cadence, 60.0)
+        self.assertEquals(decoder.decode(page).cadence, 0.0)
+
+    def test_slots(self):
+        self.assertFalse(hasattr(BikeSpeedDecoder(), '__dict__'))
+
+
+class BikePowerDecoderTest(unittest.TestCase):
+    def setUp(self):
+        self.decoder = BikePowerDecoder()
+
+    def test_power_only(self):
+        self.decoder.decode(struct.pack('<BBBBHH', 0x10, 0xFF, 0xFF, 90,
+                                        0xFFF0, 200))
+        sample = self.decoder.decode(struct.pack('<BBBBHH', 0x10, 0x01, 0xFF,
+                                                 0xFF, 0x0180, 210))
+        self.assertEquals(sample, PowerSample(None, 0x10, 2, None, 210,
+                                              200.0, None))
+
+    def test_crank_torque(self):
+        self.decoder.decode(struct.pack('<BBBBHH', 0x12, 0, 0, 90, 0, 0))
+        sample = self.decoder.decode(struct.pack('<BBBBHH', 0x12, 1, 1, 90,
+                                                 2048, 32 * 10))
+        self.assertEquals(sample.torque, 10.0)
+        self.assertAlmostEquals(sample.power, 20 * math.pi)
+
+    def test_unknown_page(self):
+        self.assertEquals(self.decoder.decode('\x01' + '\x00' * 7), None)
+
+
+class StrideDecoderTest(unittest.TestCase):
+    def test_pages(self):
+        decoder = StrideDecoder()
+        decoder.decode(struct.pack('<8B', 0x01, 0, 0, 250, 0x80, 0, 250, 0))
+        sample = decoder.decode(struct.pack('<8B', 0x01, 0, 0, 4, 0x03, 0x80,
+                                            4, 0))
+        self.assertEquals((sample.distance, sample.strides), (9.5, 10))
+        self.assertEquals(sample.speed, 3.5)
+        sample = decoder.decode(struct.pack('<8B', 0x02, 0, 0, 80, 0x82, 0,
+                                            0, 0))
+        self.assertEquals((sample.cadence, sample.speed), (80.5, 2.0))
+
+
+class GatewayTest(unittest.TestCase):
+    def test_decodeRecord(self):
+        gateway = Gateway()
+        raw = message.Message(type_=message.MESSAGE_CHANNEL_BROADCAST_DATA,
+                              payload='\x00' + heartRatePage(0, 0, 0, 70) +
+                                      '\x80\x34\x12\xF8\x01').encode()
+        (record,), consumed = message.decodeBatch(raw)
+        sample = gateway.decodeRecord(record)
+        self.assertEquals((sample.device_number, sample.heart_rate),
+                          (0x1234, 70))
+        self.assertTrue(gateway.decoders[(0xF8, 0x1234)] is not None)
+        self.assertEquals(gateway.decode(0x01, 1, '\x00' * 8), None)
+
+    def test_process(self):
+        samples = []
+        gateway = Gateway(callback=samples.append)
+        channel_id = message.ChannelIDMessage(number=1, device_number=0x1234,
+                                              device_type=HEART_RATE)
+        gateway.process(channel_id)
+        short = message.Message(type_=message.MESSAGE_CHANNEL_BROADCAST_DATA,
+                                payload='\x01\x00\x00')
+        gateway.process(short)
+        self.assertEquals(samples, [])
+        self.assertEquals(gateway.decoders, {})
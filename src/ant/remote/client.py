@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import socket
+
+from ant.core import driver
+from ant.core.exceptions import DriverError
+from ant.remote import protocol
+
+# Lets the event machine's writer batch a whole burst into one packet
+WRITE_SIZE = 4096
+
+
+class RemoteDriver(driver.Driver):
+    """
+    Driver for a stick shared by a remote Server, so a local Node and its
+    Channels run unchanged against it:
+
+        antnode = node.Node(client.RemoteDriver(('gateway', 9999)))
+
+    Frames travel in batches over one persistent connection. subscribe()
+    limits the data frames received to some channels.
+    """
+    def __init__(self, address, log=None, debug=False, read_timeout=0.1):
+        driver.Driver.__init__(self, address, log, debug)
+        self.read_timeout = read_timeout  # seconds
+        self.sock = None
+        self.reader = None
+
+    def subscribe(self, channels):
+        self._write_lock.acquire()
+        try:
+            self._send(protocol.SUBSCRIBE, ''.join(map(chr, channels)))
+        finally:
+            self._write_lock.release()
+
+    def unsubscribe(self, channels=()):
+        """Stop receiving data of channels, limiting nothing if none."""
+        self._write_lock.acquire()
+        try:
+            self._send(protocol.UNSUBSCRIBE, ''.join(map(chr, channels)))
+        finally:
+            self._write_lock.release()
+
+    def getReadSize(self):
+        return protocol.RECV_SIZE
+
+    def getWriteSize(self):
+        return WRITE_SIZE
+
+    def _open(self):
+        family = protocol.socketFamily(self.device)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(self.device)
+        except socket.error, e:
+            self.sock.close()
+            raise DriverError('Could not open device (%s).' % e)
+        if family == socket.AF_INET:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = protocol.PacketReader(self.sock)
+
+    def _close(self):
+        self.sock.close()
+
+    def _read(self, count):
+        # count is ignored: frames are only handed over whole
+        try:
+            packets = self.reader.read(self.read_timeout)
+        except EOFError, e:
+            raise DriverError('Could not read from device (%s).' % e)
+        return ''.join([body for kind, body in packets
+                        if kind == protocol.FRAMES])
+
+    def _write(self, data):
+        self._send(protocol.FRAMES, data)
+        return len(data)
+
+    def _send(self, kind, body):
+        if not self.is_open:
+            raise DriverError('Could not write to device (not open).')
+        try:
+            self.sock.sendall(protocol.packets(kind, body))
+        except socket.error, e:
+            raise DriverError('Could not write to device (%s).' % e)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+"""
+Wire format shared by the remote node server and its clients. Every
+packet is a kind byte and a 16-bit body length followed by the body:
+
+    FRAMES       encoded ANT frames, back to back
+    SUBSCRIBE    channel numbers, one byte each, whose data is wanted
+    UNSUBSCRIBE  channel numbers no longer wanted (none: all of them)
+"""
+
+import errno
+import select
+import socket
+import struct
+
+from ant.core.constants import *
+
+FRAMES = 0x01
+SUBSCRIBE = 0x02
+UNSUBSCRIBE = 0x03
+
+HEADER = struct.Struct('<BH')
+MAX_BODY = 0xFFFF
+RECV_SIZE = 64 * 1024
+
+# Frames only passed to the clients subscribed to their channel
+DATA_TYPES = frozenset((MESSAGE_CHANNEL_BROADCAST_DATA,
+                        MESSAGE_CHANNEL_ACKNOWLEDGED_DATA,
+                        MESSAGE_CHANNEL_BURST_DATA,
+                        MESSAGE_CHANNEL_EXTENDED_BROADCAST_DATA,
+                        MESSAGE_CHANNEL_EXTENDED_ACKNOWLEDGED_DATA,
+                        MESSAGE_CHANNEL_EXTENDED_BURST_DATA))
+BURST_TYPES = frozenset((MESSAGE_CHANNEL_BURST_DATA,
+                         MESSAGE_CHANNEL_EXTENDED_BURST_DATA))
+
+
+def packets(kind, body):
+    """Encode body as packets of kind, split where it exceeds MAX_BODY."""
+    if len(body) <= MAX_BODY:
+        return HEADER.pack(kind, len(body)) + body
+    chunks = []
+    for i in xrange(0, len(body), MAX_BODY):
+        chunk = body[i:i + MAX_BODY]
+        chunks.append(HEADER.pack(kind, len(chunk)))
+        chunks.append(chunk)
+    return ''.join(chunks)
+
+
+def frameChannel(frame):
+    """Channel of a data frame (str), None for other frames."""
+    type_ = ord(frame[2])
+    if type_ not in DATA_TYPES:
+        return None
+    channel = ord(frame[3])
+    if type_ in BURST_TYPES:
+        channel &= 0x1F
+    return channel
+
+
+def socketFamily(address):
+    """AF_UNIX for a path, AF_INET for a (host, port) pair."""
+    if isinstance(address, basestring):
+        return socket.AF_UNIX
+    return socket.AF_INET
+
+
+class PacketReader(object):
+    """Incremental reader of the packets arriving on a socket."""
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = ''
+
+    def read(self, timeout=None):
+        """
+        The packets received so far as (kind, body) pairs, after waiting
+        for data up to timeout seconds (forever if None). Raises EOFError
+        once the connection is closed.
+        """
+        try:
+            if timeout is not None and \
+               not select.select([self.sock], [], [], timeout)[0]:
+                return []
+            data = self.sock.recv(RECV_SIZE)
+        except (socket.error, select.error), e:
+            if e.args and e.args[0] == errno.EINTR:
+                return []
+            raise EOFError(str(e))
+        if not data:
+            raise EOFError('Connection closed.')
+
+        buffer_ = self.buffer + data if self.buffer else data
+        result = []
+        offset = 0
+        while len(buffer_) - offset >= HEADER.size:
+            kind, length = HEADER.unpack_from(buffer_, offset)
+            end = offset + HEADER.size + length
+            if end > len(buffer_):
+                break
+            result.append((kind, buffer_[offset + HEADER.size:end]))
+            offset = end
+        self.buffer = buffer_[offset:]
+        return result
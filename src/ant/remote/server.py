@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import os
+import Queue
+import socket
+import thread
+import threading
+import time
+
+from ant.core.constants import MESSAGE_SYSTEM_RESET
+from ant.core.event import FrameScanner, MAX_READ_ERRORS, READ_RETRY_DELAY
+from ant.core.exceptions import DriverError
+from ant.remote import protocol
+
+MAX_OUTBOX = 256  # packets queued for a client before dropping
+BACKLOG = 5
+CLOSE_POLL = 0.5  # seconds between checks for a closed connection
+
+
+class _Connection(object):
+    # One client: its socket, subscriptions and outgoing packets
+    def __init__(self, server, sock):
+        self.server = server
+        self.sock = sock
+        self.channels = None  # all channels until subscriptions are made
+        # Frames may straddle packets, see protocol.packets()
+        self.scanner = FrameScanner()
+        self.outbox = Queue.Queue(MAX_OUTBOX)
+        self.dropped = 0
+        self.closed = False
+        self.threads = []
+
+    def wants(self, frame):
+        channels = self.channels
+        if channels is None:
+            return True
+        channel = protocol.frameChannel(frame)
+        return channel is None or channel in channels
+
+    def push(self, frames):
+        try:
+            self.outbox.put_nowait(''.join(frames))
+        except Queue.Full:
+            self.dropped += 1
+
+    def send(self):
+        while not self.closed:
+            try:
+                bodies = [self.outbox.get(timeout=CLOSE_POLL)]
+            except Queue.Empty:
+                continue
+            # Catch up with whatever else has piled up meanwhile
+            try:
+                while True:
+                    bodies.append(self.outbox.get_nowait())
+            except Queue.Empty:
+                pass
+            try:
+                self.sock.sendall(protocol.packets(protocol.FRAMES,
+                                                   ''.join(bodies)))
+            except socket.error:
+                break
+        self.server._disconnect(self)
+
+    def receive(self):
+        reader = protocol.PacketReader(self.sock)
+        try:
+            while True:
+                for kind, body in reader.read():
+                    if kind == protocol.FRAMES:
+                        self.scanner.feed(body)
+                        self.server._write(self.scanner)
+                    elif kind == protocol.SUBSCRIBE:
+                        self.channels = (self.channels or
+                                         frozenset()).union(map(ord, body))
+                    elif kind == protocol.UNSUBSCRIBE:
+                        if body and self.channels is not None:
+                            self.channels = self.channels.difference(
+                                map(ord, body))
+                        else:
+                            self.channels = None
+        except (EOFError, DriverError):
+            pass
+        self.closed = True
+
+
+class Server(object):
+    """
+    Share an ANT stick with remote clients (see client.RemoteDriver) over
+    a TCP (address is a (host, port) pair) or Unix socket (a path).
+
+    Frames read from the stick are batched per read and pushed to every
+    client, data frames only to the clients subscribed to their channel.
+    Frames from clients are written to the stick in writes of up to its
+    write size. System resets from clients are dropped unless allow_reset,
+    so one client cannot close the channels of the others.
+    """
+    def __init__(self, driver, address, allow_reset=False):
+        self.driver = driver
+        self.address = address
+        self.allow_reset = allow_reset
+        self.connections = []
+        self.lock = thread.allocate_lock()
+        self.sock = None
+        self.running = False
+        self.threads = []
+        self.read_errors = 0
+
+    def start(self):
+        if not self.driver.isOpen():
+            self.driver.open()
+
+        family = protocol.socketFamily(self.address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX:
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+        else:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(self.address)
+        self.sock.listen(BACKLOG)
+        # Port 0 picks a free port
+        self.address = self.sock.getsockname()
+
+        self.running = True
+        self.threads = [threading.Thread(target=self._accept),
+                        threading.Thread(target=self._pump)]
+        for thread_ in self.threads:
+            thread_.daemon = True
+            thread_.start()
+
+    def stop(self):
+        self.running = False
+        # Wake the accepting thread up
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+        for thread_ in self.threads:
+            thread_.join()
+        for connection in self._closeConnections():
+            for thread_ in connection.threads:
+                thread_.join()
+        if protocol.socketFamily(self.address) == socket.AF_UNIX and \
+           os.path.exists(self.address):
+            os.unlink(self.address)
+        self.driver.close()
+
+    def getStats(self):
+        """
+        Number of clients, packets dropped for slow ones and failed reads
+        of the stick.
+        """
+        self.lock.acquire()
+        stats = {'clients': len(self.connections),
+                 'dropped': sum([c.dropped for c in self.connections]),
+                 'read_errors': self.read_errors}
+        self.lock.release()
+        return stats
+
+    def _accept(self):
+        while self.running:
+            try:
+                sock, address = self.sock.accept()
+            except socket.error:
+                continue
+            if protocol.socketFamily(self.address) == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = _Connection(self, sock)
+            self.lock.acquire()
+            self.connections = self.connections + [connection]
+            self.lock.release()
+            connection.threads = [threading.Thread(target=connection.receive),
+                                  threading.Thread(target=connection.send)]
+            for thread_ in connection.threads:
+                thread_.daemon = True
+                thread_.start()
+
+    def _closeConnections(self):
+        # Their threads notice and remove them
+        self.lock.acquire()
+        connections = list(self.connections)
+        self.lock.release()
+        for connection in connections:
+            connection.closed = True
+            try:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        return connections
+
+    def _disconnect(self, connection):
+        self.lock.acquire()
+        self.connections = [c for c in self.connections
+                            if c is not connection]
+        self.lock.release()
+        connection.sock.close()
+
+    def _pump(self):
+        # Failed reads are retried like the event pump does. Once the stick
+        # is given up on, the clients are disconnected and no more accepted.
+        scanner = FrameScanner()
+        errors = 0
+        try:
+            while self.running:
+                try:
+                    data = self.driver.read()
+                except DriverError, e:
+                    self.read_errors += 1
+                    errors += 1
+                    print e
+                    if errors >= MAX_READ_ERRORS:
+                        break
+                    time.sleep(READ_RETRY_DELAY)
+                    continue
+                errors = 0
+                if len(data) == 0:
+                    continue
+                scanner.feed(data)
+                frames = [frame.tobytes() for frame in scanner]
+                if not frames:
+                    continue
+                for connection in self.connections:
+                    selected = [frame for frame in frames
+                                if connection.wants(frame)]
+                    if selected:
+                        connection.push(selected)
+        finally:
+            if self.running:
+                self.running = False
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+                self._closeConnections()
+
+    def _write(self, frames):
+        size = self.driver.getWriteSize()
+        chunk = []
+        length = 0
+        for frame in frames:
+            if not self.allow_reset and frame[2] == chr(MESSAGE_SYSTEM_RESET):
+                continue
+            if chunk and length + len(frame) > size:
+                self.driver.write(''.join(chunk))
+                chunk = []
+                length = 0
+            chunk.append(frame.tobytes())
+            length += len(frame)
+        if chunk:
+            self.driver.write(''.join(chunk))
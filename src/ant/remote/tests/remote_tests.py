@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import os
+import Queue
+import shutil
+import tempfile
+import time
+import unittest
+
+from ant.core import event
+from ant.core import message
+from ant.core.constants import *
+from ant.core.exceptions import DriverError
+from ant.core.node import Node, Channel, NetworkKey
+from ant.remote import protocol
+from ant.remote.client import *
+from ant.remote.server import *
+
+
+class LoopStick(object):
+    """
+    Stick stand-in answering configuration commands and completing
+    bursts; frames put into data are read back.
+    """
+    def __init__(self):
+        self.data = Queue.Queue()
+        self.written = []
+        self.is_open = False
+
+    def isOpen(self):
+        return self.is_open
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def read(self, count=None):
+        try:
+            data = self.data.get(timeout=0.05)
+        except Queue.Empty:
+            return ''
+        if isinstance(data, Exception):
+            raise data
+        return data
+
+    def getWriteSize(self):
+        return 64
+
+    def write(self, data):
+        scanner = event.FrameScanner()
+        scanner.feed(data)
+        for frame in scanner:
+            msg = message.Message().getHandler(frame)
+            self.written.append(msg)
+            if isinstance(msg, message.ChannelBurstDataMessage):
+                if msg.getSequenceCode() & message.BurstSequence.FINISH_VAL:
+                    self.data.put(message.ChannelEventMessage(
+                        number=msg.getChannelNumber(),
+                        message_id=MESSAGE_RF_EVENT,
+                        message_code=EVENT_TRANSFER_TX_COMPLETED).encode())
+            elif isinstance(msg, message.ChannelAssignMessage):
+                self.data.put(message.ChannelEventMessage(
+                    number=msg.getChannelNumber(), message_id=msg.getType(),
+                    message_code=RESPONSE_NO_ERROR).encode())
+        return len(data)
+
+
+def readFrames(remote, count):
+    frames = []
+    scanner = event.FrameScanner()
+    for i in range(50):
+        scanner.feed(remote.read())
+        frames.extend(message.Message().getHandler(frame)
+                      for frame in scanner)
+        if len(frames) >= count:
+            break
+    return frames
+
+
+class ServerTest(unittest.TestCase):
+    address = ('127.0.0.1', 0)
+
+    def setUp(self):
+        self.stick = LoopStick()
+        self.server = Server(self.stick, self.address)
+        self.server.start()
+        self.remotes = []
+
+    def tearDown(self):
+        for remote in self.remotes:
+            if remote.isOpen():
+                remote.close()
+        self.server.stop()
+
+    def connect(self):
+        remote = RemoteDriver(self.server.address)
+        remote.open()
+        self.remotes.append(remote)
+        return remote
+
+    def test_node(self):
+        antnode = Node(self.connect())
+        antnode.networks = [NetworkKey('N:TEST')]
+        antnode.evm.start()
+        try:
+            channel = Channel(antnode, 1)
+            channel.assign('N:TEST', CHANNEL_TYPE_TWOWAY_TRANSMIT, timeout=2)
+            stats = channel.burstSend('\x01' * 1024, timeout=5)
+            self.assertEquals(stats.packets, 128)
+        finally:
+            antnode.evm.stop()
+        bursts = [msg for msg in self.stick.written
+                  if isinstance(msg, message.ChannelBurstDataMessage)]
+        self.assertEquals(len(bursts), 128)
+
+    def test_subscribe(self):
+        subscriber = self.connect()
+        subscriber.subscribe([1])
+        other = self.connect()
+        # Make sure the subscription has been received
+        subscriber.write(message.ChannelAssignMessage(number=7).encode())
+        self.assertEquals(readFrames(subscriber, 1)[0].getType(),
+                          MESSAGE_CHANNEL_EVENT)
+        readFrames(other, 1)
+
+        for number in (2, 1):
+            self.stick.data.put(message.ChannelBroadcastDataMessage(
+                number=number).encode())
+        self.assertEquals([msg.getChannelNumber()
+                           for msg in readFrames(subscriber, 1)], [1])
+        self.assertEquals([msg.getChannelNumber()
+                           for msg in readFrames(other, 2)], [2, 1])
+
+    def test_reset(self):
+        remote = self.connect()
+        remote.write(message.SystemResetMessage().encode() +
+                     message.ChannelAssignMessage(number=3).encode())
+        readFrames(remote, 1)
+        self.assertEquals([msg.getType() for msg in self.stick.written],
+                          [MESSAGE_CHANNEL_ASSIGN])
+
+    def test_split_frames(self):
+        remote = self.connect()
+        frame = message.ChannelBroadcastDataMessage(number=4).encode()
+        count = protocol.MAX_BODY // len(frame) + 100
+        # One FRAMES body too big for a packet, a frame straddles the split
+        self.assertTrue(protocol.MAX_BODY % len(frame))
+        remote.write(frame * count)
+        deadline = time.time() + 5
+        while len(self.stick.written) < count and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEquals(len(self.stick.written), count)
+
+    def test_read_error(self):
+        remote = self.connect()
+        for i in range(event.MAX_READ_ERRORS):
+            self.stick.data.put(DriverError('Stick unplugged.'))
+        deadline = time.time() + 5
+        try:
+            while time.time() < deadline:
+                remote.read()
+            self.fail('Client not disconnected.')
+        except DriverError:
+            pass
+        self.assertEquals(self.server.getStats()['read_errors'],
+                          event.MAX_READ_ERRORS)
+
+    def test_packets(self):
+        body = 'x' * (protocol.MAX_BODY + 10)
+        data = protocol.packets(protocol.FRAMES, body)
+        self.assertEquals(len(data), len(body) + 2 * protocol.HEADER.size)
+
+
+class UnixServerTest(ServerTest):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.address = os.path.join(self.directory, 'ant.sock')
+        ServerTest.setUp(self)
+
+    def tearDown(self):
+        ServerTest.tearDown(self)
+        self.assertFalse(os.path.exists(self.address))
+        shutil.rmtree(self.directory)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import ctypes
+import ctypes.util
+import sys
+import time
+
+# monotonic(): seconds from a clock that never goes backwards
+try:
+    from time import monotonic  # Python 3.3+
+except ImportError:
+    monotonic = None
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _clockGettime():
+    if not sys.platform.startswith('linux'):
+        return None
+    CLOCK_MONOTONIC = 1
+    for name in ('rt', 'c'):
+        path = ctypes.util.find_library(name)
+        if path is None:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+
+        def monotonic():
+            ts = _timespec()
+            if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, 'clock_gettime failed')
+            return ts.tv_sec + ts.tv_nsec * 1e-9
+        return monotonic
+
+
+if monotonic is None:
+    monotonic = _clockGettime()
+if monotonic is None:
+    # Not monotonic, but the best Python 2 has to offer on this platform
+    monotonic = time.time
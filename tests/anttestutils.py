@@ -25,7 +25,7 @@ def get_pack_args(data,sync = MESSAGE_TX_SYNC):
 def append_checksum(args):
     checksum = 0
     for i,arg in enumerate(args[1:],start =1):
-        checksum = ((checksum ^ arg))  % 0xFF
+        checksum = checksum ^ arg
     args.append(checksum)
     print args
     return args